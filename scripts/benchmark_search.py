@@ -0,0 +1,307 @@
+"""
+Card Search Benchmark
+Generates synthetic card catalogs in the real Series layout (one folder per
+category with metadata.json and insidenote.json, random clustered
+embeddings) at several sizes and measures every search backend on them:
+index load time, peak RSS, p50/p95/p99 query latency and recall@k against
+exact search. Each backend runs in its own process so peak RSS is not
+shared between measurements. Results are written as a JSON report that can
+be compared against a saved baseline to catch regressions.
+
+No embedding API calls are made: queries are perturbed card embeddings.
+
+Usage:
+    python scripts/benchmark_search.py --sizes 1000 10000 100000
+    python scripts/benchmark_search.py --sizes 1000000 --backends exact ivf int8 pq --dimension 768
+    python scripts/benchmark_search.py --sizes 10000 --baseline benchmark_report.json --max-regression 0.2
+
+Catalogs are kept in --workdir and reused when the size matches. At 768
+dimensions the JSON files take about 13 KB per card (13 GB at 1M cards).
+The HNSW build is pure Python (seconds per thousand cards), so by default
+hnsw is only measured up to HNSW_MAX_CARDS; name it in --backends to run it
+at any size.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from card_index import (CardIndex, BACKENDS, build_index, compile_index, open_searcher, find_cards,
+                        sample_queries, measure_recall)
+from search_profile import peak_rss_mb
+
+# Configuration
+BENCHMARK_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Benchmark"
+DEFAULT_SIZES = [1000, 10000, 100000]
+HNSW_MAX_CARDS = 20000  # Default runs skip hnsw above this (pure-Python build)
+CARDS_PER_FOLDER = 1000
+NUM_QUERIES = 200
+TOP_K = 10
+EMBEDDING_DIMENSION = 768
+
+OCCASIONS = ['Birthday', 'Christmas', 'Thank You', 'Graduation', 'Wedding', 'Anniversary', 'Sympathy',
+             'Get Well', 'New Baby', "Mother's Day", "Father's Day", 'Valentine', 'Thanksgiving']
+RECIPIENTS = ['Mom', 'Dad', 'Friend', 'Partner', 'Colleague', 'Grandparent', 'Child', 'Teacher', 'Anyone']
+EMOTIONS = ['Joyful', 'Warm', 'Funny', 'Heartfelt', 'Elegant', 'Playful', 'Comforting']
+STYLES = ['Floral', 'Watercolor', 'Minimal', 'Cartoon', 'Vintage', 'Modern', 'Hand-lettered']
+COLORS = ['red', 'pink', 'gold', 'green', 'blue', 'white', 'purple', 'orange', 'black']
+KEYWORDS = ['cake', 'balloons', 'flowers', 'snowman', 'stars', 'hearts', 'animals', 'confetti', 'gift',
+            'tree', 'candles', 'sunshine', 'coffee', 'music', 'books', 'travel', 'garden', 'ocean']
+
+
+def latency_percentiles(latencies_ms: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if latencies_ms else (0.0, 0.0, 0.0)
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3)}
+
+
+def generate_catalog(cards_directory: str, num_cards: int, dimension: int = EMBEDDING_DIMENSION,
+                     cards_per_folder: int = CARDS_PER_FOLDER, seed: int = 0):
+    """
+    Write num_cards synthetic cards as category folders with metadata.json
+    and insidenote.json, like the real Series folder. Embeddings are drawn
+    around random topic centroids so approximate backends see realistic
+    cluster structure. Odd folders use the {"cards": [...]} file format.
+    """
+    rng = np.random.default_rng(seed)
+    num_topics = max(1, min(256, num_cards // 50))
+    centroids = rng.standard_normal((num_topics, dimension)).astype(np.float32)
+
+    for folder_number, start in enumerate(range(0, num_cards, cards_per_folder)):
+        count = min(cards_per_folder, num_cards - start)
+        folder_name = f"Synthetic{folder_number:04d}"
+        folder = Path(cards_directory) / folder_name
+        folder.mkdir(parents=True, exist_ok=True)
+
+        topics = rng.integers(0, num_topics, count)
+        embeddings = centroids[topics] + 0.8 * rng.standard_normal((count, dimension)).astype(np.float32)
+        metadata, insidenotes = [], []
+        for i in range(count):
+            filename = f"{folder_name.lower()} ({i + 1}).png"
+            occasion = OCCASIONS[rng.integers(len(OCCASIONS))]
+            metadata.append({
+                'filename': filename,
+                'title': f"{occasion} card {start + i + 1}",
+                'description': f"A {STYLES[rng.integers(len(STYLES))].lower()} {occasion.lower()} card",
+                'occasion': occasion,
+                'emotion': EMOTIONS[rng.integers(len(EMOTIONS))],
+                'recipient': RECIPIENTS[rng.integers(len(RECIPIENTS))],
+                'style': STYLES[rng.integers(len(STYLES))],
+                'colors': [COLORS[c] for c in rng.choice(len(COLORS), 2, replace=False)],
+                'keywords': [KEYWORDS[k] for k in rng.choice(len(KEYWORDS), 3, replace=False)],
+                'visible_text': f"Happy {occasion}",
+            })
+            insidenotes.append({
+                'filename': filename,
+                'inside_note': f"Wishing you a wonderful {occasion.lower()}!",
+                'embedding': np.round(embeddings[i], 6).tolist(),
+            })
+
+        metadata_doc = {'cards': metadata} if folder_number % 2 else metadata
+        insidenote_doc = {'cards': insidenotes} if folder_number % 2 else insidenotes
+        with open(folder / "metadata.json", 'w', encoding='utf-8') as f:
+            json.dump(metadata_doc, f, ensure_ascii=False)
+        with open(folder / "insidenote.json", 'w', encoding='utf-8') as f:
+            json.dump(insidenote_doc, f, ensure_ascii=False)
+
+
+def prepare_catalog(workdir: str, num_cards: int, dimension: int) -> Dict:
+    """Generate (or reuse) the catalog and its search index for one size."""
+    cards_directory = str(Path(workdir) / f"cards_{num_cards}_{dimension}")
+    index_directory = str(Path(workdir) / f"index_{num_cards}_{dimension}")
+    info = {'cards_directory': cards_directory, 'index_directory': index_directory}
+
+    if not (CardIndex.exists(index_directory) and len(CardIndex.load(index_directory)) == num_cards):
+        start = time.perf_counter()
+        generate_catalog(cards_directory, num_cards, dimension)
+        info['generate_s'] = round(time.perf_counter() - start, 2)
+
+        start = time.perf_counter()
+        build_index(cards_directory, index_directory)
+        info['index_build_s'] = round(time.perf_counter() - start, 2)
+
+    info['catalog_mb'] = round(sum(f.stat().st_size for f in Path(cards_directory).rglob('*.json')) / 2**20, 1)
+    return info
+
+
+def measure_backend(index_directory: str, backend: str, num_queries: int = NUM_QUERIES,
+                    top_k: int = TOP_K) -> Dict:
+    """Load the index and backend in this process and time queries against it."""
+    start = time.perf_counter()
+    index = CardIndex.load(index_directory)
+    searcher = open_searcher(index, backend, index_directory)
+    load_s = time.perf_counter() - start
+
+    queries = sample_queries(index, num_queries, seed=1)
+    search_ms, end_to_end_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        searcher.search(query, top_k)
+        search_ms.append((time.perf_counter() - start) * 1000)
+
+        # What a CLI user waits for: search plus loading the result details
+        start = time.perf_counter()
+        find_cards(index, query, top_k, searcher=searcher)
+        end_to_end_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'load_s': round(load_s, 4),
+        'search': latency_percentiles(search_ms),
+        'end_to_end': latency_percentiles(end_to_end_ms),
+        'recall': round(measure_recall(index, searcher, queries, top_k), 4) if backend != 'exact' else 1.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_json_load(cards_directory: str) -> Dict:
+    """Time the no-index fallback: parse every insidenote.json into a matrix."""
+    start = time.perf_counter()
+    index = compile_index(cards_directory)
+    return {'load_s': round(time.perf_counter() - start, 3), 'cards': len(index), 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_isolated(args: List[str]) -> Dict:
+    """Run one measurement in a fresh interpreter and return its JSON result."""
+    command = [sys.executable, os.path.abspath(__file__), '_measure'] + args
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def prebuild_backend(index_directory: str, backend: str) -> Optional[float]:
+    """Build the backend's derived index outside the measured process. Returns build seconds."""
+    if backend == 'exact':
+        return None
+    index = CardIndex.load(index_directory)
+    start = time.perf_counter()
+    open_searcher(index, backend, index_directory)
+    return round(time.perf_counter() - start, 2)
+
+
+def run_benchmark(sizes: List[int], backends: Optional[List[str]], workdir: str,
+                  dimension: int = EMBEDDING_DIMENSION, num_queries: int = NUM_QUERIES, top_k: int = TOP_K) -> Dict:
+    """Benchmark each size; backends=None measures all of them, leaving hnsw out above HNSW_MAX_CARDS."""
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'cpus': os.cpu_count()},
+        'settings': {'dimension': dimension, 'queries': num_queries, 'top_k': top_k},
+        'sizes': [],
+    }
+
+    for num_cards in sizes:
+        print(f"\n📦 {num_cards} cards")
+        with contextlib.redirect_stdout(sys.stderr):
+            catalog = prepare_catalog(workdir, num_cards, dimension)
+        entry = {'cards': num_cards, 'catalog': catalog, 'json_load': run_isolated(
+            ['--cards-dir', catalog['cards_directory'], '--json-load']), 'backends': {}}
+        print(f"   JSON fallback load: {entry['json_load'].get('load_s')}s")
+
+        size_backends = backends or BACKENDS
+        if backends is None and num_cards > HNSW_MAX_CARDS:
+            size_backends = [backend for backend in BACKENDS if backend != 'hnsw']
+            print(f"   hnsw   skipped: pure-Python build is too slow above {HNSW_MAX_CARDS} cards "
+                  f"(pass --backends hnsw to run it)")
+
+        for backend in size_backends:
+            try:
+                with contextlib.redirect_stdout(sys.stderr):
+                    build_s = prebuild_backend(catalog['index_directory'], backend)
+            except Exception as e:
+                entry['backends'][backend] = {'error': f"build failed: {e}"}
+                print(f"   {backend:6s} ❌ build failed: {e}")
+                continue
+            result = run_isolated(['--index-dir', catalog['index_directory'], '--backend', backend,
+                                   '--queries', str(num_queries), '--top-k', str(top_k)])
+            if build_s is not None:
+                result['build_s'] = build_s
+            entry['backends'][backend] = result
+            if 'error' in result:
+                print(f"   {backend:6s} ❌ {result['error']}")
+            else:
+                print(f"   {backend:6s} load {result['load_s']:.3f}s  p50 {result['search']['p50_ms']:.2f}ms  "
+                      f"p95 {result['search']['p95_ms']:.2f}ms  p99 {result['search']['p99_ms']:.2f}ms  "
+                      f"recall {result['recall']:.3f}  peak RSS {result['peak_rss_mb']} MB")
+        report['sizes'].append(entry)
+    return report
+
+
+def compare_reports(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """p95 end-to-end latency or peak RSS regressions beyond max_regression (fraction) vs baseline."""
+    previous = {(e['cards'], b): r for e in baseline.get('sizes', []) for b, r in e['backends'].items()}
+    failures = []
+    for entry in report['sizes']:
+        for backend, result in entry['backends'].items():
+            old = previous.get((entry['cards'], backend))
+            if not old or 'error' in old or 'error' in result:
+                continue
+            for metric, new_value, old_value in (
+                    ('p95 latency', result['end_to_end']['p95_ms'], old['end_to_end']['p95_ms']),
+                    ('peak RSS', result['peak_rss_mb'], old['peak_rss_mb'])):
+                if old_value > 0 and new_value > old_value * (1 + max_regression):
+                    failures.append(f"{entry['cards']} cards / {backend}: {metric} {old_value} -> {new_value}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark card search on synthetic catalogs")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Catalog sizes in cards')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS,
+                        help=f'Backends to measure (default: all, without hnsw above {HNSW_MAX_CARDS} cards)')
+    parser.add_argument('--workdir', default=BENCHMARK_DIRECTORY, help='Where synthetic catalogs and indexes are kept')
+    parser.add_argument('--dimension', type=int, default=EMBEDDING_DIMENSION, help='Embedding dimension')
+    parser.add_argument('--queries', type=int, default=NUM_QUERIES, help='Queries per backend')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help='Results per query (and k for recall@k)')
+    parser.add_argument('--output', default='benchmark_report.json', help='JSON report path')
+    parser.add_argument('--baseline', help='Previous report; exit with status 1 on regressions')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed p95 latency / peak RSS growth vs the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.backends, args.workdir, args.dimension, args.queries, args.top_k)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            failures = compare_reports(report, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f"❌ Regression: {failure}")
+        if failures:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+def measure_main():
+    """Entry point for the isolated measurement processes."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index-dir')
+    parser.add_argument('--cards-dir')
+    parser.add_argument('--backend', default='exact')
+    parser.add_argument('--json-load', action='store_true')
+    parser.add_argument('--queries', type=int, default=NUM_QUERIES)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    args = parser.parse_args(sys.argv[2:])
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.json_load:
+            result = measure_json_load(args.cards_dir)
+        else:
+            result = measure_backend(args.index_dir, args.backend, args.queries, args.top_k)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '_measure':
+        measure_main()
+    else:
+        main()
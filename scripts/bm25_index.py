@@ -0,0 +1,341 @@
+"""
+BM25 Keyword Index for Card Search
+Inverted index over the same card fields create_embedding_text() in
+generate_embeddings.py feeds to the embedding model (title, description,
+occasion, emotion, recipient, visible text, inside note, keywords, style,
+colors), with rows aligned to the card search index.
+
+Search modes used by search_cards.py, quick_search.py and search_server.py:
+    semantic - embedding search only
+    hybrid   - BM25 and embedding rankings merged with reciprocal-rank fusion
+               (scores are the fused scores, best = 1); a query in double
+               quotes ("happy retirement") is treated as an exact phrase and
+               answered lexically, without an embedding call
+    lexical  - BM25 only, never calls the embedding API
+
+Usage:
+    python scripts/bm25_index.py build
+    python scripts/bm25_index.py search "snowman christmas" --top-k 5
+    python scripts/bm25_index.py search "\"happy birthday\""
+"""
+import re
+import json
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_index import (CardIndex, INDEX_DIRECTORY, select_top_k, load_card_details, load_card_records,
+                        rank_cards, newest_card_file_mtime)
+from diversity import diversified
+from search_profile import stage
+
+# Configuration
+BM25_FILE = "bm25.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal-rank fusion constant
+FUSION_DEPTH = 100  # Candidates taken from each ranking before fusion
+SEARCH_MODES = ['hybrid', 'semantic', 'lexical']
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'to', 'with', 'card', 'cards',
+}
+
+
+def tokenize(text: str, keep_stopwords: bool = False) -> List[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return tokens if keep_stopwords else [t for t in tokens if t not in STOPWORDS]
+
+
+def document_text(metadata: Dict, inside_note: str) -> str:
+    """The searchable text of a card: the fields create_embedding_text() uses."""
+    parts = [str(metadata.get(field, '') or '') for field in
+             ('title', 'description', 'occasion', 'emotion', 'recipient', 'visible_text')]
+    parts.append(inside_note or '')
+    keywords = metadata.get('keywords') or ''
+    parts.append(', '.join(keywords) if isinstance(keywords, list) else str(keywords))
+    parts.append(str(metadata.get('style', '') or ''))
+    colors = metadata.get('colors') or ''
+    parts.append(', '.join(colors) if isinstance(colors, list) else str(colors))
+    return '\n'.join(p for p in parts if p)
+
+
+def load_documents(index: CardIndex, rows: Optional[List[int]] = None) -> Dict[int, str]:
+    """Searchable text for the given rows (all rows by default)."""
+    rows = list(range(len(index))) if rows is None else list(rows)
+    return {row: document_text(record, record.get('inside_note', ''))
+            for row, record in zip(rows, load_card_records(index, rows))}
+
+
+def is_phrase_query(query: str) -> bool:
+    query = query.strip()
+    return len(query) > 2 and query.startswith('"') and query.endswith('"')
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Merge several best-first rankings: score(row) = sum of 1 / (k + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (row, _) in enumerate(ranking, 1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Term -> (row, term frequency) posting lists in CSR layout plus document lengths."""
+
+    def __init__(self, index: CardIndex, vocabulary: Dict[str, int], offsets: np.ndarray,
+                 postings: np.ndarray, frequencies: np.ndarray, doc_lengths: np.ndarray):
+        self.index = index
+        self.vocabulary = vocabulary
+        self.offsets = offsets          # Term t owns postings[offsets[t]:offsets[t + 1]]
+        self.postings = postings        # Row ids
+        self.frequencies = frequencies  # Term frequency per posting
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        doc_freq = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1 + (len(doc_lengths) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, index: CardIndex) -> 'BM25Index':
+        documents = load_documents(index)
+        vocabulary: Dict[str, int] = {}
+        term_rows: List[List[int]] = []
+        term_freqs: List[List[int]] = []
+        doc_lengths = np.zeros(len(index), dtype=np.float32)
+
+        for row in range(len(index)):
+            tokens = tokenize(documents.get(row, ''))
+            doc_lengths[row] = len(tokens)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term = vocabulary.setdefault(token, len(vocabulary))
+                if term == len(term_rows):
+                    term_rows.append([])
+                    term_freqs.append([])
+                term_rows[term].append(row)
+                term_freqs[term].append(count)
+
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(r) for r in term_rows])
+        postings = np.array([r for rows in term_rows for r in rows], dtype=np.int32)
+        frequencies = np.array([f for freqs in term_freqs for f in freqs], dtype=np.float32)
+        return cls(index, vocabulary, offsets, postings, frequencies, doc_lengths)
+
+    def _term_slice(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        term = self.vocabulary.get(token)
+        if term is None:
+            return None
+        start, end = self.offsets[term], self.offsets[term + 1]
+        return self.postings[start:end], self.frequencies[start:end], float(self.idf[term])
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for the query terms."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9))
+        for token in set(tokenize(query)):
+            term = self._term_slice(token)
+            if term is None:
+                continue
+            rows, tf, idf = term
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+        return scores
+
+    def search(self, query: str, top_k: int = 5, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Keyword search; an exact phrase when the query is in double quotes."""
+        if is_phrase_query(query):
+            return self.phrase_search(query.strip()[1:-1], top_k, rows)
+
+        scores = self.scores(query)
+        if rows is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[rows] = True
+            scores[~mask] = 0
+        ids = select_top_k(scores, top_k)
+        return [(int(i), float(scores[i])) for i in ids if scores[i] > 0]
+
+    def phrase_search(self, phrase: str, top_k: int = 5, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Cards containing the exact phrase (word sequence, case-insensitive),
+        ranked by BM25. Candidates are the rows containing every phrase term;
+        only those documents are read back to check word order.
+        """
+        words = tokenize(phrase, keep_stopwords=True)
+        terms = [t for t in words if t not in STOPWORDS] or words
+        candidates = None
+        for token in set(terms):
+            term = self._term_slice(token)
+            if term is None:
+                return []
+            candidates = term[0] if candidates is None else np.intersect1d(candidates, term[0])
+        if candidates is None or len(candidates) == 0:
+            return []
+        if rows is not None:
+            candidates = np.intersect1d(candidates, rows)
+
+        needle = ' ' + ' '.join(words) + ' '
+        documents = load_documents(self.index, candidates.tolist())
+        matches = [row for row, text in documents.items()
+                   if needle in ' ' + ' '.join(tokenize(text, keep_stopwords=True)) + ' ']
+
+        scores = self.scores(phrase)
+        ranked = sorted(matches, key=lambda row: scores[row], reverse=True)[:top_k]
+        return [(row, float(scores[row])) for row in ranked]
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / BM25_FILE
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, vocabulary=json.dumps(self.vocabulary, ensure_ascii=False), offsets=self.offsets,
+                     postings=self.postings, frequencies=self.frequencies, doc_lengths=self.doc_lengths,
+                     fingerprint=self.index.fingerprint())
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> Optional['BM25Index']:
+        """
+        Load the saved BM25 index, or None if missing, built for a different
+        catalog, or older than a card's metadata.json / insidenote.json.
+        """
+        path = Path(index_directory) / BM25_FILE
+        if not path.exists() or path.stat().st_mtime_ns < newest_card_file_mtime(index.cards_directory):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint():
+                return None
+            return cls(index, json.loads(str(data['vocabulary'])), data['offsets'], data['postings'],
+                       data['frequencies'], data['doc_lengths'])
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'BM25Index':
+        """Load the BM25 index, building and saving it when missing or stale."""
+        bm25 = cls.load(index, index_directory)
+        if bm25 is None:
+            print("🔄 Building BM25 keyword index...")
+            bm25 = cls.build(index)
+            bm25.save(index_directory)
+        return bm25
+
+
+def lexical_ranker(bm25: BM25Index, query: str) -> Callable:
+    """rank(k, rows) for card_index.rank_cards() using BM25 only. Scores are scaled to 0-1."""
+    def rank(k: int, rows: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        top = bm25.search(query, k, rows)
+        best = top[0][1] if top else 1.0
+        return [(row, score / best) for row, score in top]
+    return rank
+
+
+def hybrid_ranker(bm25: BM25Index, searcher, query: str, query_embedding: List[float],
+                  semantic: Optional[List[Tuple[int, float]]] = None) -> Callable:
+    """
+    rank(k, rows) for card_index.rank_cards(): BM25 and embedding rankings
+    merged with reciprocal-rank fusion. Scores are the fused scores scaled to
+    0-1 (best = 1), so they follow the result order.
+
+    semantic is an optional precomputed embedding ranking, max(k, FUSION_DEPTH)
+    deep over the same rows, e.g. from one batched search of many queries.
+    """
+    precomputed = semantic
+
+    def rank(k: int, rows: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        depth = max(k, FUSION_DEPTH)
+        if precomputed is None:
+            semantic = searcher.search(query_embedding, depth, rows)
+        else:
+            semantic = precomputed[:depth]
+        lexical = bm25.search(query, depth, rows)
+        fused = reciprocal_rank_fusion([semantic, lexical])[:k]
+        best = fused[0][1] if fused else 1.0
+        return [(row, score / best) for row, score in fused]
+    return rank
+
+
+def search_by_mode(index: CardIndex, query: str, mode: str, embed: Callable[[str], List[float]],
+                   top_k: int = 5, filters: Optional[Dict[str, str]] = None, searcher=None,
+                   bm25: Optional[BM25Index] = None, facets=None,
+                   index_directory: str = INDEX_DIRECTORY, mmr_lambda: Optional[float] = None,
+                   max_per_folder: Optional[int] = None) -> Optional[List[Tuple[Dict, float]]]:
+    """
+    Search in one of SEARCH_MODES and return (card details, score) tuples.
+
+    Lexical mode and quoted phrase queries in hybrid mode never call embed.
+    Returns None when the query embedding could not be generated.
+
+    Args:
+        index: Card search index
+        query: Search text; "double quotes" mark an exact phrase
+        mode: 'semantic', 'hybrid' or 'lexical'
+        embed: Function returning the query embedding ([] on failure)
+        top_k: Number of results to return
+        filters: Optional metadata filters (see card_index.FILTER_FIELDS)
+        searcher: Optional embedding backend from open_searcher()
+        bm25: Keyword index; opened from index_directory when not given
+        facets: Facet index for pre-filtering; opened from index_directory
+            when filters are given without one
+        mmr_lambda: Re-rank a shortlist for diversity (see diversity.py)
+        max_per_folder: Optional cap on results from one category folder
+    """
+    if facets is None and any((filters or {}).values()):
+        from facet_index import FacetIndex
+        with stage('open_backends'):
+            facets = FacetIndex.open(index, index_directory)
+
+    if mode == 'lexical' or (mode == 'hybrid' and is_phrase_query(query)):
+        with stage('open_backends'):
+            bm25 = bm25 or BM25Index.open(index, index_directory)
+        rank = lexical_ranker(bm25, query)
+    else:
+        with stage('embed'):
+            query_embedding = embed(query)
+        if not query_embedding:
+            return None
+        searcher = searcher or index
+        if mode == 'semantic':
+            rank = lambda k, rows: searcher.search(query_embedding, k, rows)
+        else:
+            with stage('open_backends'):
+                bm25 = bm25 or BM25Index.open(index, index_directory)
+            rank = hybrid_ranker(bm25, searcher, query, query_embedding)
+
+    return rank_cards(index, diversified(index, rank, mmr_lambda, max_per_folder), top_k, filters, facets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the BM25 card keyword index")
+    parser.add_argument('command', choices=['build', 'search'])
+    parser.add_argument('query', nargs='?', help='Keywords, or "an exact phrase" in double quotes')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--top-k', type=int, default=5, help='Number of results')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        bm25 = BM25Index.build(index)
+        bm25.save(args.index_dir)
+        print(f"✅ Built BM25 index: {len(bm25.vocabulary)} terms over {len(index)} cards")
+        return
+
+    if not args.query:
+        print("❌ Please give a search query.")
+        return
+    bm25 = BM25Index.open(index, args.index_dir)
+    top = bm25.search(args.query, args.top_k)
+    for rank, (card, (_, score)) in enumerate(zip(load_card_details(index, [r for r, _ in top]), top), 1):
+        print(f"#{rank} - BM25: {score:.2f}  {card['folder']}/{card['filename']}  {card['title']}")
+    if not top:
+        print("No results found.")
+
+
+if __name__ == "__main__":
+    main()
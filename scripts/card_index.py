@@ -0,0 +1,717 @@
+"""
+Card Search Index
+Compiles every card embedding under CARDS_DIRECTORY into one contiguous float32
+matrix so the search scripts can memory-map it instead of re-parsing every
+insidenote.json on startup. Rows are L2-normalized at build time, so cosine
+similarity against a query is a single matrix-vector product. A folder's
+binary embeddings.bin sidecar (embedding_sidecar.py) takes precedence over
+the embeddings in its insidenote.json.
+
+Index layout (INDEX_DIRECTORY):
+    embeddings.<version>.npy - float32 matrix of unit-length rows, one row per card
+    cards.json      - {"model": ..., "dimension": ..., "embeddings_file": ..., "cards": [[folder, filename], ...]}
+    manifest.json   - {folder: {"insidenote.json": {mtime_ns, size, sha1}, "metadata.json": {...},
+                               "embeddings.bin": {...}}}
+
+`refresh` compares the card files with the manifest and re-indexes only the
+folders that changed; the search scripts do this automatically on startup.
+Every save writes the matrix under a new name and then switches cards.json
+to it, because Windows cannot replace a file that is still memory-mapped
+(by the refresh itself or a running search server). Older matrix files are
+deleted once nothing maps them.
+
+Usage:
+    python scripts/card_index.py build
+    python scripts/card_index.py refresh
+    python scripts/card_index.py build --cards-dir "D:\\Cards\\Series" --index-dir "D:\\Cards\\SearchIndex"
+    python scripts/card_index.py info
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from insidenote_stream import read_embeddings
+from embedding_sidecar import SIDECAR_FILE, EmbeddingSidecar
+from search_profile import stage
+
+# Configuration
+EMBEDDING_MODEL = "models/embedding-001"
+CARDS_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series"
+INDEX_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\SearchIndex"
+
+EMBEDDINGS_FILE = "embeddings.npy"  # Matrix name of indexes saved before it was versioned
+CARDS_TABLE_FILE = "cards.json"
+MANIFEST_FILE = "manifest.json"
+CARD_FILES = ("insidenote.json", "metadata.json", SIDECAR_FILE)
+
+
+def load_card_list(path: Path) -> List[Dict]:
+    """
+    Load a metadata.json / insidenote.json file.
+    Handles both formats: direct array or {"cards": [...]}.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and 'cards' in data:
+        return data['cards']
+    return data if isinstance(data, list) else [data]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length. All-zero rows stay zero."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k highest scores, best first.
+    Uses argpartition so only the k winners are sorted.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    with stage('top_k'):
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def list_card_folders(cards_directory: str = CARDS_DIRECTORY) -> List[Path]:
+    """Return the category folders under cards_directory in a stable order."""
+    base_path = Path(cards_directory)
+    if not base_path.exists():
+        return []
+    return sorted(d for d in base_path.iterdir() if d.is_dir())
+
+
+def newest_card_file_mtime(cards_directory: str = CARDS_DIRECTORY) -> int:
+    """Latest mtime (ns) of any insidenote.json or metadata.json; 0 if none exist."""
+    newest = 0
+    for folder in list_card_folders(cards_directory):
+        for name in ("insidenote.json", "metadata.json"):
+            path = folder / name
+            if path.exists():
+                newest = max(newest, path.stat().st_mtime_ns)
+    return newest
+
+
+class CardIndex:
+    """Card embeddings as one float32 matrix plus the row -> (folder, filename) table."""
+
+    def __init__(self, embeddings: np.ndarray, cards: List[Tuple[str, str]],
+                 model: str = EMBEDDING_MODEL, cards_directory: str = CARDS_DIRECTORY):
+        self.embeddings = embeddings
+        self.cards = cards
+        self.model = model
+        self.cards_directory = cards_directory
+        self.index_directory: Optional[str] = None  # Set when loaded from or saved to disk
+        self.embeddings_file: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    @property
+    def embeddings_path(self) -> Optional[Path]:
+        """Matrix file of a loaded or saved index (None for an index compiled in memory)."""
+        if self.index_directory is None or self.embeddings_file is None:
+            return None
+        return Path(self.index_directory) / self.embeddings_file
+
+    def fingerprint(self) -> str:
+        """Hash of the row table; derived indexes store it to detect a rebuilt catalog."""
+        digest = hashlib.sha1(f"{self.model}|{self.dimension}".encode('utf-8'))
+        for folder, filename in self.cards:
+            digest.update(f"\n{folder}/{filename}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Exact cosine search: one matrix-vector product plus a top-k selection.
+
+        Args:
+            query_embedding: Query vector (any length-preserving scale)
+            top_k: Number of results to return
+            rows: Optional subset of row ids to score instead of the whole catalog
+
+        Returns:
+            List of (row, similarity_score) tuples, best first
+        """
+        query = normalize_rows(query_embedding)
+        if len(self) == 0 or not query.any():
+            return []
+        if rows is None:
+            scores = self.embeddings @ query
+            ids = select_top_k(scores, top_k)
+            return [(int(i), float(scores[i])) for i in ids]
+
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.embeddings[rows] @ query
+        ids = select_top_k(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in ids]
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                     block_size: int = 256, rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Exact cosine search for many queries with one matrix-matrix product
+        per block of queries (blocks bound the score matrix size).
+        rows optionally restricts every query to a subset of row ids.
+
+        Returns:
+            One list of (row, similarity_score) tuples per query, best first
+        """
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        matrix = self.embeddings if rows is None else self.embeddings[np.asarray(rows, dtype=np.int64)]
+        row_ids = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        results: List[List[Tuple[int, float]]] = []
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            scores = block @ matrix.T if len(matrix) else np.zeros((len(block), 0), dtype=np.float32)
+            for query, row_scores in zip(block, scores):
+                if not query.any():
+                    results.append([])
+                    continue
+                ids = select_top_k(row_scores, top_k)
+                results.append([(int(row_ids[i]), float(row_scores[i])) for i in ids])
+        return results
+
+    def rows_in_folders(self, folders: List[str]) -> np.ndarray:
+        """Row ids of all cards whose folder is in folders (case-insensitive)."""
+        wanted = {f.lower() for f in folders}
+        return np.array([i for i, (folder, _) in enumerate(self.cards) if folder.lower() in wanted],
+                        dtype=np.int64)
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        """
+        Write the matrix and id table, replacing any previous index atomically.
+        The matrix gets a new file name, so a previous one may stay memory-mapped.
+        """
+        index_path = Path(index_directory)
+        index_path.mkdir(parents=True, exist_ok=True)
+
+        embeddings_file = f"embeddings.{time.time_ns()}.npy"
+        matrix_tmp = index_path / (embeddings_file + '.tmp')
+        with open(matrix_tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+
+        table_tmp = index_path / (CARDS_TABLE_FILE + '.tmp')
+        with open(table_tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model': self.model,
+                'dimension': self.dimension,
+                'normalized': True,
+                'embeddings_file': embeddings_file,
+                'cards_directory': str(self.cards_directory),
+                'cards': [list(card) for card in self.cards],
+            }, f, ensure_ascii=False)
+
+        os.replace(matrix_tmp, index_path / embeddings_file)
+        os.replace(table_tmp, index_path / CARDS_TABLE_FILE)
+        self.index_directory = str(index_directory)
+        self.embeddings_file = embeddings_file
+
+        for old in index_path.glob('embeddings*.npy'):
+            if old.name != embeddings_file:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass  # Still memory-mapped (Windows); a later save removes it
+
+    @classmethod
+    def load(cls, index_directory: str = INDEX_DIRECTORY, mmap: bool = True) -> 'CardIndex':
+        """Open a saved index. The matrix is memory-mapped read-only by default."""
+        index_path = Path(index_directory)
+        with open(index_path / CARDS_TABLE_FILE, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+
+        embeddings_file = table.get('embeddings_file', EMBEDDINGS_FILE)
+        embeddings = np.load(index_path / embeddings_file, mmap_mode='r' if mmap else None)
+        if not table.get('normalized'):
+            # Index written before rows were normalized at build time
+            embeddings = normalize_rows(embeddings)
+        cards = [tuple(card) for card in table['cards']]
+        index = cls(embeddings, cards,
+                    model=table.get('model', EMBEDDING_MODEL),
+                    cards_directory=table.get('cards_directory', CARDS_DIRECTORY))
+        index.index_directory = str(index_directory)
+        index.embeddings_file = embeddings_file
+        return index
+
+    @staticmethod
+    def exists(index_directory: str = INDEX_DIRECTORY) -> bool:
+        index_path = Path(index_directory)
+        return (index_path / CARDS_TABLE_FILE).exists() and any(index_path.glob('embeddings*.npy'))
+
+
+def older_than_embeddings(path: Path, index: CardIndex) -> bool:
+    """True if a derived index file was written before the index's matrix (cards were re-embedded)."""
+    embeddings_path = index.embeddings_path
+    return (embeddings_path is not None and embeddings_path.exists()
+            and path.stat().st_mtime_ns < embeddings_path.stat().st_mtime_ns)
+
+
+def read_folder_embeddings(folder: Path, dimension: Optional[int] = None,
+                           model: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    Embeddings (float32 matrix) and filenames of one folder, from its binary
+    sidecar (embedding_sidecar.py) when it has one, otherwise streamed from
+    insidenote.json so the vectors never exist as Python floats.
+    Cards without an embedding, or whose size differs from dimension, are skipped.
+    """
+    empty = np.zeros((0, dimension or 0), dtype=np.float32), []
+    try:
+        sidecar = EmbeddingSidecar.load(folder)
+        if sidecar is not None:
+            if model and sidecar.model and sidecar.model != model:
+                print(f"⚠️  Skipping {folder.name}: sidecar embeddings are from {sidecar.model}, expected {model}")
+                return empty
+            if dimension is not None and len(sidecar) and sidecar.dimension != dimension:
+                print(f"⚠️  Skipping {folder.name}: sidecar embeddings have {sidecar.dimension} dims, "
+                      f"expected {dimension}")
+                return empty
+            return sidecar.vectors(), list(sidecar.filenames)
+
+        insidenote_path = folder / "insidenote.json"
+        if not insidenote_path.exists():
+            return empty
+        return read_embeddings(insidenote_path, dimension, folder.name)
+    except Exception as e:
+        print(f"⚠️  Error loading {folder.name}: {e}")
+        return empty
+
+
+def compile_index(cards_directory: str = CARDS_DIRECTORY, model: str = EMBEDDING_MODEL) -> CardIndex:
+    """
+    Read every insidenote.json under cards_directory into an in-memory CardIndex.
+
+    Args:
+        cards_directory: Folder containing one subfolder per card category
+        model: Embedding model the vectors were generated with
+
+    Returns:
+        CardIndex holding all cards that have an embedding
+    """
+    blocks = []
+    cards = []
+    dimension = None
+
+    for folder in list_card_folders(cards_directory):
+        rows, filenames = read_folder_embeddings(folder, dimension, model)
+        if filenames:
+            dimension = rows.shape[1]
+            blocks.append(rows)
+            cards.extend((folder.name, filename) for filename in filenames)
+
+    if blocks:
+        embeddings = normalize_rows(np.concatenate(blocks))
+    else:
+        embeddings = np.zeros((0, dimension or 0), dtype=np.float32)
+
+    return CardIndex(embeddings, cards, model=model, cards_directory=cards_directory)
+
+
+def file_state(path: Path, previous: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    {mtime_ns, size, sha1} of a card file, or None if it does not exist.
+    The file is only hashed when its mtime or size differ from previous.
+    """
+    if not path.exists():
+        return None
+    stat = path.stat()
+    if previous and previous.get('mtime_ns') == stat.st_mtime_ns and previous.get('size') == stat.st_size:
+        return previous
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': digest}
+
+
+def catalog_manifest(cards_directory: str = CARDS_DIRECTORY,
+                     previous: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+    """folder -> {card file name -> file_state} for every folder with card files."""
+    previous = previous or {}
+    manifest = {}
+    for folder in list_card_folders(cards_directory):
+        states = {}
+        for name in CARD_FILES:
+            state = file_state(folder / name, previous.get(folder.name, {}).get(name))
+            if state:
+                states[name] = state
+        if states:
+            manifest[folder.name] = states
+    return manifest
+
+
+def load_manifest(index_directory: str = INDEX_DIRECTORY) -> Optional[Dict[str, Dict]]:
+    path = Path(index_directory) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, Dict], index_directory: str = INDEX_DIRECTORY):
+    path = Path(index_directory) / MANIFEST_FILE
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def changed_folders(old: Dict[str, Dict], new: Dict[str, Dict], name: str) -> List[str]:
+    """Folders whose card file `name` was added, removed or edited (by content hash)."""
+    return sorted(folder for folder in set(old) | set(new)
+                  if (old.get(folder, {}).get(name) or {}).get('sha1') !=
+                  (new.get(folder, {}).get(name) or {}).get('sha1'))
+
+
+def build_index(cards_directory: str = CARDS_DIRECTORY, index_directory: str = INDEX_DIRECTORY,
+                model: str = EMBEDDING_MODEL) -> CardIndex:
+    """Compile all card embeddings and save them as a memory-mappable index plus record store."""
+    from card_store import write_store
+
+    # Take the manifest first so edits made while compiling show up in the next refresh
+    manifest = catalog_manifest(cards_directory)
+    index = compile_index(cards_directory, model)
+    index.save(index_directory)
+    write_store(index, index_directory)
+    save_manifest(manifest, index_directory)
+    return index
+
+
+def refresh_index(cards_directory: str = CARDS_DIRECTORY, index_directory: str = INDEX_DIRECTORY,
+                  model: str = EMBEDDING_MODEL) -> Tuple[CardIndex, List[str]]:
+    """
+    Bring the saved index up to date with the card files.
+
+    Each folder's insidenote.json, metadata.json and embedding sidecar are
+    compared with the manifest saved at the last build (mtime and size first,
+    content hash when those differ). Only folders whose insidenote.json or
+    sidecar changed are re-parsed; their rows are replaced and every other folder's rows are
+    copied from the existing matrix. The record store (card_store.py) is
+    rewritten for every changed folder, copying the others' records. Without
+    an index or manifest, the index is built from scratch.
+
+    Returns:
+        (index, names of the folders whose card files changed)
+    """
+    old = load_manifest(index_directory) if CardIndex.exists(index_directory) else None
+    if old is None:
+        index = build_index(cards_directory, index_directory, model)
+        return index, sorted({folder for folder, _ in index.cards})
+
+    from card_store import store_exists, write_store
+
+    new = catalog_manifest(cards_directory, old)
+    index = CardIndex.load(index_directory)
+    if new == old:
+        if not store_exists(index_directory):
+            write_store(index, index_directory)
+        return index, []
+
+    reparse = set(changed_folders(old, new, "insidenote.json")) | set(changed_folders(old, new, SIDECAR_FILE))
+    changed = sorted(reparse | set(changed_folders(old, new, "metadata.json")))
+    previous = index
+    if reparse:
+        index = splice_folders(index, cards_directory, reparse)
+        index.save(index_directory)
+    if changed:
+        write_store(index, index_directory, previous, set(changed))
+    save_manifest(new, index_directory)
+    return index, changed
+
+
+def splice_folders(index: CardIndex, cards_directory: str, folders: set) -> CardIndex:
+    """New CardIndex with the rows of folders re-read from disk, keeping folder order."""
+    rows_by_folder: Dict[str, List[int]] = {}
+    for row, (folder, _) in enumerate(index.cards):
+        rows_by_folder.setdefault(folder, []).append(row)
+
+    dimension = index.dimension if len(index) else None
+    blocks, cards = [], []
+    for folder in [f.name for f in list_card_folders(cards_directory)]:
+        if folder not in folders and folder not in rows_by_folder:
+            continue
+        if folder in folders:
+            rows, filenames = read_folder_embeddings(Path(cards_directory) / folder, dimension, index.model)
+            if not filenames:
+                continue
+            dimension = rows.shape[1]
+            blocks.append(normalize_rows(rows))
+        else:
+            filenames = [index.cards[row][1] for row in rows_by_folder[folder]]
+            blocks.append(np.asarray(index.embeddings[rows_by_folder[folder]], dtype=np.float32))
+        cards.extend((folder, filename) for filename in filenames)
+
+    if blocks:
+        embeddings = np.concatenate(blocks)
+    else:
+        embeddings = np.zeros((0, dimension or 0), dtype=np.float32)
+    return CardIndex(embeddings, cards, model=index.model, cards_directory=cards_directory)
+
+
+def open_index(index_directory: str = INDEX_DIRECTORY,
+               cards_directory: str = CARDS_DIRECTORY) -> CardIndex:
+    """
+    Memory-map the saved index, or fall back to reading the JSON files
+    when no index has been built yet. A built index is refreshed first
+    when card files changed since it was saved (see refresh_index).
+    """
+    if CardIndex.exists(index_directory):
+        if load_manifest(index_directory) is not None and Path(cards_directory).exists():
+            index, changed = refresh_index(cards_directory, index_directory)
+            if changed:
+                print(f"🔄 Refreshed {len(changed)} changed folder(s): {', '.join(changed)}")
+            return index
+        return CardIndex.load(index_directory)
+
+    print(f"⚠️  No search index in {index_directory}, reading card JSON files instead.")
+    print("   Run 'python scripts/card_index.py build' for a faster start.")
+    return compile_index(cards_directory)
+
+
+def load_card_records(index: CardIndex, ids: List[int]) -> List[Dict]:
+    """
+    Raw card records (filename, folder, inside_note and the metadata fields
+    in card_store.RECORD_FIELDS) for the given index rows.
+
+    Reads only the requested rows from the record store next to a saved
+    index. Without a store, only the folders that contain one of the
+    requested cards are read from their JSON files.
+    """
+    from card_store import read_records, read_folder_records
+
+    if index.index_directory:
+        records = read_records(index, index.index_directory, ids)
+        if records is not None:
+            return records
+
+    filenames_by_folder: Dict[str, List[str]] = {}
+    for i in ids:
+        filenames_by_folder.setdefault(index.cards[i][0], []).append(index.cards[i][1])
+    by_card = {}
+    for folder_name, filenames in filenames_by_folder.items():
+        for filename, record in read_folder_records(Path(index.cards_directory) / folder_name, filenames).items():
+            by_card[(folder_name, filename)] = record
+    return [by_card[tuple(index.cards[i])] for i in ids]
+
+
+def load_card_details(index: CardIndex, ids: List[int]) -> List[Dict]:
+    """Load display fields for the given index rows (see load_card_records)."""
+    details = []
+    for record in load_card_records(index, ids):
+        details.append({
+            'filename': record['filename'],
+            'folder': record['folder'],
+            'image_path': str(Path(index.cards_directory) / record['folder'] / record['filename']),
+            'inside_note': record.get('inside_note', ''),
+            # Metadata
+            'title': record.get('title', 'N/A'),
+            'description': record.get('description', ''),
+            'occasion': record.get('occasion', 'N/A'),
+            'emotion': record.get('emotion', 'N/A'),
+            'visible_text': record.get('visible_text', 'N/A'),
+            'recipient': record.get('recipient', 'N/A'),
+            'keywords': record.get('keywords', []),
+            'style': record.get('style', ''),
+        })
+    return details
+
+
+BACKENDS = ['exact', 'sharded', 'ivf', 'hnsw', 'int8', 'pq', 'reduced']
+
+
+def open_searcher(index: CardIndex, backend: str = 'exact', index_directory: str = INDEX_DIRECTORY):
+    """
+    Return the search backend for index. Every backend exposes
+    search(query_embedding, top_k, rows=None) -> [(row, score), ...].
+    Approximate indexes are built and saved on first use.
+    """
+    if backend == 'exact':
+        return index
+    if backend == 'sharded':
+        from sharded_index import ShardedIndex
+        return ShardedIndex(index)
+    if backend == 'ivf':
+        from ivf_index import IVFIndex
+        return IVFIndex.open(index, index_directory)
+    if backend == 'hnsw':
+        from hnsw_index import HNSWIndex
+        return HNSWIndex.open(index, index_directory)
+    if backend in ('int8', 'pq'):
+        from quantized_index import QuantizedIndex
+        return QuantizedIndex.open(index, backend, index_directory)
+    if backend == 'reduced':
+        from reduced_index import ReducedIndex
+        return ReducedIndex.open(index, index_directory)
+    raise ValueError(f"Unknown search backend: {backend} (choose from {', '.join(BACKENDS)})")
+
+
+def search_many(searcher, query_embeddings: List[List[float]], top_k: int = 5,
+                rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+    """
+    Search several queries on any backend: one search_batch call where the
+    backend has one (exact, sharded), otherwise one search per query.
+    """
+    if hasattr(searcher, 'search_batch'):
+        return searcher.search_batch(query_embeddings, top_k, rows=rows)
+    return [searcher.search(embedding, top_k, rows) for embedding in query_embeddings]
+
+
+def sample_queries(index: CardIndex, count: int, noise: float = 0.75, seed: int = 0) -> np.ndarray:
+    """
+    Stand-in queries for recall reports: random catalog embeddings plus
+    Gaussian noise of the given total norm, renormalized.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), min(count, len(index)), replace=False)
+    queries = np.asarray(index.embeddings[np.sort(rows)], dtype=np.float32)
+    queries += rng.normal(0, noise / np.sqrt(index.dimension), queries.shape).astype(np.float32)
+    return normalize_rows(queries)
+
+
+def measure_recall(index: CardIndex, searcher, queries: np.ndarray, top_k: int = 10) -> float:
+    """Mean recall@top_k of searcher against exact search for the given query vectors."""
+    if len(queries) == 0:
+        return 0.0
+    exact = index.search_batch(queries, top_k)
+    total = 0.0
+    for query, truth in zip(queries, exact):
+        expected = {row for row, _ in truth}
+        found = {row for row, _ in searcher.search(query, top_k)}
+        total += len(expected & found) / max(len(expected), 1)
+    return total / len(queries)
+
+
+FILTER_FIELDS = ['occasion', 'recipient', 'emotion', 'style', 'folder']
+
+
+def matches_filters(card: Dict, filters: Dict[str, str]) -> bool:
+    """
+    True when every filter value appears (case-insensitive substring) in the
+    card's field. List fields such as keywords match if any item matches.
+    """
+    for field, wanted in filters.items():
+        if not wanted:
+            continue
+        value = card.get(field, '')
+        values = value if isinstance(value, list) else [value]
+        if not any(str(wanted).lower() in str(v).lower() for v in values):
+            return False
+    return True
+
+
+def rank_cards(index: CardIndex, rank: Callable[[int, Optional[np.ndarray]], List[Tuple[int, float]]],
+               top_k: int = 5, filters: Optional[Dict[str, str]] = None,
+               facets=None) -> List[Tuple[Dict, float]]:
+    """
+    Run a ranking function and return (card details, score) tuples.
+
+    rank(k, rows) returns the best k (row, score) pairs, optionally limited to
+    rows. With a facet index (facet_index.py) every filter narrows the rows
+    before ranking, so only matching cards are scored. Without one, a folder
+    filter narrows the rows and metadata filters are checked on the loaded
+    details, widening the shortlist until top_k matching cards are found or
+    the catalog is exhausted.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v}
+    rows = None
+    if facets is not None and filters:
+        rows = facets.rows(filters)
+        filters = {}
+    elif filters.get('folder'):
+        rows = index.rows_in_folders([filters.pop('folder')])
+    if rows is not None and len(rows) == 0:
+        return []
+    candidate_count = len(index) if rows is None else len(rows)
+
+    if not filters:
+        with stage('rank'):
+            top = rank(top_k, rows)
+        with stage('details'):
+            cards = load_card_details(index, [i for i, _ in top])
+        return [(card, score) for card, (_, score) in zip(cards, top)]
+
+    shortlist = top_k * 4
+    while True:
+        with stage('rank'):
+            top = rank(shortlist, rows)
+        with stage('details'):
+            cards = load_card_details(index, [i for i, _ in top])
+        results = [(card, score) for card, (_, score) in zip(cards, top) if matches_filters(card, filters)]
+        if len(results) >= top_k or shortlist >= candidate_count:
+            return results[:top_k]
+        shortlist *= 4
+
+
+def find_cards(index: CardIndex, query_embedding: List[float], top_k: int = 5,
+               filters: Optional[Dict[str, str]] = None, searcher=None, facets=None) -> List[Tuple[Dict, float]]:
+    """
+    Semantic search returning (card details, score) tuples. searcher is an
+    optional backend from open_searcher(); exact search is the default.
+    facets is an optional FacetIndex for pre-filtering (see rank_cards).
+    """
+    searcher = searcher or index
+    return rank_cards(index, lambda k, rows: searcher.search(query_embedding, k, rows), top_k, filters, facets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect the card search index")
+    parser.add_argument('command', choices=['build', 'refresh', 'info'],
+                        help='build: compile the index, refresh: re-index changed folders only, info: show index stats')
+    parser.add_argument('--cards-dir', default=CARDS_DIRECTORY, help='Folder with one subfolder per card category')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Where the index files are written')
+    parser.add_argument('--model', default=EMBEDDING_MODEL, help='Embedding model name stored with the index')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not Path(args.cards_dir).exists():
+            print(f"❌ Directory not found: {args.cards_dir}")
+            return
+        index = build_index(args.cards_dir, args.index_dir, args.model)
+        size_mb = index.embeddings.nbytes / (1024 * 1024)
+        print(f"✅ Indexed {len(index)} cards ({index.dimension} dims, {size_mb:.1f} MB) into {args.index_dir}")
+        return
+
+    if args.command == 'refresh':
+        if not Path(args.cards_dir).exists():
+            print(f"❌ Directory not found: {args.cards_dir}")
+            return
+        start = time.perf_counter()
+        index, changed = refresh_index(args.cards_dir, args.index_dir, args.model)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if changed:
+            print(f"✅ Refreshed {len(changed)} folder(s) in {elapsed_ms:.1f} ms: {', '.join(changed)}")
+        else:
+            print(f"✅ Index is up to date ({elapsed_ms:.1f} ms)")
+        print(f"   {len(index)} cards indexed")
+        return
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No index found in {args.index_dir}")
+        return
+    index = CardIndex.load(args.index_dir)
+    folders = sorted({folder for folder, _ in index.cards})
+    print(f"Index:      {args.index_dir}")
+    print(f"Model:      {index.model}")
+    print(f"Cards:      {len(index)}")
+    print(f"Dimension:  {index.dimension}")
+    print(f"Folders:    {len(folders)}")
+
+
+if __name__ == "__main__":
+    main()
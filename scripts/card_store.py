@@ -0,0 +1,129 @@
+"""
+Card Record Store
+Display and text fields of every indexed card (inside note, title,
+description, occasion, keywords, ...) in one offset-indexed file next to the
+search index, so search results are filled in by seeking to the winning rows
+instead of parsing whole insidenote.json / metadata.json files, and nothing
+but the vector matrix and the row table stays resident.
+
+Store layout (INDEX_DIRECTORY):
+    card_records.jsonl        - one JSON record per index row, in row order
+    card_records_offsets.npy  - int64 byte offsets, row i is bytes [offsets[i], offsets[i + 1])
+
+The store is written by card_index.py build / refresh. Folders that did not
+change are copied byte-for-byte from the previous store.
+"""
+import os
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from card_index import CardIndex, load_card_list
+from insidenote_stream import iter_cards
+
+# Configuration
+RECORDS_FILE = "card_records.jsonl"
+OFFSETS_FILE = "card_records_offsets.npy"
+RECORD_FIELDS = ['title', 'description', 'occasion', 'emotion', 'visible_text', 'recipient',
+                 'keywords', 'style', 'colors']
+
+
+def read_folder_records(folder: Path, filenames: Iterable[str]) -> Dict[str, Dict]:
+    """Records for the given cards of one folder, read from its JSON files."""
+    insidenote_map, metadata_map = {}, {}
+    try:
+        if (folder / "insidenote.json").exists():
+            # Only the note text is needed: skip the embeddings instead of parsing them
+            insidenote_map = {c['filename']: c for c, _ in iter_cards(folder / "insidenote.json", embeddings=False)}
+        if (folder / "metadata.json").exists():
+            metadata_map = {c['filename']: c for c in load_card_list(folder / "metadata.json")}
+    except Exception as e:
+        print(f"⚠️  Error loading {folder.name}: {e}")
+
+    records = {}
+    for filename in filenames:
+        metadata = metadata_map.get(filename, {})
+        record = {'filename': filename, 'folder': folder.name,
+                  'inside_note': insidenote_map.get(filename, {}).get('inside_note', '')}
+        record.update({field: metadata[field] for field in RECORD_FIELDS if field in metadata})
+        records[filename] = record
+    return records
+
+
+def store_exists(index_directory: str) -> bool:
+    path = Path(index_directory)
+    return (path / RECORDS_FILE).exists() and (path / OFFSETS_FILE).exists()
+
+
+def write_store(index: CardIndex, index_directory: str, previous: Optional[CardIndex] = None,
+                changed: Optional[Set[str]] = None):
+    """
+    Write the record store for index, replacing any previous one atomically.
+
+    Args:
+        index: The index being saved (rows define the record order)
+        index_directory: Where the store is written
+        previous: Index the existing store belongs to; its records are reused
+        changed: Folders to re-read from the card files (all when previous is None)
+    """
+    path = Path(index_directory)
+    path.mkdir(parents=True, exist_ok=True)
+    reuse: Dict = {}
+    if previous is not None and store_exists(index_directory):
+        old_offsets = np.load(path / OFFSETS_FILE)
+        if len(old_offsets) == len(previous) + 1:
+            reuse = {card: row for row, card in enumerate(previous.cards) if card[0] not in (changed or set())}
+            with open(path / RECORDS_FILE, 'rb') as f:
+                old_data = f.read()
+
+    rows_by_folder: Dict[str, List[int]] = {}
+    for row, (folder, _) in enumerate(index.cards):
+        rows_by_folder.setdefault(folder, []).append(row)
+
+    lines: List[bytes] = [b''] * len(index)
+    for folder, rows in rows_by_folder.items():
+        cards = [index.cards[row] for row in rows]
+        if reuse and all(card in reuse for card in cards):
+            for row, card in zip(rows, cards):
+                old_row = reuse[card]
+                lines[row] = old_data[old_offsets[old_row]:old_offsets[old_row + 1]]
+            continue
+        records = read_folder_records(Path(index.cards_directory) / folder, [c[1] for c in cards])
+        for row, card in zip(rows, cards):
+            lines[row] = json.dumps(records[card[1]], ensure_ascii=False).encode('utf-8') + b'\n'
+
+    offsets = np.zeros(len(index) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in lines])
+    records_tmp = path / (RECORDS_FILE + '.tmp')
+    with open(records_tmp, 'wb') as f:
+        f.writelines(lines)
+    offsets_tmp = path / (OFFSETS_FILE + '.tmp')
+    with open(offsets_tmp, 'wb') as f:
+        np.save(f, offsets)
+    os.replace(records_tmp, path / RECORDS_FILE)
+    os.replace(offsets_tmp, path / OFFSETS_FILE)
+
+
+def read_records(index: CardIndex, index_directory: str, ids: List[int]) -> Optional[List[Dict]]:
+    """
+    Records for the given rows, reading only their byte ranges.
+    Returns None when there is no store or it does not match the index.
+    """
+    path = Path(index_directory)
+    if not store_exists(index_directory):
+        return None
+    offsets = np.load(path / OFFSETS_FILE, mmap_mode='r')
+    if len(offsets) != len(index) + 1:
+        return None
+
+    records: Dict[int, Dict] = {}
+    with open(path / RECORDS_FILE, 'rb') as f:
+        for row in sorted(set(ids)):
+            f.seek(int(offsets[row]))
+            record = json.loads(f.read(int(offsets[row + 1] - offsets[row])))
+            if (record['folder'], record['filename']) != tuple(index.cards[row]):
+                return None
+            records[row] = record
+    return [records[row] for row in ids]
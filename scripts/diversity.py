@@ -0,0 +1,112 @@
+"""
+Diversity Re-ranking for Card Search
+Maximal marginal relevance (MMR): from a shortlist of candidates, repeatedly
+pick the card that maximizes
+
+    lambda * relevance - (1 - lambda) * max similarity to the cards already picked
+
+so the top results are not five variants of the same series. Pairwise
+similarities of the shortlist come from one small matrix product of the
+stored (unit-length) embeddings. An optional per-folder cap limits how many
+results a single category folder can contribute.
+
+Used by search_cards.py, quick_search.py and search_server.py through
+--mmr LAMBDA and --max-per-folder N.
+"""
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_index import CardIndex
+
+# Configuration
+DEFAULT_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+CANDIDATE_FACTOR = 5  # Shortlist size = CANDIDATE_FACTOR * top_k
+MIN_CANDIDATES = 50
+
+
+def mmr_rerank(index: CardIndex, candidates: List[Tuple[int, float]], top_k: int,
+               mmr_lambda: Optional[float] = None,
+               max_per_folder: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Pick a diverse top_k from candidates.
+
+    Args:
+        index: Card index holding the candidates' embeddings
+        candidates: (row, relevance score) pairs, typically best first
+        top_k: Number of results to return
+        mmr_lambda: Trade-off between relevance (1.0) and diversity (0.0);
+            None keeps relevance order (1.0), so max_per_folder alone only caps folders
+        max_per_folder: Optional cap on results from one category folder
+
+    Returns:
+        Up to top_k (row, relevance score) pairs in MMR order
+    """
+    if not candidates:
+        return []
+    if mmr_lambda is None:
+        mmr_lambda = 1.0
+    rows = np.array([row for row, _ in candidates], dtype=np.int64)
+    relevance = np.array([score for _, score in candidates], dtype=np.float32)
+    diversify = mmr_lambda < 1.0
+    if diversify:
+        vectors = np.asarray(index.embeddings[rows], dtype=np.float32)
+        similarity = vectors @ vectors.T
+
+    folders = [index.cards[row][0] for row in rows]
+    folder_counts: Dict[str, int] = {}
+    available = np.ones(len(rows), dtype=bool)
+    max_similarity = np.full(len(rows), -np.inf, dtype=np.float32)
+
+    selected: List[int] = []
+    while len(selected) < top_k and available.any():
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        mmr = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+
+        selected.append(best)
+        available[best] = False
+        if diversify:
+            max_similarity = np.maximum(max_similarity, similarity[best])
+
+        if max_per_folder:
+            folder = folders[best]
+            folder_counts[folder] = folder_counts.get(folder, 0) + 1
+            if folder_counts[folder] >= max_per_folder:
+                available &= np.array([f != folder for f in folders])
+
+    return [(int(rows[i]), float(relevance[i])) for i in selected]
+
+
+def is_diversified(mmr_lambda: Optional[float], max_per_folder: Optional[int]) -> bool:
+    return mmr_lambda is not None or bool(max_per_folder)
+
+
+def shortlist_size(top_k: int) -> int:
+    """Number of candidates to rank before re-ranking them down to top_k."""
+    return max(top_k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+
+
+def diversified(index: CardIndex, rank: Callable, mmr_lambda: Optional[float] = None,
+                max_per_folder: Optional[int] = None) -> Callable:
+    """
+    Wrap a rank(k, rows) function (see card_index.rank_cards) so it ranks a
+    larger shortlist and returns its MMR re-ranking. Returns rank unchanged
+    when neither mmr_lambda nor max_per_folder is set.
+    """
+    if not is_diversified(mmr_lambda, max_per_folder):
+        return rank
+
+    def rank_diverse(k: int, rows: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        return mmr_rerank(index, rank(shortlist_size(k), rows), k, mmr_lambda, max_per_folder)
+    return rank_diverse
+
+
+def add_diversity_arguments(parser: argparse.ArgumentParser):
+    """--mmr [LAMBDA] / --max-per-folder N options."""
+    parser.add_argument('--mmr', type=float, nargs='?', const=DEFAULT_LAMBDA, metavar='LAMBDA',
+                        help=f'Diversify results with MMR; 1.0 = relevance only, 0.0 = diversity only '
+                             f'(default when given without a value: {DEFAULT_LAMBDA})')
+    parser.add_argument('--max-per-folder', type=int, metavar='N', help='At most N results from one category folder')
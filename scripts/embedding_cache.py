@@ -0,0 +1,198 @@
+"""
+Card Embedding Cache
+Persistent cache of card embeddings keyed by a hash of the embedding model
+and the exact text that was embedded (create_embedding_text() in
+generate_embeddings.py). Re-running generate_embeddings.py only calls the
+API for cards that are new or whose text changed; everything else is
+served from this SQLite file.
+
+Hits are counted with the tokens (estimated) and dollars they saved.
+
+Usage:
+    python scripts/embedding_cache.py stats
+    python scripts/embedding_cache.py clear
+"""
+import hashlib
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from rate_limiter import estimate_tokens
+
+# Configuration
+EMBEDDING_CACHE_PATH = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\SearchIndex\embedding_cache.sqlite"
+PRICE_PER_MILLION_TOKENS = 0.15  # USD per 1M input tokens; check the current price of the embedding model
+
+
+def content_key(model: str, text: str) -> str:
+    """Cache key: SHA-256 of the model name and the embedded text."""
+    return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+
+def dollars(tokens: int, price_per_million: float = PRICE_PER_MILLION_TOKENS) -> float:
+    return tokens * price_per_million / 1_000_000
+
+
+class EmbeddingCache:
+    """SQLite-backed content-hash cache of card embeddings, safe to share between threads."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the cache file on first use. Any failure disables the cache instead of the run."""
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS card_embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    tokens INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Embedding cache disabled ({self.path}): {e}")
+            self._disabled = True
+        return self._conn
+
+    def _count(self, conn: sqlite3.Connection, name: str, amount: int):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def lookup(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embedding for each text, None for misses."""
+        keys = [content_key(model, text) for text in texts]
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return [None] * len(texts)
+            try:
+                found: Dict[str, bytes] = {}
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT key, embedding FROM card_embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    )
+                    found.update(rows)
+                results = [np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+                           for key in keys]
+
+                hits = sum(1 for result in results if result is not None)
+                tokens = sum(estimate_tokens(text) for text, result in zip(texts, results) if result is not None)
+                self.hits += hits
+                self.misses += len(texts) - hits
+                self.tokens_saved += tokens
+                self._count(conn, 'hits', hits)
+                self._count(conn, 'misses', len(texts) - hits)
+                self._count(conn, 'tokens_saved', tokens)
+                conn.commit()
+                return results
+            except sqlite3.Error as e:
+                print(f"⚠️  Embedding cache read failed: {e}")
+                return [None] * len(texts)
+
+    def put(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings for texts (empty embeddings are skipped)."""
+        rows = [(content_key(model, text), model, np.asarray(embedding, dtype=np.float32).tobytes(),
+                 estimate_tokens(text))
+                for text, embedding in zip(texts, embeddings) if len(embedding)]
+        with self._lock:
+            conn = self._connect()
+            if conn is None or not rows:
+                return
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO card_embeddings (key, model, embedding, tokens) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️  Embedding cache write failed: {e}")
+
+    def stats(self, price_per_million: float = PRICE_PER_MILLION_TOKENS) -> Dict:
+        """Session and lifetime hits, misses and savings plus the current entry count."""
+        stats = {
+            'entries': 0,
+            'session_hits': self.hits,
+            'session_misses': self.misses,
+            'session_tokens_saved': self.tokens_saved,
+            'session_dollars_saved': round(dollars(self.tokens_saved, price_per_million), 4),
+            'total_hits': 0,
+            'total_misses': 0,
+            'total_tokens_saved': 0,
+        }
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return stats
+            stats['entries'] = conn.execute("SELECT COUNT(*) FROM card_embeddings").fetchone()[0]
+            for name, value in conn.execute("SELECT name, value FROM counters"):
+                stats[f'total_{name}'] = value
+        stats['total_dollars_saved'] = round(dollars(stats['total_tokens_saved'], price_per_million), 4)
+        return stats
+
+    def clear(self):
+        """Remove all cached embeddings and reset the counters."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute("DELETE FROM card_embeddings")
+            conn.execute("DELETE FROM counters")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the card embedding cache")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--path', default=EMBEDDING_CACHE_PATH, help='SQLite cache file')
+    parser.add_argument('--price', type=float, default=PRICE_PER_MILLION_TOKENS,
+                        help='USD per 1M input tokens, for the savings estimate')
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(args.path)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"✅ Cleared embedding cache: {args.path}")
+        return
+
+    stats = cache.stats(args.price)
+    total = stats['total_hits'] + stats['total_misses']
+    hit_rate = stats['total_hits'] / total * 100 if total else 0.0
+    print(f"Cache:      {args.path}")
+    print(f"Entries:    {stats['entries']}")
+    print(f"Hits:       {stats['total_hits']}")
+    print(f"Misses:     {stats['total_misses']}")
+    print(f"Hit rate:   {hit_rate:.1f}%")
+    print(f"Saved:      ~{stats['total_tokens_saved']} tokens (${stats['total_dollars_saved']:.4f})")
+
+
+if __name__ == "__main__":
+    main()
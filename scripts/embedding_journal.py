@@ -0,0 +1,116 @@
+"""
+Embedding Run Journal
+Checkpoints for generate_embeddings.py so an interrupted run loses none of
+the embeddings it already paid for.
+
+    <folder>/embeddings.journal   one JSON line per completed API batch
+                                  (filename, content key, base64 float32
+                                  vector), flushed and fsynced before the
+                                  next batch is counted as committed
+    <Series>/embedding_run.json   folders whose output files were written
+
+With --resume, folders listed in embedding_run.json are skipped and every
+journaled card whose text is unchanged is restored instead of re-embedded.
+A torn last line (crash while appending) is cut off on resume. A folder's journal is
+deleted once its insidenote.json / embeddings.bin have been written.
+"""
+import os
+import json
+import base64
+import threading
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+# Configuration
+JOURNAL_FILE = "embeddings.journal"
+RUN_FILE = "embedding_run.json"
+
+
+def write_json_atomic(path: Path, data, indent: int = 2):
+    """Write JSON to a temporary file, flush it to disk and rename it over path."""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class BatchJournal:
+    """Append-only log of one folder's completed embedding batches, safe to share between threads."""
+
+    def __init__(self, folder: Path):
+        self.path = Path(folder) / JOURNAL_FILE
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> Dict[str, Tuple[str, List[float]]]:
+        """filename -> (content key, embedding) for every committed card (latest wins)."""
+        entries: Dict[str, Tuple[str, List[float]]] = {}
+        if not self.path.exists():
+            return entries
+        committed = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                for card in record['cards']:
+                    vector = np.frombuffer(base64.b64decode(card['embedding']), dtype='<f4')
+                    entries[card['filename']] = (card['key'], vector.tolist())
+                committed += len(line)
+        if committed < self.path.stat().st_size:
+            # Torn write at the end of an interrupted run: cut it off so new batches start on a clean line
+            with open(self.path, 'r+b') as f:
+                f.truncate(committed)
+        return entries
+
+    def append(self, filenames: List[str], keys: List[str], embeddings: List[List[float]]):
+        """Commit one batch; items without an embedding (failed) are not recorded."""
+        cards = [{'filename': filename, 'key': key,
+                  'embedding': base64.b64encode(np.asarray(embedding, dtype='<f4').tobytes()).decode('ascii')}
+                 for filename, key, embedding in zip(filenames, keys, embeddings) if len(embedding)]
+        if not cards:
+            return
+        line = json.dumps({'cards': cards}) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def discard(self):
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
+
+
+class RunState:
+    """Names of the folders a run has finished, persisted after each one."""
+
+    def __init__(self, main_directory: Path):
+        self.path = Path(main_directory) / RUN_FILE
+        self._lock = threading.Lock()
+        self.completed: Set[str] = set()
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.completed = set(json.load(f).get('completed', []))
+            except (OSError, json.JSONDecodeError, AttributeError):
+                self.completed = set()
+
+    def mark_done(self, folder_name: str):
+        with self._lock:
+            self.completed.add(folder_name)
+            write_json_atomic(self.path, {'completed': sorted(self.completed)})
+
+    def clear(self):
+        with self._lock:
+            self.completed = set()
+            if self.path.exists():
+                self.path.unlink()
@@ -0,0 +1,228 @@
+"""
+Binary Embedding Sidecar
+Card embeddings stored next to insidenote.json in a compact binary file
+instead of as JSON text inside it. float16 rows are about 1/10 the size of
+the pretty-printed floats, load with one read and sync quickly.
+
+File layout (<folder>/embeddings.bin, little-endian):
+    magic        8 bytes  b"SWEMBED1"
+    header      12 bytes  dtype code (u8: 1 = float16, 2 = float32), reserved (u8),
+                          model name length (u16), dimension (u32), count (u32)
+    model name            UTF-8, zero-padded to a multiple of 8 bytes
+    rows                  count x dimension float16 / float32 values
+    filename index        count x (u16 length + UTF-8 filename), same order as the rows
+
+When a folder has a sidecar it is the source of embeddings for the search
+index (card_index.py), generate_embeddings.py, verify_embeddings.py and the
+sw_templates upload scripts; otherwise the "embedding" fields of
+insidenote.json are used. The fix_*_filenames.py scripts rename and drop
+sidecar rows together with the insidenote.json entries they fix.
+
+Usage:
+    python scripts/embedding_sidecar.py info
+    python scripts/embedding_sidecar.py migrate                 # JSON embeddings -> sidecars
+    python scripts/embedding_sidecar.py migrate --dtype float32 --keep-json
+"""
+import os
+import json
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Configuration
+SIDECAR_FILE = "embeddings.bin"
+MAGIC = b"SWEMBED1"
+HEADER = struct.Struct('<BBHII')
+DTYPE_CODES = {'float16': 1, 'float32': 2}
+DEFAULT_DTYPE = 'float16'
+
+
+def sidecar_path(folder: Path) -> Path:
+    return Path(folder) / SIDECAR_FILE
+
+
+class EmbeddingSidecar:
+    """One folder's embeddings: model name, (count, dimension) rows and their filenames."""
+
+    def __init__(self, model: str, filenames: List[str], embeddings: np.ndarray):
+        self.model = model
+        self.filenames = filenames
+        self.embeddings = embeddings  # float16 or float32, one row per filename
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    def vectors(self) -> np.ndarray:
+        """The rows as float32."""
+        return np.asarray(self.embeddings, dtype=np.float32)
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        """filename -> float32 embedding."""
+        return dict(zip(self.filenames, self.vectors()))
+
+    def save(self, folder: Path, dtype: str = DEFAULT_DTYPE):
+        """Write the sidecar, replacing any previous one atomically."""
+        rows = np.ascontiguousarray(self.embeddings, dtype='<' + np.dtype(dtype).str[1:])
+        model = self.model.encode('utf-8')
+        path = sidecar_path(folder)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(DTYPE_CODES[dtype], 0, len(model), self.dimension, len(self)))
+            f.write(model + b'\0' * (-len(model) % 8))
+            f.write(rows.tobytes())
+            for filename in self.filenames:
+                name = filename.encode('utf-8')
+                f.write(struct.pack('<H', len(name)) + name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, folder: Path) -> Optional['EmbeddingSidecar']:
+        """Read a folder's sidecar, or None if it has none."""
+        path = sidecar_path(folder)
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an embedding sidecar")
+
+        dtype_code, _, model_length, dimension, count = HEADER.unpack_from(data, len(MAGIC))
+        dtype = {code: name for name, code in DTYPE_CODES.items()}[dtype_code]
+        offset = len(MAGIC) + HEADER.size
+        model = data[offset:offset + model_length].decode('utf-8')
+        offset += model_length + (-model_length % 8)
+
+        embeddings = np.frombuffer(data, dtype='<' + np.dtype(dtype).str[1:], count=count * dimension,
+                                   offset=offset).reshape(count, dimension)
+        offset += embeddings.nbytes
+        filenames = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('<H', data, offset)
+            filenames.append(data[offset + 2:offset + 2 + length].decode('utf-8'))
+            offset += 2 + length
+        return cls(model, filenames, embeddings)
+
+
+def card_embedding(filename: str, insidenote: Dict, sidecar_vectors: Dict[str, np.ndarray]) -> List[float]:
+    """
+    A card's embedding from its folder's sidecar vectors (EmbeddingSidecar.as_dict()),
+    falling back to the "embedding" field of its insidenote.json entry.
+    """
+    if filename in sidecar_vectors:
+        return sidecar_vectors[filename].tolist()
+    return insidenote.get('embedding', [])
+
+
+def rename_sidecar_cards(folder: Path, renames: Dict[str, str], removals=()) -> int:
+    """
+    Apply insidenote.json filename fixes to the folder's sidecar, so its rows
+    keep joining to their cards: rename rows in renames (old -> new) and drop
+    rows in removals. Returns the number of rows changed.
+    """
+    sidecar = EmbeddingSidecar.load(folder)
+    if sidecar is None:
+        return 0
+    removals = set(removals)
+    changed = sum(1 for filename in sidecar.filenames if filename in renames or filename in removals)
+    if not changed:
+        return 0
+
+    vectors: Dict[str, np.ndarray] = {}
+    for filename, row in zip(sidecar.filenames, sidecar.embeddings):
+        if filename not in removals:
+            vectors[renames.get(filename, filename)] = row
+    rows = np.array(list(vectors.values()), dtype=sidecar.embeddings.dtype).reshape(len(vectors), sidecar.dimension)
+    EmbeddingSidecar(sidecar.model, list(vectors), rows).save(folder, sidecar.embeddings.dtype.name)
+    return changed
+
+
+def strip_json_embeddings(insidenote_path: Path) -> int:
+    """Remove the "embedding" fields from an insidenote.json, keeping its format. Returns how many."""
+    with open(insidenote_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    cards = data['cards'] if isinstance(data, dict) and 'cards' in data else data
+    cards = cards if isinstance(cards, list) else [cards]
+    removed = sum(1 for card in cards if card.pop('embedding', None) is not None)
+    if removed:
+        tmp = insidenote_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, insidenote_path)
+    return removed
+
+
+def migrate_folder(folder: Path, model: str, dtype: str = DEFAULT_DTYPE, keep_json: bool = False) -> int:
+    """
+    Move a folder's insidenote.json embeddings into its sidecar. Vectors
+    already in the sidecar are kept unless the JSON has one for the same card.
+    Returns the number of embeddings written.
+    """
+    from insidenote_stream import read_embeddings
+
+    insidenote_path = folder / "insidenote.json"
+    if not insidenote_path.exists():
+        return 0
+    rows, filenames = read_embeddings(insidenote_path, label=folder.name)
+    if not filenames:
+        return 0
+
+    existing = EmbeddingSidecar.load(folder)
+    merged = existing.as_dict() if existing else {}
+    if existing and existing.dimension != rows.shape[1]:
+        merged = {}
+    merged.update(zip(filenames, rows))
+    EmbeddingSidecar(model, list(merged), np.array(list(merged.values()), dtype=np.float32)).save(folder, dtype)
+    if not keep_json:
+        strip_json_embeddings(insidenote_path)
+    return len(filenames)
+
+
+def main():
+    from card_index import CARDS_DIRECTORY, EMBEDDING_MODEL, list_card_folders
+
+    parser = argparse.ArgumentParser(description="Inspect card embedding sidecars and migrate JSON embeddings")
+    parser.add_argument('command', choices=['info', 'migrate'])
+    parser.add_argument('--cards-dir', default=CARDS_DIRECTORY, help='Folder with one subfolder per card category')
+    parser.add_argument('--model', default=EMBEDDING_MODEL, help='Embedding model recorded in migrated sidecars')
+    parser.add_argument('--dtype', choices=list(DTYPE_CODES), default=DEFAULT_DTYPE, help='Row storage type')
+    parser.add_argument('--keep-json', action='store_true', help='Leave the embeddings in insidenote.json too')
+    args = parser.parse_args()
+
+    if not Path(args.cards_dir).exists():
+        print(f"❌ Directory not found: {args.cards_dir}")
+        return
+
+    if args.command == 'info':
+        for folder in list_card_folders(args.cards_dir):
+            sidecar = EmbeddingSidecar.load(folder)
+            json_mb = (folder / "insidenote.json").stat().st_size / (1024 * 1024) \
+                if (folder / "insidenote.json").exists() else 0.0
+            if sidecar is None:
+                print(f"📁 {folder.name}: no sidecar (insidenote.json {json_mb:.2f} MB)")
+                continue
+            sidecar_mb = sidecar_path(folder).stat().st_size / (1024 * 1024)
+            print(f"📁 {folder.name}: {len(sidecar)} x {sidecar.dimension} {sidecar.embeddings.dtype} "
+                  f"({sidecar.model}), {sidecar_mb:.2f} MB sidecar, insidenote.json {json_mb:.2f} MB")
+        return
+
+    total = 0
+    for folder in list_card_folders(args.cards_dir):
+        count = migrate_folder(folder, args.model, args.dtype, args.keep_json)
+        if count:
+            print(f"✅ {folder.name}: {count} embeddings -> {SIDECAR_FILE}")
+        total += count
+    print(f"✅ Migrated {total} embeddings")
+
+
+if __name__ == "__main__":
+    main()
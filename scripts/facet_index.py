@@ -0,0 +1,203 @@
+"""
+Facet Index for Filtered Card Search
+One sorted row-id list per occasion / recipient / emotion / style / folder
+value, built from the cards' metadata.json fields and aligned to the card
+search index rows. Filters are resolved to a row subset (union within a
+field, intersection across fields) before any vector scoring, so "birthday
+for mom" only scores the matching cards instead of the whole catalog.
+
+The lists are stored CSR-style (one offsets array and one row-id array per
+field) in facets.npz next to the search index, so the index grows with the
+number of (card, value) pairs, not values x cards. Free-text values longer
+than MAX_VALUE_WORDS words (e.g. the sentence-long occasion written by
+generate_card_metadata.py) are indexed by their words instead of as a value
+of their own.
+
+A filter value matches every facet value that contains it (case-insensitive),
+the same rule as card_index.matches_filters. A multi-word filter also matches
+cards that have each of its words, which is how it finds free-text values.
+
+Usage:
+    python scripts/facet_index.py build
+    python scripts/facet_index.py info
+    python scripts/facet_index.py count --occasion birthday --recipient mom
+"""
+import json
+import argparse
+from functools import reduce
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from card_index import CardIndex, INDEX_DIRECTORY, FILTER_FIELDS, load_card_records, newest_card_file_mtime
+from bm25_index import tokenize
+
+# Configuration
+FACETS_FILE = "facets.npz"
+MAX_VALUE_WORDS = 4  # Longer (free-text) values are indexed by their words
+
+
+def facet_values(value) -> List[str]:
+    """
+    Normalized facet values of a metadata field (lists give one value per
+    item). Values longer than MAX_VALUE_WORDS words give their words instead.
+    """
+    values = value if isinstance(value, list) else [value]
+    result = []
+    for v in values:
+        text = str(v or '').strip().lower()
+        if len(text.split()) > MAX_VALUE_WORDS:
+            result.extend(tokenize(text))
+        elif text:
+            result.append(text)
+    return list(dict.fromkeys(result))
+
+
+class FacetIndex:
+    """Per-field sorted value lists plus the ascending row ids of each value (CSR layout)."""
+
+    def __init__(self, index: CardIndex, values: Dict[str, List[str]], offsets: Dict[str, np.ndarray],
+                 postings: Dict[str, np.ndarray]):
+        self.index = index
+        self.values = values      # field -> facet values
+        self.offsets = offsets    # field -> value i owns postings[field][offsets[i]:offsets[i + 1]]
+        self.postings = postings  # field -> int32 row ids
+
+    @classmethod
+    def build(cls, index: CardIndex) -> 'FacetIndex':
+        """Collect the rows of every (field, value) from the card records."""
+        members: Dict[str, Dict[str, List[int]]] = {field: {} for field in FILTER_FIELDS}
+        for row, record in enumerate(load_card_records(index, list(range(len(index))))):
+            members['folder'].setdefault(record['folder'].lower(), []).append(row)
+            for field in FILTER_FIELDS:
+                if field == 'folder':
+                    continue
+                for value in facet_values(record.get(field)):
+                    members[field].setdefault(value, []).append(row)
+
+        values, offsets, postings = {}, {}, {}
+        for field in FILTER_FIELDS:
+            values[field] = sorted(members[field])
+            lengths = [len(members[field][value]) for value in values[field]]
+            offsets[field] = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+            postings[field] = np.fromiter((row for value in values[field] for row in members[field][value]),
+                                          dtype=np.int32, count=int(offsets[field][-1]))
+        return cls(index, values, offsets, postings)
+
+    def _union(self, field: str, matching: List[int]) -> np.ndarray:
+        """Ascending row ids having any of the listed values of field."""
+        offsets, postings = self.offsets[field], self.postings[field]
+        if not matching:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([postings[offsets[i]:offsets[i + 1]] for i in matching])).astype(np.int64)
+
+    def field_rows(self, field: str, wanted: str) -> np.ndarray:
+        """
+        Ascending row ids with a value of field containing wanted, or (for a
+        multi-word wanted) values containing each of its words.
+        """
+        wanted = str(wanted).strip().lower()
+        values = self.values[field]
+        rows = self._union(field, [i for i, value in enumerate(values) if wanted in value])
+        words = tokenize(wanted)
+        if len(wanted.split()) > 1 and words:
+            word_rows = [self._union(field, [i for i, value in enumerate(values) if word in value]) for word in words]
+            rows = np.union1d(rows, reduce(np.intersect1d, word_rows))
+        return rows
+
+    def rows(self, filters: Dict[str, str]) -> Optional[np.ndarray]:
+        """
+        Row ids matching every filter, in ascending order.
+        Returns None when no filter is set (all rows match).
+        """
+        rows = None
+        for field, wanted in filters.items():
+            if not wanted or field not in self.values:
+                continue
+            field_rows = self.field_rows(field, wanted)
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+        return rows
+
+    def counts(self, field: str) -> Dict[str, int]:
+        """Number of cards per value of field."""
+        return dict(zip(self.values[field], np.diff(self.offsets[field]).tolist()))
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / FACETS_FILE
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, values=json.dumps(self.values, ensure_ascii=False), fingerprint=self.index.fingerprint(),
+                     **{f"offsets_{field}": offsets for field, offsets in self.offsets.items()},
+                     **{f"postings_{field}": postings for field, postings in self.postings.items()})
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> Optional['FacetIndex']:
+        """
+        Load the saved facet index, or None if missing, built for a different
+        catalog, saved in the old bitmap format, or older than a card's
+        metadata.json / insidenote.json.
+        """
+        path = Path(index_directory) / FACETS_FILE
+        if not path.exists() or path.stat().st_mtime_ns < newest_card_file_mtime(index.cards_directory):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint() or 'postings_folder' not in data.files:
+                return None
+            values = json.loads(str(data['values']))
+            return cls(index, values, {field: data[f"offsets_{field}"] for field in values},
+                       {field: data[f"postings_{field}"] for field in values})
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'FacetIndex':
+        """Load the facet index, building and saving it when missing or stale."""
+        facets = cls.load(index, index_directory)
+        if facets is None:
+            print("🔄 Building facet index...")
+            facets = cls.build(index)
+            facets.save(index_directory)
+        return facets
+
+
+def add_filter_arguments(parser: argparse.ArgumentParser):
+    """--occasion / --recipient / --emotion / --style / --folder options."""
+    for field in FILTER_FIELDS:
+        parser.add_argument(f'--{field}', metavar='VALUE', help=f'Only cards whose {field} contains VALUE')
+
+
+def filters_from_args(args: argparse.Namespace) -> Dict[str, str]:
+    return {field: getattr(args, field) for field in FILTER_FIELDS if getattr(args, field, None)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect the card facet index")
+    parser.add_argument('command', choices=['build', 'info', 'count'])
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        facets = FacetIndex.build(index)
+        facets.save(args.index_dir)
+        sizes = ', '.join(f"{len(facets.values[field])} {field}" for field in FILTER_FIELDS)
+        print(f"✅ Built facet index over {len(index)} cards: {sizes} values")
+        return
+
+    facets = FacetIndex.open(index, args.index_dir)
+    if args.command == 'info':
+        print(json.dumps({field: facets.counts(field) for field in FILTER_FIELDS}, indent=2, ensure_ascii=False))
+        return
+
+    filters = filters_from_args(args)
+    rows = facets.rows(filters)
+    print(f"{len(index) if rows is None else len(rows)} of {len(index)} cards match {filters or 'no filters'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ import argparse
 from pathlib import Path
 from typing import Dict, List, Set
 
+from embedding_sidecar import SIDECAR_FILE, rename_sidecar_cards
+
 # Configuration
 CARDS_DIRECTORY = Path(r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series")
 
@@ -200,6 +202,11 @@ def fix_folder(folder_name: str, dry_run: bool = True) -> bool:
                 else:
                     json.dump(updated, f, indent=2, ensure_ascii=False)
             print(f"   ✅ Updated insidenote.json ({len(insidenote_list)} → {len(updated)} entries)")
+            
+            # Keep the binary embeddings joined to the renamed cards
+            changed = rename_sidecar_cards(folder, insidenote_corrections, insidenote_removals)
+            if changed:
+                print(f"   ✅ Updated {SIDECAR_FILE} ({changed} rows renamed or removed)")
         
         print(f"   ✅ All fixes applied!")
         return True
@@ -18,6 +18,8 @@ from pathlib import Path
 from typing import Dict, List, Tuple, Set
 import argparse
 
+from embedding_sidecar import SIDECAR_FILE, rename_sidecar_cards
+
 # Configuration
 THANKYOU_FOLDER = Path(r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series\Thankyou")
 
@@ -258,6 +260,11 @@ def fix_filenames(folder: Path, dry_run: bool = True) -> bool:
                     json.dump(cleaned_insidenote, f, indent=2, ensure_ascii=False)
             
             print("✅ Updated insidenote.json")
+            
+            # Drop the removed cards' rows from the binary embeddings too
+            changed = rename_sidecar_cards(folder, {}, to_remove_insidenote)
+            if changed:
+                print(f"✅ Updated {SIDECAR_FILE} ({changed} rows removed)")
         
         print(f"\n{'='*80}")
         print("✅ All fixes applied successfully!")
@@ -14,6 +14,8 @@ from pathlib import Path
 from typing import Dict, List, Tuple
 import argparse
 
+from embedding_sidecar import SIDECAR_FILE, rename_sidecar_cards
+
 # Configuration
 THANKYOU_FOLDER = Path(r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series\Thankyou")
 
@@ -233,6 +235,11 @@ def analyze_and_fix(folder: Path, dry_run: bool = True) -> bool:
             print(f"   Corrected: {len(insidenote_corrections)}")
             print(f"   Removed: {len(insidenote_removals)}")
             print(f"   Final count: {len(updated_insidenote)}")
+            
+            # Keep the binary embeddings joined to the renamed cards
+            changed = rename_sidecar_cards(folder, insidenote_corrections, insidenote_removals)
+            if changed:
+                print(f"✅ Updated {SIDECAR_FILE} ({changed} rows renamed or removed)")
         
         print(f"\n{'='*80}")
         print("✅ All fixes applied successfully!")
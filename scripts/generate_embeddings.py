@@ -1,11 +1,19 @@
 import os
 import json
-import time
+import argparse
 import google.generativeai as genai
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import logging
 
+import numpy as np
+
+from embedding_sidecar import SIDECAR_FILE, DTYPE_CODES, DEFAULT_DTYPE, EmbeddingSidecar
+from rate_limiter import RateLimiter, estimate_tokens
+from embedding_cache import EmbeddingCache, content_key
+from embedding_journal import BatchJournal, RunState, write_json_atomic
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,8 +33,23 @@ genai.configure(api_key=API_KEY)
 
 # Configuration
 MAIN_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series"
-BATCH_SIZE = 20  # Number of embeddings per API call
+BATCH_SIZE = 100  # Max texts per embedding API call (API limit)
+MAX_BATCH_CHARACTERS = 200000  # Max total text per API call
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 6  # Attempts per request for rate-limit / server / network errors
+WORKERS = 8  # Concurrent embedding requests
+FOLDER_WORKERS = 4  # Folders prepared and written concurrently
+REQUESTS_PER_MINUTE = 300  # Set to the project's embedding quota
+TOKENS_PER_MINUTE = 1000000
 EMBEDDING_MODEL = "models/embedding-001"
+OUTPUT_FORMATS = ['sidecar', 'json']  # sidecar: binary embeddings.bin, json: "embedding" fields in insidenote.json
+
+# Shared by every request thread (configured in main)
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+request_pool: Optional[ThreadPoolExecutor] = None
+
+# Cards whose embedding text is unchanged are served from here without an API call
+embedding_cache: Optional[EmbeddingCache] = EmbeddingCache()
 
 
 def create_embedding_text(metadata: Dict, inside_note: str) -> str:
@@ -79,85 +102,139 @@ def create_embedding_text(metadata: Dict, inside_note: str) -> str:
     return '\n'.join(parts)
 
 
-def generate_embedding_single(text: str, retry_count: int = 3) -> List[float]:
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and network failures are retried; rejected requests are not."""
+    if isinstance(error, ValueError):
+        return False
+    code = getattr(error, 'code', None)
+    return not isinstance(code, int) or code in RETRYABLE_STATUS_CODES
+
+
+def embed_request(texts: List[str], retry_count: int = MAX_ATTEMPTS) -> List[List[float]]:
     """
-    Generate embedding for a single text using Google Gemini API.
+    Embed texts with one API call, paced by the shared rate limiter.
+    Transient errors slow the limiter down and pause all requests before the retry.
     
     Args:
-        text: Text string to embed
-        retry_count: Number of retries on failure
+        texts: Text strings to embed (at most BATCH_SIZE)
+        retry_count: Number of attempts for transient errors
     
     Returns:
-        Embedding vector or empty list on failure
+        One embedding vector per text
+    
+    Raises:
+        Exception: The API error, or ValueError if the response does not match the request
     """
+    tokens = sum(estimate_tokens(text) for text in texts)
     for attempt in range(retry_count):
+        rate_limiter.acquire(tokens)
         try:
-            response = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=text
-            )
-            
-            # Handle response
-            if isinstance(response, dict) and 'embedding' in response:
-                return response['embedding']
-            else:
-                logger.warning(f"Unexpected response format: {type(response)}")
-                logger.error(f"Could not extract embedding from response")
-                return []
-            
+            response = genai.embed_content(model=EMBEDDING_MODEL, content=texts)
+            embeddings = response['embedding'] if isinstance(response, dict) and 'embedding' in response else []
+            if len(embeddings) != len(texts) or not all(embeddings):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            rate_limiter.succeeded()
+            return embeddings
         except Exception as e:
-            logger.error(f"Error generating embedding (attempt {attempt + 1}/{retry_count}): {e}")
-            if attempt < retry_count - 1:
-                # Exponential backoff
-                wait_time = (2 ** attempt) * 1
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"Failed to generate embedding after {retry_count} attempts")
-                return []
-    
+            if attempt == retry_count - 1 or not is_retryable(e):
+                raise
+            wait_time = rate_limiter.throttled()
+            logger.warning(f"Embedding request failed (attempt {attempt + 1}/{retry_count}): {e}. "
+                           f"Backing off {wait_time:.1f} seconds at {rate_limiter.rate_factor:.0%} of the rate limit...")
     return []
 
 
 def generate_embeddings_batch(texts: List[str]) -> List[List[float]]:
     """
-    Generate embeddings for multiple texts by calling API individually for each.
+    Generate embeddings for multiple texts with one API call.
+    
+    A failed call is split in halves and retried, so a card the API rejects
+    only fails itself instead of the whole batch.
     
     Args:
-        texts: List of text strings to embed
+        texts: List of text strings to embed (one request's worth, see make_batches)
     
     Returns:
-        List of embedding vectors
+        One embedding vector per text, an empty list for texts that failed
     """
-    embeddings = []
-    for i, text in enumerate(texts):
-        embedding = generate_embedding_single(text)
-        if embedding:
-            embeddings.append(embedding)
-        else:
-            logger.error(f"Failed to generate embedding for item {i+1}/{len(texts)}")
-            # Return empty list to signal failure
-            return []
-        
-        # Small delay between individual requests to avoid rate limiting
-        if i < len(texts) - 1:  # Don't delay after last item
-            time.sleep(0.1)
+    if not texts:
+        return []
+    try:
+        return embed_request(texts)
+    except Exception as e:
+        if len(texts) == 1:
+            logger.error(f"Failed to generate embedding: {e}")
+            return [[]]
+        logger.warning(f"Batch of {len(texts)} failed ({e}), splitting it to isolate the failing items")
+        middle = len(texts) // 2
+        return generate_embeddings_batch(texts[:middle]) + generate_embeddings_batch(texts[middle:])
+
+
+def embed_batches(batches: List[List[Dict]],
+                  commit: Optional[Callable[[List[Dict], List[List[float]]], None]] = None
+                  ) -> Iterator[List[List[float]]]:
+    """
+    Embed batches concurrently on the request pool, yielding each batch's embeddings in order.
     
-    return embeddings
+    commit(batch, embeddings) runs on the request thread as soon as a batch
+    returns, so finished batches are checkpointed even if the run is
+    interrupted before they are yielded.
+    """
+    def embed(batch: List[Dict]) -> List[List[float]]:
+        embeddings = generate_embeddings_batch([item['text'] for item in batch])
+        if commit is not None:
+            commit(batch, embeddings)
+        return embeddings
+    
+    if request_pool is None:
+        for batch in batches:
+            yield embed(batch)
+        return
+    futures = [request_pool.submit(embed, batch) for batch in batches]
+    for future in futures:
+        yield future.result()
+
 
+def make_batches(items: List[Dict]) -> List[List[Dict]]:
+    """Split items into API requests of at most BATCH_SIZE texts and MAX_BATCH_CHARACTERS characters."""
+    batches: List[List[Dict]] = []
+    batch: List[Dict] = []
+    characters = 0
+    for item in items:
+        if batch and (len(batch) == BATCH_SIZE or characters + len(item['text']) > MAX_BATCH_CHARACTERS):
+            batches.append(batch)
+            batch, characters = [], 0
+        batch.append(item)
+        characters += len(item['text'])
+    if batch:
+        batches.append(batch)
+    return batches
 
-def process_folder(folder_path: Path) -> Tuple[int, int]:
+
+def process_folder(folder_path: Path, output_format: str = 'sidecar',
+                   dtype: str = DEFAULT_DTYPE, resume: bool = False) -> Tuple[int, int]:
     """
     Process a single folder containing metadata.json and insidenote.json.
     
+    Every finished API batch is appended to the folder's embeddings.journal
+    (see embedding_journal.py); the journal is deleted once the output has
+    been written.
+    
     Args:
         folder_path: Path to the folder to process
+        output_format: 'sidecar' writes the embeddings to embeddings.bin (see
+            embedding_sidecar.py), 'json' into insidenote.json
+        dtype: Sidecar row type, 'float16' or 'float32'
+        resume: Restore cards journaled by an interrupted run instead of
+            starting the folder over
     
     Returns:
         Tuple of (successful_count, failed_count)
     """
     metadata_path = folder_path / "metadata.json"
     insidenote_path = folder_path / "insidenote.json"
+    journal = BatchJournal(folder_path)
+    logger.info(f"Processing folder: {folder_path.name}")
     
     # Check if both files exist
     if not metadata_path.exists() or not insidenote_path.exists():
@@ -186,6 +263,16 @@ def process_folder(folder_path: Path) -> Tuple[int, int]:
         metadata_map = {item['filename']: item for item in metadata_list}
         insidenote_map = {item['filename']: item for item in insidenote_list}
         
+        # Sidecar output starts from the vectors already stored (sidecar, then
+        # any left in insidenote.json), so cards that fail keep their old embedding
+        vectors: Dict[str, List[float]] = {}
+        if output_format == 'sidecar':
+            existing = EmbeddingSidecar.load(folder_path)
+            if existing is not None:
+                vectors.update(existing.as_dict())
+            vectors.update((entry['filename'], entry['embedding'])
+                           for entry in insidenote_list if entry.get('embedding'))
+        
         # Prepare batch data
         batch_data = []
         
@@ -199,10 +286,14 @@ def process_folder(folder_path: Path) -> Tuple[int, int]:
             
             # Create embedding text
             embedding_text = create_embedding_text(metadata, inside_note)
+            if not embedding_text.strip():
+                logger.warning(f"No text to embed for {filename} in {folder_path.name}")
+                continue
             
             batch_data.append({
                 'filename': filename,
-                'text': embedding_text
+                'text': embedding_text,
+                'key': content_key(EMBEDDING_MODEL, embedding_text)
             })
         
         if not batch_data:
@@ -213,54 +304,112 @@ def process_folder(folder_path: Path) -> Tuple[int, int]:
         successful = 0
         failed = 0
         
-        for i in range(0, len(batch_data), BATCH_SIZE):
-            batch = batch_data[i:i + BATCH_SIZE]
-            texts = [item['text'] for item in batch]
-            
-            logger.info(f"Processing batch {i//BATCH_SIZE + 1} ({len(batch)} items) in {folder_path.name}")
-            
-            embeddings = generate_embeddings_batch(texts)
-            
-            if len(embeddings) != len(batch):
-                logger.error(f"Embedding count mismatch: expected {len(batch)}, got {len(embeddings)}")
-                failed += len(batch)
-                continue
+        def store(filename: str, embedding: List[float]):
+            if output_format == 'sidecar':
+                vectors[filename] = embedding
+            else:
+                insidenote_map[filename]['embedding'] = embedding
+        
+        # Cards embedded before an interruption come back from the journal (if their text is unchanged)
+        if resume and journal.exists():
+            journaled = journal.load()
+            restored = {item['filename'] for item in batch_data
+                        if journaled.get(item['filename'], ('',))[0] == item['key']}
+            for filename in restored:
+                store(filename, journaled[filename][1])
+            successful += len(restored)
+            batch_data = [item for item in batch_data if item['filename'] not in restored]
+            logger.info(f"Resumed {len(restored)} cards from {journal.path.name} in {folder_path.name}")
+        else:
+            journal.discard()
+        
+        # Cards with unchanged text reuse their cached embedding
+        if embedding_cache is not None:
+            cached = embedding_cache.lookup(EMBEDDING_MODEL, [item['text'] for item in batch_data])
+            hits = 0
+            for item, embedding in zip(batch_data, cached):
+                if embedding is not None:
+                    store(item['filename'], embedding)
+                    hits += 1
+            successful += hits
+            batch_data = [item for item, embedding in zip(batch_data, cached) if embedding is None]
+            logger.info(f"{hits} cards unchanged (cached), {len(batch_data)} to embed in {folder_path.name}")
+        
+        def commit(batch: List[Dict], embeddings: List[List[float]]):
+            journal.append([item['filename'] for item in batch], [item['key'] for item in batch], embeddings)
+            if embedding_cache is not None:
+                embedding_cache.put(EMBEDDING_MODEL, [item['text'] for item in batch], embeddings)
+        
+        batches = make_batches(batch_data)
+        for batch_number, (batch, embeddings) in enumerate(zip(batches, embed_batches(batches, commit)), 1):
+            logger.info(f"Embedded batch {batch_number}/{len(batches)} ({len(batch)} items) in {folder_path.name}")
             
-            # Update insidenote entries with embeddings
-            for j, item in enumerate(batch):
+            # Update insidenote entries with embeddings; failed items keep their old one
+            for item, embedding in zip(batch, embeddings):
                 filename = item['filename']
-                embedding = embeddings[j]
+                if not embedding:
+                    logger.error(f"Failed to generate embedding for {filename} in {folder_path.name}")
+                    failed += 1
+                    continue
                 
-                # Find and update the entry in insidenote_list
-                for entry in insidenote_list:
-                    if entry['filename'] == filename:
-                        entry['embedding'] = embedding
-                        successful += 1
-                        break
+                store(filename, embedding)
+                successful += 1
+        
+        if output_format == 'sidecar':
+            # Rows follow the insidenote.json order
+            filenames = [entry['filename'] for entry in insidenote_list if entry['filename'] in vectors]
+            if filenames:
+                rows = np.array([vectors[filename] for filename in filenames], dtype=np.float32)
+                EmbeddingSidecar(EMBEDDING_MODEL, filenames, rows).save(folder_path, dtype)
             
-            # Small delay to avoid rate limiting
-            time.sleep(0.5)
+            # The sidecar replaces JSON embeddings; only rewrite insidenote.json to drop old ones
+            if not any('embedding' in entry for entry in insidenote_list):
+                journal.discard()
+                logger.info(f"✅ Completed {folder_path.name}: {successful} embeddings written to {SIDECAR_FILE}")
+                return (successful, failed)
+            for entry in insidenote_list:
+                entry.pop('embedding', None)
         
-        # Save updated insidenote.json (preserve original format)
-        with open(insidenote_path, 'w', encoding='utf-8') as f:
-            if isinstance(insidenote_data, dict) and 'cards' in insidenote_data:
-                # Preserve the {"cards": [...]} format
-                insidenote_data['cards'] = insidenote_list
-                json.dump(insidenote_data, f, indent=2, ensure_ascii=False)
-            else:
-                # Direct array format
-                json.dump(insidenote_list, f, indent=2, ensure_ascii=False)
+        # Save updated insidenote.json (preserve original format) via a temp file,
+        # so an interrupted write never leaves it truncated
+        if isinstance(insidenote_data, dict) and 'cards' in insidenote_data:
+            # Preserve the {"cards": [...]} format
+            insidenote_data['cards'] = insidenote_list
+            write_json_atomic(insidenote_path, insidenote_data)
+        else:
+            # Direct array format
+            write_json_atomic(insidenote_path, insidenote_list)
+        journal.discard()
         
         logger.info(f"✅ Completed {folder_path.name}: {successful} embeddings added")
         return (successful, failed)
         
+    except CancelledError:
+        # Run interrupted: committed batches stay in the journal for --resume
+        logger.warning(f"Stopped {folder_path.name} before it finished")
+        return (0, len(insidenote_list))
     except Exception as e:
         logger.error(f"Error processing {folder_path.name}: {e}")
         return (0, len(insidenote_list) if 'insidenote_list' in locals() else 0)
 
 
-def main():
-    """Main function to process all folders."""
+def main(output_format: str = 'sidecar', dtype: str = DEFAULT_DTYPE, workers: int = WORKERS,
+         requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+         use_cache: bool = True, resume: bool = False):
+    """
+    Main function to process all folders.
+    
+    Folders are processed FOLDER_WORKERS at a time and their batches are sent
+    by `workers` request threads, all paced by one shared rate limiter.
+    With use_cache, cards whose embedding text has not changed since an
+    earlier run are not sent to the API (see embedding_cache.py).
+    With resume, an interrupted run continues from its last committed batch:
+    finished folders are skipped and journaled cards are not re-embedded
+    (see embedding_journal.py).
+    """
+    global rate_limiter, request_pool, embedding_cache
+    if not use_cache:
+        embedding_cache = None
     main_path = Path(MAIN_DIRECTORY)
     
     if not main_path.exists():
@@ -270,6 +419,13 @@ def main():
     # Get all subdirectories
     subdirs = [d for d in main_path.iterdir() if d.is_dir()]
     
+    run_state = RunState(main_path)
+    if not resume:
+        run_state.clear()
+    elif run_state.completed:
+        logger.info(f"Resuming: skipping {len(run_state.completed)} folders finished by the interrupted run")
+        subdirs = [d for d in subdirs if d.name not in run_state.completed]
+    
     logger.info(f"Found {len(subdirs)} folders to process")
     logger.info("=" * 70)
     
@@ -277,14 +433,36 @@ def main():
     total_successful = 0
     total_failed = 0
     
-    for subdir in subdirs:
-        logger.info(f"\nProcessing folder: {subdir.name}")
-        successful, failed = process_folder(subdir)
-        
-        if successful > 0 or failed > 0:
-            total_folders += 1
-            total_successful += successful
-            total_failed += failed
+    def run_folder(subdir: Path) -> Tuple[int, int]:
+        successful, failed = process_folder(subdir, output_format, dtype, resume)
+        if failed == 0:
+            run_state.mark_done(subdir.name)
+        return (successful, failed)
+    
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    interrupted = False
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=FOLDER_WORKERS) as folders:
+        request_pool = pool
+        try:
+            for successful, failed in folders.map(run_folder, subdirs):
+                if successful > 0 or failed > 0:
+                    total_folders += 1
+                    total_successful += successful
+                    total_failed += failed
+        except KeyboardInterrupt:
+            # Drop queued work; requests already sent finish and are journaled before exit
+            interrupted = True
+            logger.warning("⚠️  Interrupted - waiting for in-flight requests to be journaled...")
+            folders.shutdown(wait=False, cancel_futures=True)
+            pool.shutdown(wait=False, cancel_futures=True)
+        request_pool = None
+    
+    if interrupted:
+        logger.warning("⏸️  Stopped. Run again with --resume to continue from the last committed batch.")
+        return
+    if total_failed == 0:
+        run_state.clear()
+    throughput = rate_limiter.stats(total_successful)
     
     # Final summary
     logger.info("\n" + "=" * 70)
@@ -294,9 +472,35 @@ def main():
     logger.info(f"✅ Successfully added embeddings to {total_successful} cards")
     if total_failed > 0:
         logger.info(f"❌ Failed to process {total_failed} cards")
+    logger.info(f"⚡ {throughput['seconds']}s, {throughput['items_per_second']} cards/s, "
+                f"{throughput['requests']} requests ({throughput['requests_per_minute']}/min), "
+                f"~{throughput['tokens_per_minute']} tokens/min, throttled {throughput['throttled']} times")
+    if embedding_cache is not None:
+        cache_stats = embedding_cache.stats()
+        logger.info(f"💾 Embedding cache: {cache_stats['session_hits']} hits, {cache_stats['session_misses']} misses, "
+                    f"saved ~{cache_stats['session_tokens_saved']} tokens "
+                    f"(${cache_stats['session_dollars_saved']:.4f})")
     logger.info("=" * 70)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate card embeddings with Google Gemini")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='sidecar',
+                        help='sidecar: binary embeddings.bin per folder (default), json: inside insidenote.json')
+    parser.add_argument('--dtype', choices=list(DTYPE_CODES), default=DEFAULT_DTYPE,
+                        help='Sidecar row type (default: float16)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help=f'Concurrent API requests (default: {WORKERS})')
+    parser.add_argument('--rpm', type=float, default=REQUESTS_PER_MINUTE,
+                        help=f'Requests per minute limit (default: {REQUESTS_PER_MINUTE})')
+    parser.add_argument('--tpm', type=float, default=TOKENS_PER_MINUTE,
+                        help=f'Estimated tokens per minute limit (default: {TOKENS_PER_MINUTE})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-embed every card instead of reusing cached embeddings of unchanged text')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last committed batch')
+    args = parser.parse_args()
+    
+    main(output_format=args.format, dtype=args.dtype, workers=args.workers,
+         requests_per_minute=args.rpm, tokens_per_minute=args.tpm, use_cache=not args.no_cache,
+         resume=args.resume)
 
@@ -0,0 +1,418 @@
+"""
+HNSW Graph Index for Card Search
+Hierarchical Navigable Small World graph for low-latency, high-recall
+approximate search, in pure Python/NumPy. Each card is a node linked to its
+M nearest neighbours on every layer it belongs to; a query descends the
+sparse upper layers greedily and then runs a best-first search of width
+efSearch on the bottom layer.
+
+Nodes are keyed by (folder, filename), so when new cards get embeddings and
+the card index is rebuilt, the saved graph is reopened and only the new
+cards are inserted. Cards that disappeared from the catalog stay in the
+graph for navigation but are never returned.
+
+Usage:
+    python scripts/hnsw_index.py build --m 16 --ef-construction 200
+    python scripts/hnsw_index.py update          # insert cards added since the last build
+    python scripts/hnsw_index.py benchmark --ef-search 16 32 64 128
+"""
+import json
+import time
+import heapq
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from card_index import CardIndex, INDEX_DIRECTORY, normalize_rows, select_top_k, measure_recall, sample_queries
+
+# Configuration
+HNSW_FILE = "hnsw.npz"
+DEFAULT_M = 16
+DEFAULT_EF_CONSTRUCTION = 200
+DEFAULT_EF_SEARCH = 64
+COMPARE_BLOCK_SIZE = 4096  # Nodes per block when checking for re-embedded cards
+
+
+class HNSWIndex:
+    """HNSW graph over unit-length card embeddings (similarity = dot product)."""
+
+    def __init__(self, dimension: int, m: int = DEFAULT_M, ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+                 ef_search: int = DEFAULT_EF_SEARCH, seed: int = 0):
+        self.m = m
+        self.m_max0 = 2 * m  # Bottom layer keeps twice as many links
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / np.log(max(m, 2))
+        self.rng = np.random.default_rng(seed)
+
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.keys: List[Tuple[str, str]] = []
+        self.levels: List[int] = []
+        self.links: List[List[List[int]]] = []  # links[node][level] -> neighbour nodes
+        self.entry_point = -1
+        self.max_level = -1
+
+        # Node -> row in the attached CardIndex (-1 when the card is gone)
+        self.node_rows = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # ------------------------------------------------------------------
+    # Graph search
+    # ------------------------------------------------------------------
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        """Best-first search on one layer. Returns up to ef (similarity, node) pairs, best first."""
+        visited: Set[int] = set(entry_points)
+        entry_sims = self.vectors[entry_points] @ query
+        candidates = [(-float(s), n) for s, n in zip(entry_sims, entry_points)]
+        heapq.heapify(candidates)
+        results = [(float(s), n) for s, n in zip(entry_sims, entry_points)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+
+            neighbours = [n for n in self.links[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+
+            sims = self.vectors[neighbours] @ query
+            for sim, n in zip(sims.tolist(), neighbours):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _greedy_descend(self, query: np.ndarray, target_level: int) -> int:
+        """Walk the upper layers greedily down to target_level and return the entry node."""
+        node = self.entry_point
+        for level in range(self.max_level, target_level, -1):
+            node = self._search_layer(query, [node], 1, level)[0][1]
+        return node
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Neighbour selection heuristic: keep a candidate only if it is closer to
+        the new node than to every neighbour already kept, then top up with the
+        best remaining candidates so each node keeps m links.
+        """
+        nodes = [node for _, node in candidates]
+        sims = np.array([sim for sim, _ in candidates], dtype=np.float32)
+        candidate_vectors = self.vectors[nodes]
+        # Highest similarity of each candidate to any neighbour kept so far
+        closest_kept = np.full(len(nodes), -np.inf, dtype=np.float32)
+
+        selected: List[int] = []
+        pruned: List[int] = []
+        for i, node in enumerate(nodes):
+            if len(selected) >= m:
+                break
+            if closest_kept[i] > sims[i]:
+                pruned.append(node)
+                continue
+            selected.append(node)
+            np.maximum(closest_kept, candidate_vectors @ candidate_vectors[i], out=closest_kept)
+        for node in pruned:
+            if len(selected) >= m:
+                break
+            selected.append(node)
+        return selected
+
+    # ------------------------------------------------------------------
+    # Insertion
+    # ------------------------------------------------------------------
+
+    def _random_level(self) -> int:
+        return int(-np.log(1.0 - self.rng.random()) * self.level_mult)
+
+    def _append_vectors(self, vectors: np.ndarray):
+        self.vectors = np.concatenate([self.vectors, normalize_rows(vectors)])
+
+    def _insert_node(self, node: int):
+        query = self.vectors[node]
+        level = self._random_level()
+        self.levels.append(level)
+        self.links.append([[] for _ in range(level + 1)])
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry = self._greedy_descend(query, level)
+        entry_points = [entry]
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(query, entry_points, self.ef_construction, layer)
+            m_max = self.m_max0 if layer == 0 else self.m
+            neighbours = self._select_neighbours(candidates, self.m)
+            self.links[node][layer] = neighbours
+
+            # Link back, shrinking neighbour lists that overflow
+            for n in neighbours:
+                links = self.links[n][layer]
+                links.append(node)
+                if len(links) > m_max:
+                    sims = self.vectors[links] @ self.vectors[n]
+                    ranked = sorted(zip(sims.tolist(), links), reverse=True)
+                    self.links[n][layer] = self._select_neighbours(ranked, m_max)
+
+            entry_points = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def add(self, vectors: np.ndarray, keys: List[Tuple[str, str]], rows: Optional[List[int]] = None):
+        """Insert new cards. rows are their row ids in the attached CardIndex."""
+        start = len(self)
+        self._append_vectors(np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1))
+        self.keys.extend(keys)
+        self.node_rows = np.concatenate([
+            self.node_rows,
+            np.asarray(rows if rows is not None else [-1] * len(keys), dtype=np.int64)
+        ])
+        for node in range(start, len(self)):
+            self._insert_node(node)
+
+    @classmethod
+    def build(cls, index: CardIndex, m: int = DEFAULT_M, ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+              ef_search: int = DEFAULT_EF_SEARCH) -> 'HNSWIndex':
+        """Build a graph over every card in index."""
+        hnsw = cls(index.dimension, m, ef_construction, ef_search)
+        hnsw.add(index.embeddings, list(index.cards), list(range(len(index))))
+        return hnsw
+
+    def attach(self, index: CardIndex) -> int:
+        """
+        Point the graph at a (possibly rebuilt) CardIndex: remap nodes to the
+        new row ids and insert cards the graph has not seen yet. Cards whose
+        embedding changed are inserted again; the newest node for a card
+        wins and older ones stay in the graph only as routing nodes.
+
+        Returns:
+            Number of newly inserted cards
+        """
+        row_of: Dict[Tuple[str, str], int] = {card: i for i, card in enumerate(index.cards)}
+        self.node_rows = np.full(len(self.keys), -1, dtype=np.int64)
+        known = set()
+        for node in range(len(self.keys) - 1, -1, -1):
+            if self.keys[node] not in known:
+                known.add(self.keys[node])
+                self.node_rows[node] = row_of.get(self.keys[node], -1)
+
+        # Re-embedded cards: same key, different vector
+        live = np.flatnonzero(self.node_rows >= 0)
+        changed = []
+        for start in range(0, len(live), COMPARE_BLOCK_SIZE):
+            nodes = live[start:start + COMPARE_BLOCK_SIZE]
+            diff = np.abs(self.vectors[nodes] - index.embeddings[self.node_rows[nodes]]).max(axis=1)
+            changed.extend(nodes[diff > 1e-5].tolist())
+        changed_rows = set(self.node_rows[changed].tolist())
+        self.node_rows[changed] = -1
+
+        new_rows = [i for i, card in enumerate(index.cards) if card not in known or i in changed_rows]
+        if new_rows:
+            self.add(index.embeddings[new_rows], [index.cards[i] for i in new_rows], new_rows)
+        return len(new_rows)
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def search(self, query_embedding: List[float], top_k: int = 5, rows: Optional[np.ndarray] = None,
+               ef_search: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Approximate cosine search. Returns (row, similarity_score) tuples in
+        the attached CardIndex, best first. rows optionally restricts results
+        to a subset of row ids: a subset no larger than the nodes one beam
+        visits is scored exactly, otherwise the beam is widened until top_k
+        matching cards are found or the whole graph has been searched.
+        """
+        query = normalize_rows(query_embedding)
+        if self.entry_point < 0 or not query.any():
+            return []
+
+        ef = max(ef_search or self.ef_search, top_k)
+        if rows is None:
+            return self._search_rows(query, top_k, ef)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        ef = max(ef, top_k * 4)
+        if len(rows) <= ef * self.m:
+            nodes = np.flatnonzero(np.isin(self.node_rows, rows))
+            scores = self.vectors[nodes] @ query
+            ids = select_top_k(scores, top_k)
+            return [(int(self.node_rows[nodes[i]]), float(scores[i])) for i in ids]
+
+        allowed = set(rows.tolist())
+        while True:
+            results = self._search_rows(query, top_k, ef, allowed)
+            if len(results) >= top_k or ef >= len(self.keys):
+                return results
+            ef *= 4
+
+    def _search_rows(self, query: np.ndarray, top_k: int, ef: int,
+                     allowed: Optional[set] = None) -> List[Tuple[int, float]]:
+        """One beam search on layer 0, keeping live nodes whose row is in allowed (if given)."""
+        entry = self._greedy_descend(query, 0)
+        results = []
+        for sim, node in self._search_layer(query, [entry], ef, 0):
+            row = int(self.node_rows[node])
+            if row < 0 or (allowed is not None and row not in allowed):
+                continue
+            results.append((row, sim))
+            if len(results) >= top_k:
+                break
+        return results
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        """Save vectors, keys and links (flattened CSR-style) to hnsw.npz."""
+        offsets = [0]
+        flat: List[int] = []
+        for node_links in self.links:
+            for level_links in node_links:
+                flat.extend(level_links)
+                offsets.append(len(flat))
+
+        path = Path(index_directory) / HNSW_FILE
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                vectors=self.vectors,
+                levels=np.asarray(self.levels, dtype=np.int32),
+                link_offsets=np.asarray(offsets, dtype=np.int64),
+                links=np.asarray(flat, dtype=np.int32),
+                keys=json.dumps([list(key) for key in self.keys]),
+                params=np.asarray([self.m, self.ef_construction, self.ef_search,
+                                   self.entry_point, self.max_level], dtype=np.int64),
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index_directory: str = INDEX_DIRECTORY) -> Optional['HNSWIndex']:
+        path = Path(index_directory) / HNSW_FILE
+        if not path.exists():
+            return None
+
+        with np.load(path) as data:
+            m, ef_construction, ef_search, entry_point, max_level = data['params'].tolist()
+            hnsw = cls(data['vectors'].shape[1], m, ef_construction, ef_search)
+            hnsw.vectors = data['vectors']
+            hnsw.levels = data['levels'].tolist()
+            hnsw.keys = [tuple(key) for key in json.loads(str(data['keys']))]
+            offsets = data['link_offsets']
+            flat = data['links'].tolist()
+
+        position = 0
+        for level in hnsw.levels:
+            node_links = []
+            for _ in range(level + 1):
+                node_links.append(flat[offsets[position]:offsets[position + 1]])
+                position += 1
+            hnsw.links.append(node_links)
+
+        hnsw.entry_point, hnsw.max_level = entry_point, max_level
+        hnsw.node_rows = np.full(len(hnsw.keys), -1, dtype=np.int64)
+        # Continue the level sequence instead of replaying it for new nodes
+        hnsw.rng = np.random.default_rng(len(hnsw.keys))
+        return hnsw
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'HNSWIndex':
+        """Load the saved graph and insert any new cards, or build it on first use."""
+        hnsw = cls.load(index_directory)
+        if hnsw is None or hnsw.vectors.shape[1] != index.dimension:
+            print("🔄 Building HNSW index...")
+            hnsw = cls.build(index)
+            hnsw.save(index_directory)
+            return hnsw
+
+        added = hnsw.attach(index)
+        if added:
+            print(f"🔄 Inserted {added} new cards into the HNSW index")
+            hnsw.save(index_directory)
+        return hnsw
+
+
+def benchmark(index: CardIndex, hnsw: HNSWIndex, ef_values: List[int], top_k: int = 10,
+              num_queries: int = 200) -> Dict:
+    """Latency and recall@top_k of exact search vs HNSW at each efSearch."""
+    queries = sample_queries(index, num_queries)
+
+    def mean_latency_ms(search) -> float:
+        start = time.perf_counter()
+        for query in queries:
+            search(query)
+        return round((time.perf_counter() - start) * 1000 / max(len(queries), 1), 3)
+
+    report = {
+        'cards': len(index),
+        'top_k': top_k,
+        'exact_latency_ms': mean_latency_ms(lambda q: index.search(q, top_k)),
+        'hnsw': [],
+    }
+    for ef in ef_values:
+        hnsw.ef_search = ef
+        report['hnsw'].append({
+            'ef_search': ef,
+            'recall': round(measure_recall(index, hnsw, queries, top_k), 4),
+            'latency_ms': mean_latency_ms(lambda q: hnsw.search(q, top_k)),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, update and benchmark the HNSW card search index")
+    parser.add_argument('command', choices=['build', 'update', 'benchmark'])
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--m', type=int, default=DEFAULT_M, help='Links per node (bottom layer keeps 2*M)')
+    parser.add_argument('--ef-construction', type=int, default=DEFAULT_EF_CONSTRUCTION, help='Beam width while building')
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[DEFAULT_EF_SEARCH], help='Beam width while searching')
+    parser.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries for the benchmark')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        hnsw = HNSWIndex.build(index, args.m, args.ef_construction, args.ef_search[0])
+        hnsw.save(args.index_dir)
+        print(f"✅ Built HNSW index over {len(hnsw)} cards (M={args.m}, efConstruction={args.ef_construction}, "
+              f"{hnsw.max_level + 1} layers) in {time.perf_counter() - start:.1f}s")
+        return
+
+    if args.command == 'update':
+        hnsw = HNSWIndex.load(args.index_dir)
+        if hnsw is None:
+            print(f"❌ No HNSW index in {args.index_dir}. Run 'python scripts/hnsw_index.py build' first.")
+            return
+        added = hnsw.attach(index)
+        hnsw.save(args.index_dir)
+        print(f"✅ Inserted {added} new cards ({len(hnsw)} nodes total)")
+        return
+
+    hnsw = HNSWIndex.open(index, args.index_dir)
+    print(json.dumps(benchmark(index, hnsw, args.ef_search, args.top_k, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
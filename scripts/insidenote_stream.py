@@ -0,0 +1,182 @@
+"""
+Streaming insidenote.json Reader
+An insidenote.json with embeddings is mostly pretty-printed floats, and
+json.load turns every one of them into a Python float before anything uses
+them. This reader walks the card array a chunk at a time: ordinary fields
+are decoded with the json module, while each "embedding" array is parsed by
+numpy straight from the text into float32 - or skipped entirely when only
+the other fields are needed.
+
+read_embeddings() writes the vectors of a whole file into one preallocated
+float32 matrix. Both the plain array format and {"cards": [...]} are read.
+"""
+import json
+import warnings
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Configuration
+CHUNK_SIZE = 1 << 20  # Characters read per step
+INITIAL_ROWS = 64  # Starting capacity of the embedding matrix (doubles as needed)
+EMBEDDING_KEY = "embedding"
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Text buffer over a file, refilled on demand."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read the next chunk, dropping consumed text. False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at character {self.pos}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode one JSON value, reading more text until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number can be cut off at the end of the buffer
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array_text(self) -> str:
+        """Text between the brackets of a flat array such as an embedding."""
+        self.expect('[')
+        while True:
+            end = self.buffer.find(']', self.pos)
+            if end >= 0:
+                text = self.buffer[self.pos:end]
+                self.pos = end + 1
+                return text
+            if not self.fill():
+                raise ValueError("Unterminated array")
+
+
+def parse_vector(text: str) -> np.ndarray:
+    """float32 vector from the comma-separated numbers of an array."""
+    if not text.strip():
+        return np.zeros(0, dtype=np.float32)
+    try:
+        with warnings.catch_warnings():
+            # Older numpy warns (instead of raising) on text it cannot parse
+            warnings.simplefilter('error', DeprecationWarning)
+            vector = np.fromstring(text, dtype=np.float32, sep=',')
+    except (ValueError, DeprecationWarning):
+        vector = None
+    if vector is None or len(vector) != text.count(',') + 1:
+        # Not a plain list of numbers (e.g. nulls); let the json module decide
+        vector = np.asarray(json.loads(f"[{text}]"), dtype=np.float32)
+    return vector
+
+
+def iter_cards(path: Path, embeddings: bool = True) -> Iterator[Tuple[Dict, Optional[np.ndarray]]]:
+    """
+    Yield (card fields without the embedding, float32 embedding or None)
+    for each card of an insidenote.json, reading it a chunk at a time.
+    With embeddings=False the vectors are skipped without being parsed.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        if reader.expect('[{') == '{':
+            # {"cards": [...], ...}: skip to the cards array
+            while reader.peek() != '}':
+                key = reader.value()
+                reader.expect(':')
+                if key == 'cards':
+                    reader.expect('[')
+                    break
+                reader.value()
+                if reader.peek() == ',':
+                    reader.pos += 1
+            else:
+                return
+
+        while reader.peek() not in (']', ''):
+            reader.expect('{')
+            card: Dict = {}
+            embedding = None
+            while reader.peek() != '}':
+                key = reader.value()
+                reader.expect(':')
+                if key == EMBEDDING_KEY and reader.peek() == '[':
+                    text = reader.array_text()
+                    embedding = parse_vector(text) if embeddings else None
+                elif key == EMBEDDING_KEY:
+                    reader.value()  # null or another non-array placeholder
+                else:
+                    card[key] = reader.value()
+                if reader.peek() == ',':
+                    reader.pos += 1
+            reader.pos += 1
+            yield card, embedding
+            if reader.peek() == ',':
+                reader.pos += 1
+
+
+def read_embeddings(path: Path, dimension: Optional[int] = None,
+                    label: str = '') -> Tuple[np.ndarray, List[str]]:
+    """
+    All embeddings of an insidenote.json as one float32 matrix, plus the
+    matching filenames. Cards without an embedding, or whose size differs
+    from dimension, are skipped.
+    """
+    matrix: Optional[np.ndarray] = None
+    filenames: List[str] = []
+    for card, embedding in iter_cards(path):
+        if embedding is None or not len(embedding):
+            continue
+        if dimension is None:
+            dimension = len(embedding)
+        if len(embedding) != dimension:
+            print(f"⚠️  Skipping {label}/{card.get('filename')}: "
+                  f"embedding has {len(embedding)} dims, expected {dimension}")
+            continue
+        if matrix is None:
+            matrix = np.empty((INITIAL_ROWS, dimension), dtype=np.float32)
+        elif len(filenames) == len(matrix):
+            grown = np.empty((2 * len(matrix), dimension), dtype=np.float32)
+            grown[:len(matrix)] = matrix
+            matrix = grown
+        matrix[len(filenames)] = embedding
+        filenames.append(card['filename'])
+
+    if matrix is None:
+        return np.zeros((0, dimension or 0), dtype=np.float32), []
+    return matrix[:len(filenames)], filenames
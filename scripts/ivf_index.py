@@ -0,0 +1,234 @@
+"""
+IVF (Inverted File) Index for Card Search
+Approximate nearest-neighbour search in pure NumPy. Card embeddings are
+clustered with spherical k-means; each cluster keeps a posting list of its
+rows. A query is compared against the centroids first and only the rows in
+the nprobe closest clusters are scored, so search cost grows with
+nprobe * (catalog size / clusters) instead of the full catalog.
+
+The index is built from the card search index (card_index.py), which is
+compiled from the embeddings generate_embeddings.py writes, and saved as
+ivf.npz next to it.
+
+Usage:
+    python scripts/ivf_index.py build
+    python scripts/ivf_index.py build --clusters 256 --iterations 20
+    python scripts/ivf_index.py recall --nprobe 1 4 8 16 --top-k 10
+"""
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from card_index import (CardIndex, INDEX_DIRECTORY, normalize_rows, older_than_embeddings, measure_recall,
+                        sample_queries)
+
+# Configuration
+IVF_FILE = "ivf.npz"
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 15
+ASSIGN_BLOCK_SIZE = 4096  # Rows per block when assigning rows to centroids
+
+
+def default_cluster_count(num_vectors: int) -> int:
+    """About 4 * sqrt(N) clusters, the usual starting point for IVF."""
+    return max(1, min(num_vectors, int(4 * np.sqrt(num_vectors))))
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every row, computed block by block."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def cluster_sums(vectors: np.ndarray, assignments: np.ndarray, n_clusters: int) -> np.ndarray:
+    """Per-cluster vector sums as blocked one-hot matrix products."""
+    sums = np.zeros((n_clusters, vectors.shape[1]), dtype=np.float32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        one_hot = np.zeros((len(block), n_clusters), dtype=np.float32)
+        one_hot[np.arange(len(block)), assignments[start:start + len(block)]] = 1.0
+        sums += one_hot.T @ block
+    return sums
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = KMEANS_ITERATIONS,
+                     seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k-means on unit vectors using cosine similarity.
+
+    Returns:
+        (centroids, assignments) with unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = np.asarray(vectors[np.sort(rng.choice(len(vectors), n_clusters, replace=False))],
+                           dtype=np.float32)
+
+    assignments = assign_clusters(vectors, centroids)
+    for _ in range(iterations):
+        sums = cluster_sums(vectors, assignments, n_clusters)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Re-seed empty clusters with random rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        centroids = normalize_rows(sums)
+        new_assignments = assign_clusters(vectors, centroids)
+        if np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+
+    return centroids, assignments
+
+
+class IVFIndex:
+    """Centroids plus CSR-style posting lists over the rows of a CardIndex."""
+
+    def __init__(self, index: CardIndex, centroids: np.ndarray, offsets: np.ndarray,
+                 postings: np.ndarray, nprobe: int = DEFAULT_NPROBE):
+        self.index = index
+        self.centroids = centroids
+        self.offsets = offsets      # Cluster c owns postings[offsets[c]:offsets[c + 1]]
+        self.postings = postings    # Row ids grouped by cluster
+        self.nprobe = nprobe
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, index: CardIndex, n_clusters: Optional[int] = None,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> 'IVFIndex':
+        """Cluster the card embeddings and build the posting lists."""
+        if len(index) == 0:
+            raise ValueError("Cannot build an IVF index over an empty catalog")
+        n_clusters = min(n_clusters or default_cluster_count(len(index)), len(index))
+        centroids, assignments = spherical_kmeans(index.embeddings, n_clusters, iterations, seed)
+
+        postings = np.argsort(assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(index, centroids, offsets, postings)
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               rows: Optional[np.ndarray] = None, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Approximate cosine search over the nprobe closest clusters.
+        rows optionally restricts results to a subset of row ids: a subset no
+        larger than the probed lists is scored exactly, otherwise nprobe is
+        widened until top_k matching cards are found or every list is probed.
+        """
+        query = normalize_rows(query_embedding)
+        if not query.any():
+            return []
+
+        nprobe = min(nprobe or self.nprobe, self.n_clusters)
+        if rows is not None and len(rows) <= nprobe * len(self.postings) / max(self.n_clusters, 1):
+            return self.index.search(query, top_k, rows)
+
+        order = np.argsort(-(self.centroids @ query))
+        while True:
+            candidates = np.concatenate([self.postings[self.offsets[c]:self.offsets[c + 1]] for c in order[:nprobe]])
+            if rows is not None:
+                candidates = candidates[np.isin(candidates, rows)]
+            if rows is None or len(candidates) >= top_k or nprobe >= self.n_clusters:
+                break
+            nprobe = min(nprobe * 4, self.n_clusters)
+        if len(candidates) == 0:
+            return []
+        return self.index.search(query, top_k, np.sort(candidates))
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / IVF_FILE
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, postings=self.postings,
+                     nprobe=self.nprobe, fingerprint=self.index.fingerprint())
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> Optional['IVFIndex']:
+        """
+        Load the saved IVF index, or None if missing, built for a different
+        catalog, or older than the index's embeddings (cards were re-embedded).
+        """
+        path = Path(index_directory) / IVF_FILE
+        if not path.exists() or older_than_embeddings(path, index):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint():
+                return None
+            return cls(index, data['centroids'], data['offsets'], data['postings'], int(data['nprobe']))
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'IVFIndex':
+        """Load the IVF index, rebuilding and saving it when it is missing or stale."""
+        ivf = cls.load(index, index_directory)
+        if ivf is None:
+            print("🔄 Building IVF index...")
+            ivf = cls.build(index)
+            ivf.save(index_directory)
+        return ivf
+
+
+def recall_report(ivf: IVFIndex, nprobes: List[int], top_k: int = 10, num_queries: int = 200) -> List[dict]:
+    """Recall@top_k and mean latency against brute force for each nprobe."""
+    queries = sample_queries(ivf.index, num_queries)
+    report = []
+    for nprobe in nprobes:
+        ivf.nprobe = nprobe
+        start = time.perf_counter()
+        for query in queries:
+            ivf.search(query, top_k)
+        latency_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        report.append({
+            'nprobe': nprobe,
+            'recall': round(measure_recall(ivf.index, ivf, queries, top_k), 4),
+            'latency_ms': round(latency_ms, 3),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate the IVF card search index")
+    parser.add_argument('command', choices=['build', 'recall'])
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--clusters', type=int, default=None, help='Number of clusters (default 4*sqrt(N))')
+    parser.add_argument('--iterations', type=int, default=KMEANS_ITERATIONS, help='k-means iterations')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[DEFAULT_NPROBE], help='Clusters scanned per query')
+    parser.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries for the recall report')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        ivf = IVFIndex.build(index, args.clusters, args.iterations)
+        ivf.nprobe = args.nprobe[0]
+        ivf.save(args.index_dir)
+        sizes = np.diff(ivf.offsets)
+        print(f"✅ Built IVF index: {ivf.n_clusters} clusters over {len(index)} cards "
+              f"in {time.perf_counter() - start:.1f}s")
+        print(f"   Posting list size: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+        return
+
+    ivf = IVFIndex.open(index, args.index_dir)
+    report = recall_report(ivf, args.nprobe, args.top_k, args.queries)
+    print(json.dumps({'clusters': ivf.n_clusters, 'cards': len(index), 'top_k': args.top_k,
+                      'results': report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Catalog Near-Duplicate Detector
+Finds pairs of cards whose embeddings (as written by generate_embeddings.py)
+are at least --threshold cosine-similar, groups connected pairs into
+clusters and writes them as JSON for review.
+
+Every pair is compared exactly, one tile x tile block of the similarity
+matrix at a time (upper triangle only), so memory stays at two tiles of
+embeddings plus one block of scores whatever the catalog size.
+
+Usage:
+    python scripts/near_duplicates.py
+    python scripts/near_duplicates.py --threshold 0.97 --cross-folder --output duplicates.json
+"""
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from card_index import CardIndex, CARDS_DIRECTORY, INDEX_DIRECTORY, open_index, load_card_details
+
+# Configuration
+DEFAULT_THRESHOLD = 0.95
+TILE_SIZE = 2048  # Rows per tile: a block of scores is TILE_SIZE^2 float32 (16 MB)
+OUTPUT_FILE = "near_duplicates.json"
+
+
+def similar_pairs(index: CardIndex, threshold: float = DEFAULT_THRESHOLD,
+                  tile_size: int = TILE_SIZE) -> List[Tuple[int, int, float]]:
+    """
+    All (row_a, row_b, similarity) with row_a < row_b and similarity >= threshold,
+    computed one tile pair at a time.
+    """
+    pairs: List[Tuple[int, int, float]] = []
+    for start_a in range(0, len(index), tile_size):
+        tile_a = np.asarray(index.embeddings[start_a:start_a + tile_size], dtype=np.float32)
+        for start_b in range(start_a, len(index), tile_size):
+            tile_b = tile_a if start_b == start_a else \
+                np.asarray(index.embeddings[start_b:start_b + tile_size], dtype=np.float32)
+            block = tile_a @ tile_b.T
+            if start_b == start_a:
+                # Diagonal tile: keep each pair once and skip self-similarity
+                block[np.tril_indices(len(block), m=block.shape[1])] = -np.inf
+            a, b = np.nonzero(block >= threshold)
+            pairs.extend(zip((a + start_a).tolist(), (b + start_b).tolist(), block[a, b].tolist()))
+    return pairs
+
+
+def cluster_pairs(pairs: List[Tuple[int, int, float]]) -> List[List[int]]:
+    """Connected components of the pair graph (union-find), largest first."""
+    parent: Dict[int, int] = {}
+
+    def find(row: int) -> int:
+        parent.setdefault(row, row)
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for a, b, _ in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters: Dict[int, List[int]] = {}
+    for row in parent:
+        clusters.setdefault(find(row), []).append(row)
+    return sorted((sorted(rows) for rows in clusters.values()), key=lambda rows: (-len(rows), rows[0]))
+
+
+def find_duplicates(index: CardIndex, threshold: float = DEFAULT_THRESHOLD, tile_size: int = TILE_SIZE,
+                    cross_folder: bool = False) -> Dict:
+    """
+    Near-duplicate clusters of the catalog as a JSON-serializable report.
+
+    Args:
+        index: Card search index
+        threshold: Minimum cosine similarity for two cards to count as duplicates
+        tile_size: Rows per tile of the blocked similarity computation
+        cross_folder: Only report pairs from different Series folders
+
+    Returns:
+        Report with the settings, counts and one entry per cluster
+    """
+    start = time.perf_counter()
+    pairs = similar_pairs(index, threshold, tile_size)
+    if cross_folder:
+        pairs = [(a, b, s) for a, b, s in pairs if index.cards[a][0] != index.cards[b][0]]
+    elapsed = time.perf_counter() - start
+
+    clusters = cluster_pairs(pairs)
+    rows = sorted({row for cluster in clusters for row in cluster})
+    details = dict(zip(rows, load_card_details(index, rows)))
+    pairs_by_cluster: Dict[int, List[Tuple[int, int, float]]] = {}
+    cluster_of = {row: i for i, cluster in enumerate(clusters) for row in cluster}
+    for pair in pairs:
+        pairs_by_cluster.setdefault(cluster_of[pair[0]], []).append(pair)
+
+    report_clusters = []
+    for i, cluster in enumerate(clusters):
+        edges = pairs_by_cluster[i]
+        report_clusters.append({
+            'size': len(cluster),
+            'folders': sorted({index.cards[row][0] for row in cluster}),
+            'max_similarity': round(max(s for _, _, s in edges), 4),
+            'min_similarity': round(min(s for _, _, s in edges), 4),
+            'cards': [{'folder': details[row]['folder'], 'filename': details[row]['filename'],
+                       'title': details[row]['title'], 'image_path': details[row]['image_path']}
+                      for row in cluster],
+            'pairs': [{'a': f"{index.cards[a][0]}/{index.cards[a][1]}", 'b': f"{index.cards[b][0]}/{index.cards[b][1]}",
+                       'similarity': round(s, 4)}
+                      for a, b, s in sorted(edges, key=lambda pair: -pair[2])],
+        })
+
+    return {
+        'threshold': threshold,
+        'cross_folder_only': cross_folder,
+        'cards': len(index),
+        'pairs': len(pairs),
+        'clusters': len(clusters),
+        'duplicate_cards': sum(len(cluster) - 1 for cluster in clusters),
+        'compare_seconds': round(elapsed, 2),
+        'duplicates': report_clusters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate cards by embedding similarity")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Minimum cosine similarity (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--cross-folder', action='store_true', help='Only report duplicates across Series folders')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Rows per tile of the similarity matrix')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='Where the JSON report is written')
+    parser.add_argument('--cards-dir', default=CARDS_DIRECTORY, help='Folder with one subfolder per card category')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir) and not Path(args.cards_dir).exists():
+        print(f"❌ Directory not found: {args.cards_dir}")
+        return
+    index = open_index(args.index_dir, args.cards_dir)
+    print(f"✅ Loaded {len(index)} cards with embeddings")
+    print(f"🔍 Comparing every pair (threshold {args.threshold}, tiles of {args.tile_size})...")
+
+    report = find_duplicates(index, args.threshold, args.tile_size, args.cross_folder)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"✅ {report['pairs']} similar pairs in {report['clusters']} clusters "
+          f"({report['duplicate_cards']} cards could be removed), {report['compare_seconds']}s")
+    for cluster in report['duplicates'][:10]:
+        names = ', '.join(f"{card['folder']}/{card['filename']}" for card in cluster['cards'][:4])
+        more = f" (+{cluster['size'] - 4} more)" if cluster['size'] > 4 else ''
+        print(f"   {cluster['size']} cards, similarity {cluster['min_similarity']}-{cluster['max_similarity']}: "
+              f"{names}{more}")
+    print(f"📄 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Quantized Card Embedding Index
+Compact codes for the card embeddings so the resident part of the search
+index is a fraction of the float32 matrix:
+
+    int8 - per-dimension scalar quantization, 1 byte per dimension (4x smaller)
+    pq   - product quantization: the vector is split into subspaces and each
+           is stored as one byte (the id of its nearest sub-centroid);
+           768 dims / 96 subspaces = 96 bytes per card (32x smaller)
+
+Queries are scored directly against the codes (PQ uses asymmetric distance
+computation: one lookup table per query, then a table gather per card). The
+best candidates can optionally be re-ranked with exact float32 scores read
+from the memory-mapped card index, which touches only the shortlist rows.
+
+The gain is mostly memory and I/O. While the float32 matrix is in RAM,
+exact search is a single BLAS product and scoring the codes in NumPy is only
+a little faster on large catalogs (768 dims, one core: ~0.4 ms exact vs
+~0.5 ms int8 / ~0.8 ms pq at 3k cards; ~25 ms exact vs ~20-25 ms int8 /
+~16 ms pq at 100k). Use int8 or pq when the float32 matrix does not fit in
+memory or is read cold from disk: the codes are 4x / 32x fewer bytes to keep
+resident or read. The recall report shows the exact latency next to the
+quantized one for your catalog.
+
+Usage:
+    python scripts/quantized_index.py build --kind int8
+    python scripts/quantized_index.py build --kind pq --subspaces 96
+    python scripts/quantized_index.py recall --kind pq --top-k 10
+"""
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from card_index import (CardIndex, INDEX_DIRECTORY, normalize_rows, select_top_k, older_than_embeddings,
+                        measure_recall, sample_queries)
+
+# Configuration
+QUANTIZED_FILES = {'int8': "int8.npz", 'pq': "pq.npz"}
+DEFAULT_SUBSPACES = 96
+PQ_CENTROIDS = 256  # One byte per subspace code
+PQ_TRAINING_SAMPLE = 10000  # About 40 training vectors per sub-centroid
+PQ_ITERATIONS = 12
+RERANK_FACTOR = 8  # Shortlist size = top_k * RERANK_FACTOR when re-ranking
+BLOCK_SIZE = 4096  # Rows per block while building
+INT8_SCORE_BLOCK_SIZE = 256  # Small blocks keep the decoded int8 rows in cache
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = PQ_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Euclidean k-means, returns the centroids."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.stack([np.bincount(assignments, weights=vectors[:, d], minlength=n_clusters)
+                         for d in range(vectors.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters with random vectors
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (Euclidean) for every row, block by block."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + BLOCK_SIZE], dtype=np.float32)
+        distances = centroid_norms[None, :] - 2 * block @ centroids.T
+        assignments[start:start + len(block)] = np.argmin(distances, axis=1)
+    return assignments
+
+
+class QuantizedIndex:
+    """int8 or PQ codes for the rows of a CardIndex, with optional exact re-ranking."""
+
+    def __init__(self, index: CardIndex, kind: str, codes: np.ndarray,
+                 scales: Optional[np.ndarray] = None, codebooks: Optional[np.ndarray] = None,
+                 rerank: bool = True, rerank_factor: int = RERANK_FACTOR):
+        self.index = index
+        self.kind = kind
+        self.codes = codes          # int8: (N, D) int8, pq: (subspaces, N) uint8 (one row per subspace)
+        self.scales = scales        # int8: (D,) float32 step per dimension
+        self.codebooks = codebooks  # pq: (subspaces, 256, D / subspaces) float32
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+
+    def __len__(self) -> int:
+        return self.codes.shape[0] if self.kind == 'int8' else self.codes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        extra = self.scales.nbytes if self.scales is not None else self.codebooks.nbytes
+        return self.codes.nbytes + extra
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build_int8(cls, index: CardIndex) -> 'QuantizedIndex':
+        """Symmetric per-dimension scalar quantization to int8."""
+        scales = np.zeros(index.dimension, dtype=np.float32)
+        for start in range(0, len(index), BLOCK_SIZE):
+            block = np.abs(np.asarray(index.embeddings[start:start + BLOCK_SIZE]))
+            scales = np.maximum(scales, block.max(axis=0))
+        scales = scales / 127.0
+        scales[scales == 0] = 1.0
+
+        codes = np.empty((len(index), index.dimension), dtype=np.int8)
+        for start in range(0, len(index), BLOCK_SIZE):
+            block = np.asarray(index.embeddings[start:start + BLOCK_SIZE])
+            codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127)
+        return cls(index, 'int8', codes, scales=scales)
+
+    @classmethod
+    def build_pq(cls, index: CardIndex, subspaces: int = DEFAULT_SUBSPACES, seed: int = 0) -> 'QuantizedIndex':
+        """Product quantization with PQ_CENTROIDS sub-centroids per subspace."""
+        if index.dimension % subspaces:
+            raise ValueError(f"Dimension {index.dimension} is not divisible by {subspaces} subspaces")
+        sub_dim = index.dimension // subspaces
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(len(index), min(PQ_TRAINING_SAMPLE, len(index)), replace=False))
+        sample = np.asarray(index.embeddings[sample_rows], dtype=np.float32)
+
+        codebooks = np.zeros((subspaces, PQ_CENTROIDS, sub_dim), dtype=np.float32)
+        for j in range(subspaces):
+            centroids = kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], PQ_CENTROIDS, seed=seed + j)
+            codebooks[j, :len(centroids)] = centroids
+
+        codes = np.empty((subspaces, len(index)), dtype=np.uint8)
+        for j in range(subspaces):
+            codes[j] = nearest_centroids(index.embeddings[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j])
+        return cls(index, 'pq', codes, codebooks=codebooks)
+
+    @classmethod
+    def build(cls, index: CardIndex, kind: str, subspaces: int = DEFAULT_SUBSPACES) -> 'QuantizedIndex':
+        if len(index) == 0:
+            raise ValueError("Cannot quantize an empty catalog")
+        if kind == 'int8':
+            return cls.build_int8(index)
+        if kind == 'pq':
+            return cls.build_pq(index, subspaces)
+        raise ValueError(f"Unknown quantization: {kind}")
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def approximate_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of query with every (or every listed) row."""
+        if self.kind == 'int8':
+            codes = self.codes if rows is None else self.codes[rows]
+            scaled_query = (query * self.scales).astype(np.float32)
+            scores = np.empty(len(codes), dtype=np.float32)
+            for start in range(0, len(codes), INT8_SCORE_BLOCK_SIZE):
+                block = codes[start:start + INT8_SCORE_BLOCK_SIZE].astype(np.float32)
+                scores[start:start + len(block)] = block @ scaled_query
+            return scores
+
+        # Asymmetric distance computation: lookup[j, c] = <query_j, codebook_j[c]>,
+        # then each card's score is the sum of one table entry per subspace
+        codes = self.codes if rows is None else self.codes[:, rows]
+        subspaces, _, sub_dim = self.codebooks.shape
+        lookup = np.einsum('jcd,jd->jc', self.codebooks, query.reshape(subspaces, sub_dim))
+        scores = np.zeros(codes.shape[1], dtype=np.float32)
+        for j in range(subspaces):
+            scores += np.take(lookup[j], codes[j])
+        return scores
+
+    def search(self, query_embedding: List[float], top_k: int = 5, rows: Optional[np.ndarray] = None,
+               rerank: Optional[bool] = None) -> List[Tuple[int, float]]:
+        """
+        Score the codes, then optionally re-rank a top_k * rerank_factor
+        shortlist with exact float32 scores. rows restricts the search to a subset.
+        """
+        query = normalize_rows(query_embedding)
+        if len(self) == 0 or not query.any():
+            return []
+        rerank = self.rerank if rerank is None else rerank
+
+        row_ids = None if rows is None else np.asarray(rows, dtype=np.int64)
+        scores = self.approximate_scores(query, row_ids)
+        shortlist = select_top_k(scores, top_k * self.rerank_factor if rerank else top_k)
+        shortlist_rows = shortlist if row_ids is None else row_ids[shortlist]
+
+        if not rerank:
+            return [(int(r), float(scores[i])) for r, i in zip(shortlist_rows, shortlist)]
+        return self.index.search(query, top_k, np.sort(shortlist_rows))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / QUANTIZED_FILES[self.kind]
+        tmp = path.with_suffix('.tmp')
+        arrays = {'codes': self.codes, 'fingerprint': self.index.fingerprint()}
+        if self.kind == 'int8':
+            arrays['scales'] = self.scales
+        else:
+            arrays['codebooks'] = self.codebooks
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, kind: str, index_directory: str = INDEX_DIRECTORY) -> Optional['QuantizedIndex']:
+        """
+        Load saved codes, or None if missing, built for a different catalog,
+        or older than the index's embeddings (cards were re-embedded).
+        """
+        path = Path(index_directory) / QUANTIZED_FILES[kind]
+        if not path.exists() or older_than_embeddings(path, index):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint():
+                return None
+            return cls(index, kind, data['codes'],
+                       scales=data['scales'] if kind == 'int8' else None,
+                       codebooks=data['codebooks'] if kind == 'pq' else None)
+
+    @classmethod
+    def open(cls, index: CardIndex, kind: str, index_directory: str = INDEX_DIRECTORY) -> 'QuantizedIndex':
+        """Load the quantized index, building and saving it when missing or stale."""
+        quantized = cls.load(index, kind, index_directory)
+        if quantized is None:
+            print(f"🔄 Building {kind} quantized index...")
+            quantized = cls.build(index, kind)
+            quantized.save(index_directory)
+        return quantized
+
+
+def recall_report(quantized: QuantizedIndex, top_k: int = 10, num_queries: int = 200) -> dict:
+    """Memory ratio plus recall@top_k and latency with and without re-ranking, and exact search latency."""
+    index = quantized.index
+    queries = sample_queries(index, num_queries)
+    report = {
+        'kind': quantized.kind,
+        'cards': len(index),
+        'float32_mb': round(len(index) * index.dimension * 4 / (1024 * 1024), 2),
+        'quantized_mb': round(quantized.nbytes / (1024 * 1024), 2),
+        'compression': round(len(index) * index.dimension * 4 / max(quantized.nbytes, 1), 1),
+        'top_k': top_k,
+        'results': [],
+    }
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, top_k)
+    report['exact_latency_ms'] = round((time.perf_counter() - start) * 1000 / max(len(queries), 1), 3)
+    for rerank in (False, True):
+        quantized.rerank = rerank
+        start = time.perf_counter()
+        for query in queries:
+            quantized.search(query, top_k)
+        latency_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        report['results'].append({
+            'rerank': rerank,
+            'recall': round(measure_recall(index, quantized, queries, top_k), 4),
+            'latency_ms': round(latency_ms, 3),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate quantized card embedding indexes")
+    parser.add_argument('command', choices=['build', 'recall'])
+    parser.add_argument('--kind', choices=sorted(QUANTIZED_FILES), default='int8', help='Quantization scheme')
+    parser.add_argument('--subspaces', type=int, default=DEFAULT_SUBSPACES, help='PQ subspaces (bytes per card)')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--top-k', type=int, default=10, help='k for recall@k')
+    parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries for the recall report')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        quantized = QuantizedIndex.build(index, args.kind, args.subspaces)
+        quantized.save(args.index_dir)
+        ratio = len(index) * index.dimension * 4 / max(quantized.nbytes, 1)
+        print(f"✅ Built {args.kind} index over {len(index)} cards: {quantized.nbytes / (1024 * 1024):.2f} MB "
+              f"({ratio:.1f}x smaller than float32) in {time.perf_counter() - start:.1f}s")
+        return
+
+    quantized = QuantizedIndex.open(index, args.kind, args.index_dir)
+    print(json.dumps(recall_report(quantized, args.top_k, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Query Embedding Cache
+LRU cache of search-query embeddings persisted to a local SQLite file, shared
+by search_cards.py and quick_search.py. Repeated queries are answered without
+calling the embedding API.
+
+Entries are keyed by embedding model + normalized query text (lowercased,
+whitespace collapsed). When the cache grows past MAX_ENTRIES the least
+recently used entries are evicted.
+
+Usage:
+    python scripts/query_cache.py stats
+    python scripts/query_cache.py clear
+"""
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Configuration
+QUERY_CACHE_PATH = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\SearchIndex\query_cache.sqlite"
+MAX_ENTRIES = 10000
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share an entry."""
+    return ' '.join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    """SQLite-backed LRU cache of query embeddings with hit/miss counters, safe to share between threads."""
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the cache file on first use. Any failure disables the cache instead of the search."""
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, query)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_last_used ON query_embeddings (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Query cache disabled ({self.path}): {e}")
+            self._disabled = True
+        return self._conn
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, query: str, model: str) -> Optional[List[float]]:
+        """Return the cached embedding for query, or None on a miss."""
+        key = normalize_query(query)
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                    (model, key)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    self._count(conn, 'misses')
+                    conn.commit()
+                    return None
+
+                self.hits += 1
+                conn.execute(
+                    "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+                    (time.time(), model, key)
+                )
+                self._count(conn, 'hits')
+                conn.commit()
+                return np.frombuffer(row[0], dtype=np.float32).tolist()
+            except sqlite3.Error as e:
+                print(f"⚠️  Query cache read failed: {e}")
+                return None
+
+    def put(self, query: str, model: str, embedding: List[float]):
+        """Store an embedding and evict the least recently used entries past max_entries."""
+        if not embedding:
+            return
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, embedding, last_used) VALUES (?, ?, ?, ?)",
+                    (model, normalize_query(query), blob, time.time())
+                )
+                conn.execute(
+                    "DELETE FROM query_embeddings WHERE rowid IN ("
+                    "  SELECT rowid FROM query_embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (self.max_entries,)
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️  Query cache write failed: {e}")
+
+    def get_or_embed(self, query: str, model: str,
+                     embed_fn: Callable[[str], List[float]]) -> List[float]:
+        """Return the cached embedding, calling embed_fn (and caching its result) on a miss."""
+        embedding = self.get(query, model)
+        if embedding is not None:
+            return embedding
+        embedding = embed_fn(query)
+        if embedding:
+            self.put(query, model, embedding)
+        return embedding
+
+    def stats(self) -> Dict:
+        """Session and lifetime hit/miss counters plus the current entry count."""
+        stats = {
+            'entries': 0,
+            'max_entries': self.max_entries,
+            'session_hits': self.hits,
+            'session_misses': self.misses,
+            'total_hits': 0,
+            'total_misses': 0,
+        }
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return stats
+            stats['entries'] = conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            for name, value in conn.execute("SELECT name, value FROM counters"):
+                stats[f'total_{name}'] = value
+        return stats
+
+    def clear(self):
+        """Remove all cached embeddings and reset the counters."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute("DELETE FROM query_embeddings")
+            conn.execute("DELETE FROM counters")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the query embedding cache")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--path', default=QUERY_CACHE_PATH, help='SQLite cache file')
+    args = parser.parse_args()
+
+    cache = QueryEmbeddingCache(args.path)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"✅ Cleared query cache: {args.path}")
+        return
+
+    stats = cache.stats()
+    total = stats['total_hits'] + stats['total_misses']
+    hit_rate = stats['total_hits'] / total * 100 if total else 0.0
+    print(f"Cache:      {args.path}")
+    print(f"Entries:    {stats['entries']}/{stats['max_entries']}")
+    print(f"Hits:       {stats['total_hits']}")
+    print(f"Misses:     {stats['total_misses']}")
+    print(f"Hit rate:   {hit_rate:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,56 @@
 """
 Quick Card Search - Non-interactive version
 Usage: python quick_search.py "your search query" [number_of_results]
+       python quick_search.py "cute card" --occasion birthday --recipient mom
+       python quick_search.py --batch queries.txt [--top-k 5] [--output results.jsonl]
+       type queries.txt | python quick_search.py --batch -
+
+Queries go to the local search server (search_server.py) when it is running,
+so the catalog is not reloaded on every call. Without a server the search
+runs in-process.
+
+Batch mode reads one query per line, embeds them in batched API calls,
+scores them all with one matrix product and writes one JSON line per query.
+
+--mode picks hybrid (keywords + meaning, the default), semantic or lexical
+search (see bm25_index.py). Lexical queries, and "quoted phrases" in hybrid
+mode, are answered without an embedding API call.
+
+--mmr [LAMBDA] and --max-per-folder N diversify the results so one series
+folder does not fill the whole top k (see diversity.py).
+
+--profile [FILE] reports per-stage timings, bytes read and peak RSS as JSON,
+--cprofile [FILE] also saves cProfile stats (see search_profile.py).
 """
 import sys
 import os
+import argparse
 import json
+import contextlib
+import urllib.request
+import urllib.error
 import google.generativeai as genai
-from pathlib import Path
-import numpy as np
-from typing import List, Dict
+from typing import Dict, List, Optional
+
+from card_index import INDEX_DIRECTORY, BACKENDS, open_index, open_searcher, search_many, load_card_details
+from bm25_index import (BM25Index, SEARCH_MODES, FUSION_DEPTH, is_phrase_query, lexical_ranker, hybrid_ranker,
+                        search_by_mode)
+from facet_index import FacetIndex, add_filter_arguments, filters_from_args
+from diversity import add_diversity_arguments, diversified, is_diversified, shortlist_size
+from query_cache import QueryEmbeddingCache, normalize_query
+from search_profile import stage, add_profile_arguments, profiling
 
 # Configuration
 API_KEY = os.environ.get('GOOGLE_API_KEY')
-if not API_KEY:
-    print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
-    exit(1)
-
-genai.configure(api_key=API_KEY)
 EMBEDDING_MODEL = "models/embedding-001"
 CARDS_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series"
+SEARCH_SERVER_URL = os.environ.get('CARD_SEARCH_SERVER', "http://127.0.0.1:8765")
+SERVER_TIMEOUT = 30  # Seconds
+EMBED_BATCH_SIZE = 100  # Max texts per embedding API call
+
+# Repeated queries are answered from the local cache without an API call.
+# Created in main(), not at import: sharded search workers re-import this module.
+query_cache: Optional[QueryEmbeddingCache] = None
 
 
 def generate_embedding(text: str) -> List[float]:
@@ -27,82 +59,271 @@ def generate_embedding(text: str) -> List[float]:
     return response['embedding'] if isinstance(response, dict) and 'embedding' in response else []
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Calculate cosine similarity between two vectors."""
-    vec1, vec2 = np.array(vec1), np.array(vec2)
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+def generate_embeddings_batch(texts: List[str]) -> List[List[float]]:
+    """Embed many texts with one API call. Returns [] on failure."""
+    try:
+        response = genai.embed_content(model=EMBEDDING_MODEL, content=texts)
+        embeddings = response['embedding'] if isinstance(response, dict) and 'embedding' in response else []
+        return embeddings if len(embeddings) == len(texts) else []
+    except Exception as e:
+        print(f"❌ Error generating embeddings: {e}", file=sys.stderr)
+        return []
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embed queries, answering repeats from the query cache and sending the
+    rest in batches of EMBED_BATCH_SIZE. Failed queries get an empty list.
+    """
+    # Repeated queries in the same batch are embedded once
+    unique: Dict[str, List[float]] = {}
+    first_spelling: Dict[str, str] = {}
+    for q in queries:
+        key = normalize_query(q)
+        if key not in unique:
+            unique[key] = query_cache.get(q, EMBEDDING_MODEL) or []
+            first_spelling[key] = q
+    missing = [key for key, embedding in unique.items() if not embedding]
+
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        batch_embeddings = generate_embeddings_batch([first_spelling[key] for key in batch])
+        for key, embedding in zip(batch, batch_embeddings):
+            unique[key] = embedding
+            query_cache.put(key, EMBEDDING_MODEL, embedding)
+
+    return [unique[normalize_query(q)] for q in queries]
+
+
+def read_queries(path: str) -> List[str]:
+    """One query per line from a file, or stdin when path is '-'. Blank lines are skipped."""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def needs_embedding(query: str, mode: str) -> bool:
+    """Lexical queries and quoted phrases in hybrid mode skip the embedding API."""
+    return mode == 'semantic' or (mode == 'hybrid' and not is_phrase_query(query))
+
+
+def search_batch(queries: List[str], top_k: int = 5, backend: str = 'exact', mode: str = 'hybrid',
+                 filters: Optional[Dict[str, str]] = None, mmr_lambda: Optional[float] = None,
+                 max_per_folder: Optional[int] = None) -> List[Dict]:
+    """Search all queries in-process with one catalog load. Returns one record per query."""
+    with stage('load_index'):
+        index = open_index(INDEX_DIRECTORY, CARDS_DIRECTORY)
+
+    # The same filters apply to every query: resolve them to a row subset once
+    with stage('open_backends'):
+        rows = FacetIndex.open(index, INDEX_DIRECTORY).rows(filters) if filters else None
+
+    to_embed = [i for i, q in enumerate(queries) if needs_embedding(q, mode)]
+    embeddings: List[List[float]] = [[] for _ in queries]
+    if to_embed:
+        if not API_KEY:
+            print("❌ ERROR: GOOGLE_API_KEY environment variable not set!", file=sys.stderr)
+            exit(1)
+        genai.configure(api_key=API_KEY)
+        with stage('embed'):
+            for i, embedding in zip(to_embed, embed_queries([queries[i] for i in to_embed])):
+                embeddings[i] = embedding
+
+    searched = [i for i in range(len(queries)) if embeddings[i] or not needs_embedding(queries[i], mode)]
+    with stage('open_backends'):
+        searcher = index if backend == 'exact' else open_searcher(index, backend, INDEX_DIRECTORY)
+        bm25 = BM25Index.open(index, INDEX_DIRECTORY) if mode != 'semantic' else None
+
+    with stage('rank'):
+        if rows is not None and len(rows) == 0:
+            top_lists = [[] for _ in searched]
+        else:
+            # Embedding rankings for every query in one batch (one matrix product on
+            # exact/sharded), deep enough for diversifying and hybrid fusion
+            depth = shortlist_size(top_k) if is_diversified(mmr_lambda, max_per_folder) else top_k
+            if mode == 'hybrid':
+                depth = max(depth, FUSION_DEPTH)
+            embedded = [i for i in searched if embeddings[i]]
+            semantic = dict(zip(embedded, search_many(searcher, [embeddings[i] for i in embedded], depth, rows)))
+
+            top_lists = []
+            for i in searched:
+                if not embeddings[i]:
+                    rank = lexical_ranker(bm25, queries[i])
+                elif mode == 'hybrid':
+                    rank = hybrid_ranker(bm25, searcher, queries[i], embeddings[i], semantic[i])
+                else:
+                    rank = lambda k, rows, top=semantic[i]: top[:k]
+                top_lists.append(diversified(index, rank, mmr_lambda, max_per_folder)(top_k, rows))
+
+    # Load display fields for every winning card in one pass over the folders
+    winning_rows = sorted({row for top in top_lists for row, _ in top})
+    with stage('details'):
+        details = dict(zip(winning_rows, load_card_details(index, winning_rows)))
+
+    records = [{'query': q, 'results': [], 'error': 'Failed to generate query embedding'} for q in queries]
+    for i, top in zip(searched, top_lists):
+        records[i] = {
+            'query': queries[i],
+            'results': [dict(details[row], rank=rank, score=score) for rank, (row, score) in enumerate(top, 1)],
+        }
+    return records
 
 
-def load_all_cards() -> List[Dict]:
-    """Load all cards with embeddings."""
-    all_cards = []
-    base_path = Path(CARDS_DIRECTORY)
-    
-    for folder in [d for d in base_path.iterdir() if d.is_dir()]:
-        insidenote_path = folder / "insidenote.json"
-        if not insidenote_path.exists():
-            continue
-        
+def run_batch(path: str, top_k: int = 5, output: Optional[str] = None, backend: str = 'exact',
+              mode: str = 'hybrid', filters: Optional[Dict[str, str]] = None,
+              mmr_lambda: Optional[float] = None, max_per_folder: Optional[int] = None):
+    """Run batch mode and write JSONL results to output (or stdout)."""
+    queries = read_queries(path)
+    if not queries:
+        print("⚠️  No queries found.", file=sys.stderr)
+        return
+
+    if output:
+        records = search_batch(queries, top_k, backend, mode, filters, mmr_lambda, max_per_folder)
+    else:
+        # Keep stdout clean JSONL; progress and warnings go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            records = search_batch(queries, top_k, backend, mode, filters, mmr_lambda, max_per_folder)
+
+    with stage('display'):
+        out = open(output, 'w', encoding='utf-8') if output else sys.stdout
         try:
-            with open(insidenote_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                cards = data['cards'] if isinstance(data, dict) and 'cards' in data else data
-            
-            for card in cards:
-                if 'embedding' in card and card['embedding']:
-                    all_cards.append({
-                        'filename': card['filename'],
-                        'folder': folder.name,
-                        'image_path': str(folder / card['filename']),
-                        'inside_note': card.get('inside_note', ''),
-                        'embedding': card['embedding']
-                    })
-        except:
-            continue
-    
-    return all_cards
-
-
-def search_cards(query: str, top_k: int = 5):
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        finally:
+            if output:
+                out.close()
+
+    failed = sum(1 for r in records if 'error' in r)
+    print(f"✅ Searched {len(records)} queries ({failed} failed, "
+          f"{query_cache.hits} cached embeddings)", file=sys.stderr)
+
+
+def search_via_server(query: str, top_k: int = 5, mode: str = 'hybrid',
+                      filters: Optional[Dict[str, str]] = None, mmr_lambda: Optional[float] = None,
+                      max_per_folder: Optional[int] = None) -> Optional[List[Dict]]:
+    """Ask the running search server. Returns None when no server is reachable."""
+    payload = {'query': query, 'top_k': top_k, 'mode': mode, 'filters': filters or {},
+               'mmr_lambda': mmr_lambda, 'max_per_folder': max_per_folder}
+    request = urllib.request.Request(
+        f"{SEARCH_SERVER_URL}/search",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    try:
+        with stage('server'), urllib.request.urlopen(request, timeout=SERVER_TIMEOUT) as response:
+            return json.loads(response.read().decode('utf-8'))['results']
+    except urllib.error.HTTPError as e:
+        print(f"⚠️  Search server error: {e.read().decode('utf-8', 'replace')}")
+        return None
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def search_local(query: str, top_k: int = 5, backend: str = 'exact', mode: str = 'hybrid',
+                 filters: Optional[Dict[str, str]] = None, mmr_lambda: Optional[float] = None,
+                 max_per_folder: Optional[int] = None) -> List[Dict]:
+    """Load the index in this process and search it."""
+    if needs_embedding(query, mode):
+        if not API_KEY:
+            print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
+            exit(1)
+        genai.configure(api_key=API_KEY)
+
+    # Load cards
+    with stage('load_index'):
+        index = open_index(INDEX_DIRECTORY, CARDS_DIRECTORY)
+    print(f"✅ Loaded {len(index)} cards")
+
+    def embed(text: str) -> List[float]:
+        # Cached queries skip the API call
+        hits_before = query_cache.hits
+        embedding = query_cache.get_or_embed(text, EMBEDDING_MODEL, generate_embedding)
+        if query_cache.hits > hits_before:
+            print("⚡ Query embedding served from cache")
+        return embedding
+
+    # Score the cards and keep the top K
+    with stage('open_backends'):
+        searcher = open_searcher(index, backend, INDEX_DIRECTORY) if needs_embedding(query, mode) else None
+    results = search_by_mode(index, query, mode, embed, top_k, filters, searcher, index_directory=INDEX_DIRECTORY,
+                             mmr_lambda=mmr_lambda, max_per_folder=max_per_folder)
+    if results is None:
+        print("❌ Failed to generate query embedding")
+        return []
+    return [dict(card, score=score) for card, score in results]
+
+
+def search_cards(query: str, top_k: int = 5, backend: str = 'exact', mode: str = 'hybrid',
+                 filters: Optional[Dict[str, str]] = None, mmr_lambda: Optional[float] = None,
+                 max_per_folder: Optional[int] = None):
     """Search and display results."""
     print(f"\n🔍 Searching for: \"{query}\"")
-    
-    # Load cards
-    cards = load_all_cards()
-    print(f"✅ Loaded {len(cards)} cards")
-    
-    # Generate query embedding
-    query_embedding = generate_embedding(query)
-    
-    # Calculate similarities
-    similarities = [(card, cosine_similarity(query_embedding, card['embedding'])) for card in cards]
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    
+    if filters:
+        print("   Filters: " + ", ".join(f"{field}={value}" for field, value in filters.items()))
+
+    # The server runs its own configured backend
+    results = search_via_server(query, top_k, mode, filters, mmr_lambda, max_per_folder) if backend == 'exact' else None
+    if results is None:
+        results = search_local(query, top_k, backend, mode, filters, mmr_lambda, max_per_folder)
+    else:
+        print("⚡ Answered by search server")
+
     # Display results
-    print(f"\n{'='*80}")
-    print(f"TOP {top_k} RESULTS")
-    print(f"{'='*80}\n")
-    
-    for i, (card, score) in enumerate(similarities[:top_k], 1):
-        print(f"#{i} - Match: {score*100:.1f}%")
-        print(f"   Path: {card['image_path']}")
-        print(f"   Note: {card['inside_note'][:100]}...")
-        print()
+    with stage('display'):
+        print(f"\n{'='*80}")
+        print(f"TOP {top_k} RESULTS")
+        print(f"{'='*80}\n")
 
+        for i, card in enumerate(results, 1):
+            print(f"#{i} - Match: {card['score']*100:.1f}%")
+            print(f"   Path: {card['image_path']}")
+            print(f"   Note: {card['inside_note'][:100]}...")
+            print()
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
+
+def main():
+    global query_cache
+    query_cache = QueryEmbeddingCache()
+    parser = argparse.ArgumentParser(description="Non-interactive card search")
+    parser.add_argument('query', nargs='?', help='Search text')
+    parser.add_argument('number_of_results', nargs='?', type=int, default=None, help='Number of results (default 5)')
+    parser.add_argument('--top-k', type=int, default=5, help='Number of results per query')
+    parser.add_argument('--batch', metavar='FILE', help="File with one query per line, or '-' for stdin")
+    parser.add_argument('--output', metavar='FILE', help='Write batch results (JSONL) here instead of stdout')
+    parser.add_argument('--backend', choices=BACKENDS, default='exact', help='Search backend (default: exact)')
+    parser.add_argument('--mode', choices=SEARCH_MODES, default='hybrid',
+                        help='hybrid: keywords + meaning, semantic: meaning only, lexical: keywords only (default: hybrid)')
+    add_filter_arguments(parser)
+    add_diversity_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    filters = filters_from_args(args)
+    top_k = args.number_of_results or args.top_k
+
+    if args.batch:
+        with profiling(args):
+            run_batch(args.batch, top_k, args.output, args.backend, args.mode, filters, args.mmr,
+                      args.max_per_folder)
+        return
+
+    if not args.query:
         print("Usage: python quick_search.py \"your search query\" [number_of_results]")
         print("\nExample:")
         print('  python quick_search.py "funny birthday card" 5')
+        print('  python quick_search.py "cute card" --occasion birthday --recipient mom')
+        print('  python quick_search.py --batch queries.txt --output results.jsonl')
         exit(1)
-    
-    query = sys.argv[1]
-    top_k = int(sys.argv[2]) if len(sys.argv) > 2 else 5
-    
-    search_cards(query, top_k)
-
-
 
+    with profiling(args):
+        search_cards(args.query, top_k, args.backend, args.mode, filters, args.mmr, args.max_per_folder)
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+API Rate Limiter
+Token buckets for requests per minute and tokens per minute, shared by all
+threads that call the embedding API (see generate_embeddings.py).
+
+Each call first takes one request and its estimated token count from the
+buckets, waiting until both have enough. When the API still answers with a
+rate-limit (429) or server (5xx) error, every caller pauses for an
+exponentially growing, jittered delay and the refill rate is halved; each
+success after that restores a little of the rate (additive increase,
+multiplicative decrease), so the limiter settles just under the real quota.
+"""
+import time
+import random
+import threading
+from typing import Dict, Optional
+
+# Configuration
+CHARACTERS_PER_TOKEN = 4  # Rough token estimate for English text
+MIN_RATE_FACTOR = 0.05  # Never throttle below 5% of the configured rate
+RECOVERY_STEP = 0.05  # Rate fraction regained per successful call
+BASE_BACKOFF = 1.0  # Seconds, doubled per consecutive throttle
+MAX_BACKOFF = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARACTERS_PER_TOKEN)
+
+
+class TokenBucket:
+    """Holds up to capacity units and refills at rate_per_minute. Not thread-safe on its own."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, rate_factor: float = 1.0):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate_per_second * rate_factor)
+        self.updated = now
+
+    def wait_time(self, amount: float, rate_factor: float = 1.0) -> float:
+        """Seconds until amount is available (0 if it already is)."""
+        # A request larger than the bucket waits for a full bucket instead of forever
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / (self.rate_per_second * rate_factor))
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits with adaptive backoff, shared across threads."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self._lock = threading.Lock()
+        # Statistics
+        self.started = time.monotonic()
+        self.request_count = 0
+        self.token_count = 0
+        self.throttle_count = 0
+
+    def acquire(self, tokens: int = 1):
+        """Block until one request with this many tokens may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now, self.rate_factor)
+                self.tokens.refill(now, self.rate_factor)
+                wait = max(self.paused_until - now,
+                           self.requests.wait_time(1, self.rate_factor),
+                           self.tokens.wait_time(tokens, self.rate_factor))
+                if wait <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= min(tokens, self.tokens.capacity)
+                    self.request_count += 1
+                    self.token_count += tokens
+                    return
+            time.sleep(wait)
+
+    def succeeded(self):
+        """Record a successful call: recover part of the rate after throttling."""
+        with self._lock:
+            self.consecutive_throttles = 0
+            self.rate_factor = min(1.0, self.rate_factor + RECOVERY_STEP)
+
+    def throttled(self) -> float:
+        """
+        Record a 429/5xx answer: halve the rate and pause every caller.
+        Returns the pause in seconds.
+        """
+        with self._lock:
+            self.throttle_count += 1
+            self.consecutive_throttles += 1
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+            delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.consecutive_throttles - 1))
+            delay *= random.uniform(0.5, 1.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            return delay
+
+    def stats(self, items: int = 0) -> Dict:
+        """Throughput since the limiter was created."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'seconds': round(elapsed, 1),
+            'requests': self.request_count,
+            'items': items,
+            'estimated_tokens': self.token_count,
+            'items_per_second': round(items / elapsed, 1),
+            'requests_per_minute': round(self.request_count * 60 / elapsed, 1),
+            'tokens_per_minute': round(self.token_count * 60 / elapsed),
+            'throttled': self.throttle_count,
+            'rate_factor': round(self.rate_factor, 2),
+        }
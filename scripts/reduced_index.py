@@ -0,0 +1,245 @@
+"""
+Reduced-Dimension Card Embedding Index
+A lower-dimensional copy of the card embeddings for cheaper interactive
+search: scoring cost and resident memory shrink with the dimension.
+
+    pca      - principal components fitted on the catalog. Cards are stored as
+               their centered projections, and a query is scored as
+               <q, mean> + <q W, (x - mean) W>, which approximates <q, x>.
+    truncate - Matryoshka-style: keep the first d dimensions and renormalize.
+               Only meaningful for models trained for truncation.
+
+The best candidates can be re-ranked with exact float32 scores from the
+memory-mapped card index (only the shortlist rows are read). `recall`
+reports recall@5 and recall@10 against the full vectors for several
+dimensions, to pick the smallest one that keeps quality.
+
+Usage:
+    python scripts/reduced_index.py recall --dimensions 64 128 256 384
+    python scripts/reduced_index.py build --method pca --dimension 256
+    python scripts/quick_search.py "funny birthday card" --backend reduced
+"""
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from card_index import (CardIndex, INDEX_DIRECTORY, normalize_rows, select_top_k, older_than_embeddings,
+                        measure_recall, sample_queries)
+
+# Configuration
+REDUCED_FILE = "reduced.npz"
+METHODS = ['pca', 'truncate']
+DEFAULT_DIMENSION = 256
+PCA_TRAINING_SAMPLE = 20000
+RERANK_FACTOR = 4  # Shortlist size = top_k * RERANK_FACTOR when re-ranking
+BLOCK_SIZE = 4096  # Rows per block while projecting
+RECALL_DIMENSIONS = [64, 128, 192, 256, 384, 512]
+
+
+class ReducedIndex:
+    """Card embeddings projected to fewer dimensions, with optional exact re-ranking."""
+
+    def __init__(self, index: CardIndex, method: str, matrix: np.ndarray,
+                 mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None,
+                 rerank: bool = True, rerank_factor: int = RERANK_FACTOR):
+        self.index = index
+        self.method = method
+        self.matrix = matrix          # (N, d) float32
+        self.mean = mean              # pca: (D,) catalog mean
+        self.components = components  # pca: (D, d) principal axes, strongest first
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.components is None else self.components.nbytes + self.mean.nbytes
+        return self.matrix.nbytes + extra
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build_pca(cls, index: CardIndex, dimension: int, seed: int = 0) -> 'ReducedIndex':
+        """Fit PCA on (a sample of) the catalog and project every card."""
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(len(index), min(PCA_TRAINING_SAMPLE, len(index)), replace=False))
+        sample = np.asarray(index.embeddings[sample_rows], dtype=np.float64)
+        mean = sample.mean(axis=0)
+        centered = sample - mean
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        components = eigenvectors[:, np.argsort(eigenvalues)[::-1][:dimension]].astype(np.float32)
+        mean = mean.astype(np.float32)
+
+        matrix = np.empty((len(index), components.shape[1]), dtype=np.float32)
+        for start in range(0, len(index), BLOCK_SIZE):
+            block = np.asarray(index.embeddings[start:start + BLOCK_SIZE], dtype=np.float32)
+            matrix[start:start + len(block)] = (block - mean) @ components
+        return cls(index, 'pca', matrix, mean=mean, components=components)
+
+    @classmethod
+    def build_truncate(cls, index: CardIndex, dimension: int) -> 'ReducedIndex':
+        """Keep the leading dimensions of every card, renormalized."""
+        return cls(index, 'truncate', normalize_rows(index.embeddings[:, :dimension]))
+
+    @classmethod
+    def build(cls, index: CardIndex, method: str = 'pca', dimension: int = DEFAULT_DIMENSION) -> 'ReducedIndex':
+        if len(index) == 0:
+            raise ValueError("Cannot reduce an empty catalog")
+        dimension = min(dimension, index.dimension)
+        if method == 'pca':
+            return cls.build_pca(index, dimension)
+        if method == 'truncate':
+            return cls.build_truncate(index, dimension)
+        raise ValueError(f"Unknown reduction: {method}")
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def approximate_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine similarity of a unit query with every (or every listed) card."""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if self.method == 'pca':
+            return matrix @ (query @ self.components) + float(query @ self.mean)
+        return matrix @ normalize_rows(query[:self.dimension])
+
+    def search(self, query_embedding: List[float], top_k: int = 5, rows: Optional[np.ndarray] = None,
+               rerank: Optional[bool] = None) -> List[Tuple[int, float]]:
+        """
+        Score the reduced vectors, then optionally re-rank a
+        top_k * rerank_factor shortlist with exact float32 scores.
+        rows restricts the search to a subset.
+        """
+        query = normalize_rows(query_embedding)
+        if len(self) == 0 or not query.any():
+            return []
+        rerank = self.rerank if rerank is None else rerank
+
+        row_ids = None if rows is None else np.asarray(rows, dtype=np.int64)
+        scores = self.approximate_scores(query, row_ids)
+        shortlist = select_top_k(scores, top_k * self.rerank_factor if rerank else top_k)
+        shortlist_rows = shortlist if row_ids is None else row_ids[shortlist]
+
+        if not rerank:
+            return [(int(r), float(scores[i])) for r, i in zip(shortlist_rows, shortlist)]
+        return self.index.search(query, top_k, np.sort(shortlist_rows))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / REDUCED_FILE
+        tmp = path.with_suffix('.tmp')
+        arrays = {'method': self.method, 'matrix': self.matrix, 'fingerprint': self.index.fingerprint()}
+        if self.method == 'pca':
+            arrays.update(mean=self.mean, components=self.components)
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> Optional['ReducedIndex']:
+        """
+        Load the saved reduced index, or None if missing, built for a
+        different catalog, or older than the index's embeddings.
+        """
+        path = Path(index_directory) / REDUCED_FILE
+        if not path.exists() or older_than_embeddings(path, index):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint():
+                return None
+            method = str(data['method'])
+            return cls(index, method, data['matrix'],
+                       mean=data['mean'] if method == 'pca' else None,
+                       components=data['components'] if method == 'pca' else None)
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'ReducedIndex':
+        """Load the reduced index, building and saving the default one when missing or stale."""
+        reduced = cls.load(index, index_directory)
+        if reduced is None:
+            print(f"🔄 Building {DEFAULT_DIMENSION}-dim PCA index...")
+            reduced = cls.build(index)
+            reduced.save(index_directory)
+        return reduced
+
+
+def recall_report(index: CardIndex, methods: List[str], dimensions: List[int],
+                  num_queries: int = 200) -> dict:
+    """Recall@5 / recall@10 against the full vectors, memory and latency per method and dimension."""
+    queries = sample_queries(index, num_queries)
+    report = {
+        'cards': len(index),
+        'full_dimension': index.dimension,
+        'float32_mb': round(len(index) * index.dimension * 4 / (1024 * 1024), 2),
+        'results': [],
+    }
+    for method in methods:
+        for dimension in dimensions:
+            if dimension > index.dimension:
+                continue
+            reduced = ReducedIndex.build(index, method, dimension)
+            for rerank in (False, True):
+                reduced.rerank = rerank
+                start = time.perf_counter()
+                for query in queries:
+                    reduced.search(query, 10)
+                latency_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+                report['results'].append({
+                    'method': method,
+                    'dimension': dimension,
+                    'rerank': rerank,
+                    'reduced_mb': round(reduced.nbytes / (1024 * 1024), 2),
+                    'recall@5': round(measure_recall(index, reduced, queries, 5), 4),
+                    'recall@10': round(measure_recall(index, reduced, queries, 10), 4),
+                    'latency_ms': round(latency_ms, 3),
+                })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate reduced-dimension card embedding indexes")
+    parser.add_argument('command', choices=['build', 'recall'])
+    parser.add_argument('--method', choices=METHODS, nargs='+', default=['pca'],
+                        help='Reduction method(s); build uses the first')
+    parser.add_argument('--dimension', type=int, default=DEFAULT_DIMENSION, help='Target dimension for build')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=RECALL_DIMENSIONS,
+                        help='Dimensions compared by recall')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries for the recall report')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        reduced = ReducedIndex.build(index, args.method[0], args.dimension)
+        reduced.save(args.index_dir)
+        ratio = len(index) * index.dimension * 4 / max(reduced.nbytes, 1)
+        print(f"✅ Built {reduced.dimension}-dim {reduced.method} index over {len(index)} cards: "
+              f"{reduced.nbytes / (1024 * 1024):.2f} MB ({ratio:.1f}x smaller than float32) "
+              f"in {time.perf_counter() - start:.1f}s")
+        return
+
+    print(json.dumps(recall_report(index, args.method, args.dimensions, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
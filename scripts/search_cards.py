@@ -7,19 +7,24 @@ import json
 import google.generativeai as genai
 from pathlib import Path
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+
+from card_index import CardIndex, INDEX_DIRECTORY, BACKENDS, open_index, open_searcher
+from bm25_index import BM25Index, SEARCH_MODES, is_phrase_query, search_by_mode
+from facet_index import FacetIndex, add_filter_arguments, filters_from_args
+from diversity import add_diversity_arguments
+from query_cache import QueryEmbeddingCache
+from search_profile import stage, add_profile_arguments, profiling
 
 # Configuration
 API_KEY = os.environ.get('GOOGLE_API_KEY')
-if not API_KEY:
-    print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
-    print("Please set it using: $env:GOOGLE_API_KEY=\"your_api_key_here\"")
-    exit(1)
-
-genai.configure(api_key=API_KEY)
 EMBEDDING_MODEL = "models/embedding-001"
 CARDS_DIRECTORY = r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series"
 
+# Repeated queries are answered from the local cache without an API call.
+# Created in main(), not at import: sharded search workers re-import this module.
+query_cache: Optional[QueryEmbeddingCache] = None
+
 
 def generate_embedding(text: str) -> List[float]:
     """Generate embedding for a search query."""
@@ -38,140 +43,64 @@ def generate_embedding(text: str) -> List[float]:
         return []
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Calculate cosine similarity between two vectors."""
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    
-    dot_product = np.dot(vec1, vec2)
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
-    
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-    
-    return dot_product / (norm1 * norm2)
+def get_query_embedding(query: str) -> List[float]:
+    """Return the query embedding from the cache, calling the API only on a miss."""
+    return query_cache.get_or_embed(query, EMBEDDING_MODEL, generate_embedding)
 
 
-def load_all_cards() -> List[Dict]:
+def load_all_cards() -> CardIndex:
     """
-    Load all cards with embeddings from all folders.
-    Returns list of dicts with card info and file paths.
+    Load all card embeddings.
+    Memory-maps the prebuilt search index (see card_index.py) and falls back
+    to reading every insidenote.json when no index has been built.
     """
-    all_cards = []
-    base_path = Path(CARDS_DIRECTORY)
-    
-    if not base_path.exists():
+    if not Path(CARDS_DIRECTORY).exists() and not CardIndex.exists(INDEX_DIRECTORY):
         print(f"❌ Directory not found: {CARDS_DIRECTORY}")
-        return []
-    
-    # Get all subdirectories
-    folders = [d for d in base_path.iterdir() if d.is_dir()]
+        return CardIndex(np.zeros((0, 0), dtype=np.float32), [])
     
-    print(f"Loading cards from {len(folders)} folders...")
-    
-    for folder in folders:
-        insidenote_path = folder / "insidenote.json"
-        metadata_path = folder / "metadata.json"
-        
-        if not insidenote_path.exists():
-            continue
-        
-        try:
-            # Load insidenote with embeddings
-            with open(insidenote_path, 'r', encoding='utf-8') as f:
-                insidenote_data = json.load(f)
-                # Handle both formats
-                if isinstance(insidenote_data, dict) and 'cards' in insidenote_data:
-                    insidenote_list = insidenote_data['cards']
-                else:
-                    insidenote_list = insidenote_data
-            
-            # Load metadata for additional info
-            metadata_list = []
-            if metadata_path.exists():
-                with open(metadata_path, 'r', encoding='utf-8') as f:
-                    metadata_data = json.load(f)
-                    if isinstance(metadata_data, dict) and 'cards' in metadata_data:
-                        metadata_list = metadata_data['cards']
-                    else:
-                        metadata_list = metadata_data
-            
-            # Create metadata lookup
-            metadata_map = {item['filename']: item for item in metadata_list}
-            
-            # Process each card
-            for card in insidenote_list:
-                if 'embedding' not in card or not card['embedding']:
-                    continue
-                
-                filename = card['filename']
-                metadata = metadata_map.get(filename, {})
-                
-                # Full path to the image
-                image_path = folder / filename
-                
-                card_info = {
-                    'filename': filename,
-                    'folder': folder.name,
-                    'image_path': str(image_path),
-                    'inside_note': card.get('inside_note', ''),
-                    'embedding': card['embedding'],
-                    # Metadata
-                    'title': metadata.get('title', 'N/A'),
-                    'description': metadata.get('description', ''),
-                    'occasion': metadata.get('occasion', 'N/A'),
-                    'emotion': metadata.get('emotion', 'N/A'),
-                    'visible_text': metadata.get('visible_text', 'N/A'),
-                    'recipient': metadata.get('recipient', 'N/A'),
-                    'keywords': metadata.get('keywords', []),
-                }
-                
-                all_cards.append(card_info)
-        
-        except Exception as e:
-            print(f"⚠️  Error loading {folder.name}: {e}")
-            continue
-    
-    print(f"✅ Loaded {len(all_cards)} cards with embeddings\n")
-    return all_cards
+    with stage('load_index'):
+        index = open_index(INDEX_DIRECTORY, CARDS_DIRECTORY)
+    print(f"✅ Loaded {len(index)} cards with embeddings\n")
+    return index
 
 
-def search_cards(query: str, cards: List[Dict], top_k: int = 5) -> List[Tuple[Dict, float]]:
+def search_cards(query: str, index: CardIndex, top_k: int = 5, searcher=None,
+                 mode: str = 'hybrid', bm25: Optional[BM25Index] = None,
+                 filters: Optional[Dict[str, str]] = None,
+                 facets: Optional[FacetIndex] = None, mmr_lambda: Optional[float] = None,
+                 max_per_folder: Optional[int] = None) -> List[Tuple[Dict, float]]:
     """
     Search for cards matching the query.
     
     Args:
-        query: Search text
-        cards: List of all cards with embeddings
+        query: Search text; "double quotes" search for an exact phrase
+        index: Card embeddings and their (folder, filename) table
         top_k: Number of results to return
+        searcher: Optional search backend from open_searcher() (exact search by default)
+        mode: 'hybrid' (keywords + meaning), 'semantic' or 'lexical' (keywords only, no API call)
+        bm25: Optional keyword index (see bm25_index.py), opened on first use
+        filters: Optional {field: value} filters, e.g. {'occasion': 'birthday', 'recipient': 'mom'}
+        facets: Optional facet index (see facet_index.py) used to apply filters before scoring
+        mmr_lambda: Optional relevance/diversity trade-off for MMR re-ranking (see diversity.py)
+        max_per_folder: Optional cap on results from one category folder
     
     Returns:
         List of (card, similarity_score) tuples
     """
     print(f"🔍 Searching for: \"{query}\"")
-    print("Generating query embedding...")
+    if mode == 'lexical' or (mode == 'hybrid' and is_phrase_query(query)):
+        print("Matching keywords (no embedding needed)...")
+    else:
+        print("Generating query embedding...")
     
-    # Generate embedding for query
-    query_embedding = generate_embedding(query)
+    # Score the cards and load display fields for the top K only (highest first)
+    results = search_by_mode(index, query, mode, get_query_embedding, top_k, filters, searcher, bm25, facets,
+                             index_directory=INDEX_DIRECTORY, mmr_lambda=mmr_lambda, max_per_folder=max_per_folder)
     
-    if not query_embedding:
+    if results is None:
         print("❌ Failed to generate query embedding")
         return []
-    
-    print("Calculating similarities...")
-    
-    # Calculate similarity with all cards
-    similarities = []
-    for card in cards:
-        similarity = cosine_similarity(query_embedding, card['embedding'])
-        similarities.append((card, similarity))
-    
-    # Sort by similarity (highest first)
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return top K results
-    return similarities[:top_k]
+    return results
 
 
 def display_results(results: List[Tuple[Dict, float]]):
@@ -203,8 +132,27 @@ def display_results(results: List[Tuple[Dict, float]]):
         print(f"   {card['image_path']}")
 
 
-def main():
-    """Main search interface."""
+def main(backend: str = 'exact', mode: str = 'hybrid', filters: Optional[Dict[str, str]] = None,
+         mmr_lambda: Optional[float] = None, max_per_folder: Optional[int] = None):
+    """
+    Main search interface.
+    
+    Args:
+        backend: Search backend, 'exact', 'sharded' (multi-process exact) or an approximate index
+            ('ivf', 'hnsw', 'int8', 'pq', 'reduced')
+        mode: Search mode, 'hybrid', 'semantic' or 'lexical'
+        filters: Optional {field: value} filters applied to every query
+        mmr_lambda: Optional MMR trade-off to diversify results (1.0 = relevance only)
+        max_per_folder: Optional cap on results from one category folder
+    """
+    global query_cache
+    if not API_KEY:
+        print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
+        print("Please set it using: $env:GOOGLE_API_KEY=\"your_api_key_here\"")
+        exit(1)
+    genai.configure(api_key=API_KEY)
+    query_cache = QueryEmbeddingCache()
+    
     print("\n" + "="*80)
     print("🎴  SEMANTIC CARD SEARCH  🎴")
     print("="*80)
@@ -214,21 +162,38 @@ def main():
     print("  - 'elegant Christmas card with snowman'")
     print("  - 'heartfelt graduation message'")
     print("  - 'cute card with animals for children'")
+    print("  - '\"happy retirement\"' (quotes match the exact phrase)")
     print("\n" + "-"*80 + "\n")
     
     # Load all cards
-    cards = load_all_cards()
+    index = load_all_cards()
     
-    if not cards:
+    if len(index) == 0:
         print("❌ No cards found. Make sure embeddings have been generated.")
         return
     
+    with stage('open_backends'):
+        searcher = open_searcher(index, backend, INDEX_DIRECTORY)
+        bm25 = None if mode == 'semantic' else BM25Index.open(index, INDEX_DIRECTORY)
+        facets = FacetIndex.open(index, INDEX_DIRECTORY) if filters else None
+    if backend != 'exact':
+        print(f"Using {backend} search backend")
+    if filters:
+        print("Filtering by " + ", ".join(f"{field}={value}" for field, value in filters.items()))
+    if mmr_lambda is not None and max_per_folder:
+        print(f"Diversifying results (MMR lambda={mmr_lambda}, max {max_per_folder} per folder)")
+    elif mmr_lambda is not None:
+        print(f"Diversifying results (MMR lambda={mmr_lambda})")
+    elif max_per_folder:
+        print(f"At most {max_per_folder} results per folder")
+    
     # Interactive search loop
     while True:
         try:
             query = input("\n🔍 Enter your search query (or 'quit' to exit): ").strip()
             
             if query.lower() in ['quit', 'exit', 'q']:
+                print(f"\n⚡ Query cache: {query_cache.hits} hits, {query_cache.misses} misses")
                 print("\n👋 Thank you for using Semantic Card Search!")
                 break
             
@@ -245,10 +210,12 @@ def main():
                 top_k = 5
             
             # Perform search
-            results = search_cards(query, cards, top_k)
+            results = search_cards(query, index, top_k, searcher, mode, bm25, filters, facets,
+                                   mmr_lambda, max_per_folder)
             
             # Display results
-            display_results(results)
+            with stage('display'):
+                display_results(results)
             
             print("\n" + "="*80)
             
@@ -261,9 +228,18 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
-
-
-
-
-
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Interactive semantic card search")
+    parser.add_argument('--backend', choices=BACKENDS, default='exact', help='Search backend (default: exact)')
+    parser.add_argument('--mode', choices=SEARCH_MODES, default='hybrid',
+                        help='hybrid: keywords + meaning, semantic: meaning only, lexical: keywords only (default: hybrid)')
+    add_filter_arguments(parser)
+    add_diversity_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    # --profile reports per-stage timings for the whole session when it ends
+    with profiling(args):
+        main(backend=args.backend, mode=args.mode, filters=filters_from_args(args),
+             mmr_lambda=args.mmr, max_per_folder=args.max_per_folder)
@@ -0,0 +1,217 @@
+"""
+Search Profiling
+Per-stage wall-clock timings, bytes read and peak RSS of one search run,
+emitted as JSON so runs can be compared over time. Used by search_cards.py
+and quick_search.py through --profile [FILE] and --cprofile [FILE].
+
+Stages are marked in the search code with `with stage('name'):`, which costs
+nothing when no profile is active. Nested stages are subtracted from the
+stage around them, so every stage reports its own time and the stages plus
+"unattributed_s" add up to "total_s":
+
+    load_index     open the search index (or parse the card JSON files)
+    open_backends  search backend, keyword and facet indexes
+    embed          query embedding (cache lookup and API call)
+    rank           vector / keyword scoring and rank fusion
+    top_k          selecting and sorting the best scores
+    details        reading display fields of the winning cards
+    server         round trip to the search server
+    display        printing or writing the results
+
+read_bytes counts bytes the process read through file and socket reads.
+Pages of the memory-mapped embedding matrix are not included; they show up
+in peak RSS instead.
+
+Example:
+    python scripts/quick_search.py "funny birthday card" --profile
+    python scripts/quick_search.py --batch queries.txt --profile profiles.jsonl --cprofile search.prof
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Configuration
+DEFAULT_CPROFILE_FILE = "search_profile.prof"
+
+_active: Optional['SearchProfile'] = None
+_inactive = contextlib.nullcontext()
+_probe_bytes = 0
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (Windows, Linux and macOS)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+
+
+def read_bytes() -> Optional[int]:
+    """Bytes read by this process so far, or None where the OS does not report it (macOS)."""
+    if sys.platform == 'win32':
+        import ctypes
+
+        class IoCounters(ctypes.Structure):
+            _fields_ = [(name, ctypes.c_ulonglong) for name in (
+                'ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount',
+                'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount')]
+
+        counters = IoCounters()
+        if ctypes.windll.kernel32.GetProcessIoCounters(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                       ctypes.byref(counters)):
+            return counters.ReadTransferCount
+        return None
+    global _probe_bytes
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    for line in data.splitlines():
+        if line.startswith(b'rchar:'):
+            # rchar counts this function's own earlier reads of /proc/self/io too
+            total = int(line.split()[1]) - _probe_bytes
+            _probe_bytes += len(data)
+            return total
+    return None
+
+
+def stage(name: str):
+    """Context manager timing a stage of the active profile (a no-op when profiling is off)."""
+    return _active.stage(name) if _active is not None else _inactive
+
+
+class SearchProfile:
+    """Collects stage timings for one run; use as a context manager around the run."""
+
+    def __init__(self, output: Optional[str] = '-', cprofile_path: Optional[str] = None):
+        self.output = output  # '-' = stderr, otherwise a JSONL file the report is appended to
+        self.cprofile_path = cprofile_path
+        self.stages: Dict[str, Dict] = {}
+        self._stack: List[Dict] = []
+        self._profiler = None
+        self._started = 0.0
+        self._read_start: Optional[int] = None
+        self.total_s = 0.0
+        self.total_read_bytes: Optional[int] = None
+
+    def __enter__(self) -> 'SearchProfile':
+        global _active
+        _active = self
+        self._read_start = read_bytes()
+        self._started = time.perf_counter()
+        if self.cprofile_path:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.total_s = time.perf_counter() - self._started
+        end_read = read_bytes()
+        if self._read_start is not None and end_read is not None:
+            self.total_read_bytes = end_read - self._read_start
+        _active = None
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(self.cprofile_path)
+            print(f"📊 cProfile stats written to {self.cprofile_path} "
+                  f"(view with: python -m pstats {self.cprofile_path})", file=sys.stderr)
+        if self.output:
+            self.emit(self.output)
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        frame = {'child_s': 0.0, 'child_read': 0, 'read': read_bytes()}
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            end_read = read_bytes()
+            self._stack.pop()
+            read = end_read - frame['read'] if end_read is not None and frame['read'] is not None else None
+
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'read_bytes': 0})
+            entry['seconds'] += elapsed - frame['child_s']
+            entry['calls'] += 1
+            if read is None or entry['read_bytes'] is None:
+                entry['read_bytes'] = None
+            else:
+                entry['read_bytes'] += read - frame['child_read']
+            if self._stack:
+                self._stack[-1]['child_s'] += elapsed
+                self._stack[-1]['child_read'] += read or 0
+
+    def report(self) -> Dict:
+        """The profile as a JSON-serializable dict."""
+        stages = {name: {'seconds': round(entry['seconds'], 6), 'calls': entry['calls'],
+                         'read_bytes': entry['read_bytes']}
+                  for name, entry in self.stages.items()}
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'script': os.path.basename(sys.argv[0]),
+            'args': sys.argv[1:],
+            'total_s': round(self.total_s, 6),
+            'stages': stages,
+            'unattributed_s': round(self.total_s - sum(entry['seconds'] for entry in self.stages.values()), 6),
+            'read_bytes': self.total_read_bytes,
+            'peak_rss_mb': peak_rss_mb(),
+            'cprofile': self.cprofile_path,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        }
+
+    def emit(self, output: str):
+        """Print the report to stderr ('-') or append it as one JSON line to a file."""
+        report = self.report()
+        if output == '-':
+            print(json.dumps(report, indent=2), file=sys.stderr)
+            return
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+        print(f"📊 Profile appended to {output}", file=sys.stderr)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """--profile [FILE] / --cprofile [FILE] options."""
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help='Report per-stage timings, bytes read and peak RSS as JSON '
+                             '(to stderr, or appended as one line to FILE)')
+    parser.add_argument('--cprofile', nargs='?', const=DEFAULT_CPROFILE_FILE, metavar='FILE',
+                        help=f'Also run cProfile and save its stats (default file: {DEFAULT_CPROFILE_FILE})')
+
+
+def profiling(args: argparse.Namespace):
+    """Context manager for a run: a SearchProfile when --profile or --cprofile was given, else a no-op."""
+    if not args.profile and not args.cprofile:
+        return contextlib.nullcontext()
+    return SearchProfile(args.profile or '-', args.cprofile)
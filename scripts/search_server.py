@@ -0,0 +1,293 @@
+"""
+Card Search Server
+Keeps the card index resident and answers search queries over a local HTTP
+API, so each query only pays for the query embedding and the scoring instead
+of a full catalog load. quick_search.py uses it automatically when running.
+
+Endpoints:
+    GET  /health   -> {"status": "ok", "cards": 221, "model": "...", "backend": "exact"}
+    POST /search   <- {"query": "funny birthday card", "top_k": 5, "mode": "hybrid",
+                       "filters": {"occasion": "birthday", "folder": "BirthdayFunny"},
+                       "mmr_lambda": 0.7, "max_per_folder": 2}
+                   -> {"query": "...", "results": [{"rank": 1, "score": 0.85, ...}], "elapsed_ms": 12.3}
+    POST /similar  <- {"card": "BirthdayFloral/card_1.png", "top_k": 5, "filters": {...}}
+                   -> {"card": "...", "results": [...], "elapsed_ms": 0.4}
+
+/similar takes "folder/filename" or a template slug and answers from the
+precomputed neighbour lists (see similar_cards.py), without an API call.
+
+The server polls CARDS_DIRECTORY and, when any insidenote.json,
+metadata.json or embeddings.bin changes, re-indexes just the changed folders and swaps the
+new index in. It only listens on localhost.
+"mode" is hybrid (default), semantic or lexical (see bm25_index.py);
+lexical queries and "quoted phrases" skip the embedding API.
+"mmr_lambda" and "max_per_folder" are optional and diversify the results
+(see diversity.py).
+
+Usage:
+    python scripts/search_server.py
+    python scripts/search_server.py --port 8765 --reload-interval 10
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from card_index import (CardIndex, CARDS_DIRECTORY, INDEX_DIRECTORY, EMBEDDING_MODEL,
+                        FILTER_FIELDS, BACKENDS, CARD_FILES, refresh_index, list_card_folders, open_searcher)
+from bm25_index import BM25Index, SEARCH_MODES, search_by_mode
+from facet_index import FacetIndex
+from similar_cards import NeighborIndex, similar_cards
+from query_cache import QueryEmbeddingCache
+
+# Configuration
+API_KEY = os.environ.get('GOOGLE_API_KEY')
+HOST = "127.0.0.1"
+PORT = 8765
+RELOAD_INTERVAL = 10  # Seconds between checks for changed card files
+MAX_TOP_K = 100
+
+
+def catalog_signature(cards_directory: str) -> Tuple:
+    """(path, mtime, size) of every card file; changes whenever a card file does."""
+    signature = []
+    for folder in list_card_folders(cards_directory):
+        for name in CARD_FILES:
+            path = folder / name
+            if path.exists():
+                stat = path.stat()
+                signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class SearchService:
+    """Resident card index plus the query embedding path."""
+
+    def __init__(self, cards_directory: str = CARDS_DIRECTORY, index_directory: str = INDEX_DIRECTORY,
+                 backend: str = 'exact'):
+        self.cards_directory = cards_directory
+        self.index_directory = index_directory
+        self.backend = backend
+        self.query_cache = QueryEmbeddingCache()
+        self._reload_lock = threading.Lock()
+        self._signature: Tuple = ()
+        self._retired: List = []  # Searchers replaced by the last reload, closed at the next check
+        self.index = self._load()
+        self.searcher = open_searcher(self.index, backend, index_directory)
+        self.bm25 = BM25Index.open(self.index, index_directory)
+        self.facets = FacetIndex.open(self.index, index_directory)
+        self.neighbors = NeighborIndex.open(self.index, index_directory)
+
+    def _load(self) -> CardIndex:
+        """Open the saved index, re-indexing only the folders whose card files changed."""
+        signature = catalog_signature(self.cards_directory)
+        index, changed = refresh_index(self.cards_directory, self.index_directory)
+        if changed:
+            print(f"🔄 Re-indexed {len(changed)} changed folder(s): {', '.join(changed)}")
+
+        self._signature = signature
+        print(f"✅ Loaded {len(index)} cards with embeddings")
+        return index
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index when card files changed. Returns True if it was reloaded."""
+        with self._reload_lock:
+            # Requests that were using a replaced searcher finished long before this check
+            self._close_retired()
+            if catalog_signature(self.cards_directory) == self._signature:
+                return False
+            # Swap in the new index only once it and its backend are fully built
+            index = self._load()
+            searcher = open_searcher(index, self.backend, self.index_directory)
+            bm25 = BM25Index.open(index, self.index_directory)
+            facets = FacetIndex.open(index, self.index_directory)
+            neighbors = NeighborIndex.open(index, self.index_directory)
+            self._retired.append(self.searcher)
+            self.index, self.searcher, self.bm25, self.facets, self.neighbors = (
+                index, searcher, bm25, facets, neighbors)
+            return True
+
+    def _close_retired(self):
+        """Release replaced searchers (the sharded backend's worker pool and shared memory)."""
+        while self._retired:
+            close = getattr(self._retired.pop(), 'close', None)
+            if close is not None:
+                close()
+
+    def close(self):
+        with self._reload_lock:
+            self._retired.append(self.searcher)
+            self._close_retired()
+
+    def embed_query(self, query: str) -> List[float]:
+        def generate_embedding(text: str) -> List[float]:
+            response = genai.embed_content(model=EMBEDDING_MODEL, content=text)
+            return response['embedding'] if isinstance(response, dict) and 'embedding' in response else []
+        return self.query_cache.get_or_embed(query, EMBEDDING_MODEL, generate_embedding)
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict[str, str]] = None,
+               mode: str = 'hybrid', mmr_lambda: Optional[float] = None,
+               max_per_folder: Optional[int] = None) -> Dict:
+        start = time.perf_counter()
+        index, searcher, bm25, facets = self.index, self.searcher, self.bm25, self.facets
+        results = search_by_mode(index, query, mode, self.embed_query, top_k, filters, searcher, bm25, facets,
+                                 index_directory=self.index_directory, mmr_lambda=mmr_lambda,
+                                 max_per_folder=max_per_folder)
+        if results is None:
+            raise RuntimeError("Failed to generate query embedding")
+
+        return {
+            'query': query,
+            'mode': mode,
+            'results': [dict(card, rank=rank, score=score) for rank, (card, score) in enumerate(results, 1)],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+
+
+    def similar(self, card: str, top_k: int = 5, filters: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """Cards similar to card ("folder/filename" or slug), or None if it is not indexed."""
+        start = time.perf_counter()
+        index, neighbors, facets = self.index, self.neighbors, self.facets
+        results = similar_cards(index, card, top_k, neighbors, filters, facets)
+        if results is None:
+            return None
+
+        return {
+            'card': card,
+            'results': [dict(c, rank=rank, score=score) for rank, (c, score) in enumerate(results, 1)],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler; self.server.service is the shared SearchService."""
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+        index = self.server.service.index
+        self._send_json(200, {'status': 'ok', 'cards': len(index), 'model': index.model,
+                              'backend': self.server.service.backend})
+
+    def do_POST(self):
+        if self.path == '/similar':
+            self._similar()
+            return
+        if self.path != '/search':
+            self._send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            query = str(request.get('query', '')).strip()
+            top_k = max(1, min(int(request.get('top_k', 5)), MAX_TOP_K))
+            filters = {k: v for k, v in (request.get('filters') or {}).items() if k in FILTER_FIELDS}
+            mode = str(request.get('mode', 'hybrid'))
+            mmr_lambda = None if request.get('mmr_lambda') is None else float(request['mmr_lambda'])
+            max_per_folder = None if request.get('max_per_folder') is None else int(request['max_per_folder'])
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {'error': f'Invalid request: {e}'})
+            return
+
+        if not query:
+            self._send_json(400, {'error': 'Missing query'})
+            return
+        if mode not in SEARCH_MODES:
+            self._send_json(400, {'error': f'Unknown mode: {mode}'})
+            return
+
+        try:
+            self._send_json(200, self.server.service.search(query, top_k, filters, mode, mmr_lambda, max_per_folder))
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+
+    def _similar(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            card = str(request.get('card', '')).strip()
+            top_k = max(1, min(int(request.get('top_k', 5)), MAX_TOP_K))
+            filters = {k: v for k, v in (request.get('filters') or {}).items() if k in FILTER_FIELDS}
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {'error': f'Invalid request: {e}'})
+            return
+
+        if not card:
+            self._send_json(400, {'error': 'Missing card'})
+            return
+
+        try:
+            response = self.server.service.similar(card, top_k, filters)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        if response is None:
+            self._send_json(404, {'error': f'Unknown card: {card}'})
+        else:
+            self._send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def watch_catalog(service: SearchService, interval: float):
+    """Background loop that hot-reloads the index when card files change."""
+    while True:
+        time.sleep(interval)
+        try:
+            if service.reload_if_changed():
+                print("🔄 Card files changed, index reloaded")
+        except Exception as e:
+            print(f"⚠️  Reload failed, keeping the previous index: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve card search queries from a resident index")
+    parser.add_argument('--port', type=int, default=PORT, help='Port to listen on (localhost only)')
+    parser.add_argument('--cards-dir', default=CARDS_DIRECTORY, help='Folder with one subfolder per card category')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder')
+    parser.add_argument('--backend', choices=BACKENDS, default='exact', help='Search backend (default: exact)')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help='Seconds between checks for changed card files (0 disables hot reload)')
+    args = parser.parse_args()
+
+    if not API_KEY:
+        print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
+        print("Please set it using: $env:GOOGLE_API_KEY=\"your_api_key_here\"")
+        exit(1)
+    genai.configure(api_key=API_KEY)
+
+    service = SearchService(args.cards_dir, args.index_dir, args.backend)
+
+    if args.reload_interval > 0:
+        threading.Thread(target=watch_catalog, args=(service, args.reload_interval), daemon=True).start()
+
+    server = ThreadingHTTPServer((HOST, args.port), SearchRequestHandler)
+    server.service = service
+    print(f"🎴 Card search server listening on http://{HOST}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Search server stopped")
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Sharded Exact Search
+Exact cosine search split across a pool of worker processes. The embedding
+matrix is cut into one contiguous row range per worker; every worker scores
+its shard, keeps a local top-k and the results are merged, so the answer is
+the same as CardIndex.search (up to float rounding) but the scoring runs on
+all cores.
+
+Workers never get a copy of the matrix: a saved index is memory-mapped from
+its embeddings file by every worker (the OS shares the pages), and an index that
+only exists in memory is placed in one multiprocessing.shared_memory block.
+Each worker runs single-threaded BLAS so the pool does not oversubscribe cores.
+
+Usage:
+    python scripts/quick_search.py "funny birthday card" --backend sharded
+    python scripts/sharded_index.py benchmark --workers 1 2 4 8
+"""
+import os
+import json
+import time
+import atexit
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_index import CardIndex, INDEX_DIRECTORY, normalize_rows, select_top_k, sample_queries
+
+# Configuration
+DEFAULT_WORKERS = os.cpu_count() or 1
+SINGLE_THREAD_ENV = {'OMP_NUM_THREADS': '1', 'OPENBLAS_NUM_THREADS': '1', 'MKL_NUM_THREADS': '1'}
+
+# Worker process state, set once by _init_worker
+_matrix: Optional[np.ndarray] = None
+_shared_block: Optional[shared_memory.SharedMemory] = None
+
+
+def _init_worker(embeddings_path: Optional[str], shm_name: Optional[str], shape: Tuple[int, int]):
+    """Attach the worker to the matrix without copying it."""
+    global _matrix, _shared_block
+    if embeddings_path:
+        _matrix = np.load(embeddings_path, mmap_mode='r')
+    else:
+        _shared_block = shared_memory.SharedMemory(name=shm_name)
+        _matrix = np.ndarray(shape, dtype=np.float32, buffer=_shared_block.buf)
+
+
+def _search_shard(task: Tuple[int, int, np.ndarray, int, Optional[np.ndarray]]) -> List[List[Tuple[int, float]]]:
+    """Local top-k of rows [start, end) for each query (queries are unit rows)."""
+    start, end, queries, top_k, rows = task
+    if rows is None:
+        scores = queries @ np.asarray(_matrix[start:end]).T
+        row_ids = np.arange(start, end)
+    else:
+        scores = queries @ np.asarray(_matrix[rows]).T
+        row_ids = rows
+    results = []
+    for row_scores in scores:
+        ids = select_top_k(row_scores, top_k)
+        results.append([(int(row_ids[i]), float(row_scores[i])) for i in ids])
+    return results
+
+
+class ShardedIndex:
+    """Process-pool exact search over a CardIndex, one contiguous shard per worker."""
+
+    def __init__(self, index: CardIndex, workers: int = DEFAULT_WORKERS):
+        self.index = index
+        self.workers = max(1, min(workers, len(index) or 1))
+        bounds = np.linspace(0, len(index), self.workers + 1).astype(np.int64)
+        self.shards = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        embeddings_path = None
+        self._shared_block = None
+        if index.embeddings_path is not None and isinstance(index.embeddings, np.memmap):
+            embeddings_path = str(index.embeddings_path)
+        else:
+            self._shared_block = shared_memory.SharedMemory(create=True, size=max(index.embeddings.nbytes, 1))
+            shared = np.ndarray(index.embeddings.shape, dtype=np.float32, buffer=self._shared_block.buf)
+            shared[:] = index.embeddings
+
+        # Spawned workers read the BLAS thread settings from the environment at startup
+        saved_env = {key: os.environ.get(key) for key in SINGLE_THREAD_ENV}
+        os.environ.update(SINGLE_THREAD_ENV)
+        try:
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(
+                self.workers, initializer=_init_worker,
+                initargs=(embeddings_path, self._shared_block.name if self._shared_block else None,
+                          index.embeddings.shape))
+        finally:
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        atexit.register(self.close)
+
+    def _tasks(self, queries: np.ndarray, top_k: int, rows: Optional[np.ndarray]) -> List[Tuple]:
+        if rows is None:
+            return [(start, end, queries, top_k, None) for start, end in self.shards]
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        tasks = []
+        for start, end in self.shards:
+            shard_rows = rows[(rows >= start) & (rows < end)]
+            if len(shard_rows):
+                tasks.append((start, end, queries, top_k, shard_rows))
+        return tasks
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                     rows: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """Exact search for many queries; every shard scores all of them in one product."""
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        if len(self.index) == 0 or len(queries) == 0:
+            return [[] for _ in queries]
+
+        merged: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        for shard_results in self.pool.map(_search_shard, self._tasks(queries, top_k, rows)):
+            for i, local_top in enumerate(shard_results):
+                merged[i].extend(local_top)
+
+        results = []
+        for query, candidates in zip(queries, merged):
+            if not query.any():
+                results.append([])
+                continue
+            candidates.sort(key=lambda item: item[1], reverse=True)
+            results.append(candidates[:top_k])
+        return results
+
+    def search(self, query_embedding: List[float], top_k: int = 5,
+               rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Exact cosine search with the same results as CardIndex.search."""
+        return self.search_batch([query_embedding], top_k, rows)[0]
+
+    def close(self):
+        atexit.unregister(self.close)
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        if self._shared_block is not None:
+            self._shared_block.close()
+            self._shared_block.unlink()
+            self._shared_block = None
+
+
+def benchmark(index: CardIndex, worker_counts: List[int], top_k: int = 10, num_queries: int = 100) -> Dict:
+    """Mean latency of single-process exact search vs the sharded pool at each worker count."""
+    queries = sample_queries(index, num_queries)
+
+    def mean_latency_ms(search) -> float:
+        start = time.perf_counter()
+        for query in queries:
+            search(query)
+        return round((time.perf_counter() - start) * 1000 / max(len(queries), 1), 3)
+
+    report = {'cards': len(index), 'top_k': top_k, 'exact_ms': mean_latency_ms(lambda q: index.search(q, top_k)),
+              'sharded': []}
+    for workers in worker_counts:
+        sharded = ShardedIndex(index, workers)
+        try:
+            sharded.search(queries[0], top_k)  # Warm up the workers
+            identical = all([r for r, _ in sharded.search(q, top_k)] == [r for r, _ in index.search(q, top_k)]
+                            for q in queries[:20])
+            report['sharded'].append({'workers': sharded.workers,
+                                      'latency_ms': mean_latency_ms(lambda q: sharded.search(q, top_k)),
+                                      'identical_results': identical})
+        finally:
+            sharded.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded multi-process exact search")
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[DEFAULT_WORKERS], help='Worker counts to compare')
+    parser.add_argument('--top-k', type=int, default=10, help='Results per query')
+    parser.add_argument('--queries', type=int, default=100, help='Number of sampled queries')
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+    print(json.dumps(benchmark(index, args.workers, args.top_k, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+"More Like This" Card Search
+Finds cards similar to a card the customer is looking at, using that card's
+stored embedding as the query - no embedding API call.
+
+Every card's top NEIGHBORS neighbours are precomputed (blockwise matrix
+products over the index) and saved as neighbors.npz next to the search
+index, so a lookup is a row read. Requests the cache cannot answer (more
+results than cached, or filters) fall back to an exact search with the
+card's embedding.
+
+A card is given as "folder/filename" or as its sw_templates slug
+(e.g. "birthdayfloral-card-1", see update_sw_templates.py).
+
+Usage:
+    python scripts/similar_cards.py build
+    python scripts/similar_cards.py similar BirthdayFloral/card_1.png --top-k 5
+    python scripts/similar_cards.py similar birthdayfloral-card-1 --occasion birthday
+"""
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from card_index import CardIndex, INDEX_DIRECTORY, rank_cards, older_than_embeddings
+from facet_index import FacetIndex, add_filter_arguments, filters_from_args
+
+# Configuration
+NEIGHBORS_FILE = "neighbors.npz"
+NEIGHBORS = 50  # Cached neighbours per card
+BUILD_BLOCK_SIZE = 256  # Cards scored per matrix product while building
+
+
+def template_slug(folder: str, filename: str) -> str:
+    """The sw_templates slug of a card (same rule as update_sw_templates.create_slug)."""
+    slug = Path(filename).stem.lower().replace('_', '-').replace(' ', '-')
+    slug = ''.join(c for c in slug if c.isalnum() or c == '-')
+    while '--' in slug:
+        slug = slug.replace('--', '-')
+    return f"{folder.lower().replace(' ', '-')}-{slug.strip('-')}"
+
+
+class NeighborIndex:
+    """Top-NEIGHBORS (row, score) lists for every card, plus card id lookups."""
+
+    def __init__(self, index: CardIndex, rows: np.ndarray, scores: np.ndarray):
+        self.index = index
+        self.rows = rows      # int32 (N, depth), best first
+        self.scores = scores  # float32 (N, depth)
+        self._row_of: Optional[Dict[str, int]] = None
+
+    @property
+    def depth(self) -> int:
+        return self.rows.shape[1]
+
+    @classmethod
+    def build(cls, index: CardIndex, depth: int = NEIGHBORS, block_size: int = BUILD_BLOCK_SIZE) -> 'NeighborIndex':
+        """Exact top-depth neighbours of every card, one block of cards per matrix product."""
+        depth = max(0, min(depth, len(index) - 1))
+        rows = np.zeros((len(index), depth), dtype=np.int32)
+        scores = np.zeros((len(index), depth), dtype=np.float32)
+        if depth == 0:
+            return cls(index, rows, scores)
+
+        matrix = np.asarray(index.embeddings, dtype=np.float32)
+        for start in range(0, len(index), block_size):
+            block_scores = matrix[start:start + block_size] @ matrix.T
+            block = np.arange(start, start + len(block_scores))
+            block_scores[block - start, block] = -np.inf  # A card is not its own neighbour
+            top = np.argpartition(-block_scores, depth - 1, axis=1)[:, :depth]
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            rows[block] = np.take_along_axis(top, order, axis=1)
+            scores[block] = np.take_along_axis(top_scores, order, axis=1)
+        return cls(index, rows, scores)
+
+    def lookup(self, row: int, k: int) -> List[Tuple[int, float]]:
+        """Cached best k neighbours of row (k <= depth)."""
+        return [(int(r), float(s)) for r, s in zip(self.rows[row, :k], self.scores[row, :k])]
+
+    def row_of(self, card: str) -> Optional[int]:
+        """Row of a card given as "folder/filename" or template slug, or None if unknown."""
+        if self._row_of is None:
+            self._row_of = {}
+            for row, (folder, filename) in enumerate(self.index.cards):
+                self._row_of[f"{folder}/{filename}".lower()] = row
+                self._row_of.setdefault(template_slug(folder, filename), row)
+        return self._row_of.get(card.strip().replace('\\', '/').lower())
+
+    def save(self, index_directory: str = INDEX_DIRECTORY):
+        path = Path(index_directory) / NEIGHBORS_FILE
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, rows=self.rows, scores=self.scores, fingerprint=self.index.fingerprint())
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> Optional['NeighborIndex']:
+        """
+        Load the saved neighbour lists, or None if missing, built for a
+        different catalog, or older than the index's embeddings.
+        """
+        path = Path(index_directory) / NEIGHBORS_FILE
+        if not path.exists() or older_than_embeddings(path, index):
+            return None
+        with np.load(path) as data:
+            if str(data['fingerprint']) != index.fingerprint():
+                return None
+            return cls(index, data['rows'], data['scores'])
+
+    @classmethod
+    def open(cls, index: CardIndex, index_directory: str = INDEX_DIRECTORY) -> 'NeighborIndex':
+        """Load the neighbour lists, building and saving them when missing or stale."""
+        neighbors = cls.load(index, index_directory)
+        if neighbors is None:
+            print("🔄 Precomputing similar cards...")
+            neighbors = cls.build(index)
+            neighbors.save(index_directory)
+        return neighbors
+
+
+def neighbor_ranker(index: CardIndex, row: int, neighbors: Optional[NeighborIndex] = None) -> Callable:
+    """
+    rank(k, rows) for card_index.rank_cards(): the cards closest to row,
+    excluding row itself. Served from the neighbour cache when it holds
+    enough neighbours and no row subset is given.
+    """
+    query = np.asarray(index.embeddings[row], dtype=np.float32)
+
+    def rank(k: int, rows: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        if neighbors is not None and rows is None and k <= neighbors.depth:
+            return neighbors.lookup(row, k)
+        top = index.search(query, k + 1, rows)
+        return [(r, score) for r, score in top if r != row][:k]
+    return rank
+
+
+def similar_cards(index: CardIndex, card: str, top_k: int = 5, neighbors: Optional[NeighborIndex] = None,
+                  filters: Optional[Dict[str, str]] = None,
+                  facets: Optional[FacetIndex] = None) -> Optional[List[Tuple[Dict, float]]]:
+    """
+    Cards most similar to card, as (card details, score) tuples.
+
+    Args:
+        index: Card search index
+        card: "folder/filename" or template slug of the card being viewed
+        top_k: Number of results to return
+        neighbors: Precomputed neighbour lists (built in memory when not given)
+        filters: Optional metadata filters (see card_index.FILTER_FIELDS)
+        facets: Optional facet index used to apply filters before scoring
+
+    Returns:
+        Result tuples, or None if card is not in the index
+    """
+    neighbors = neighbors or NeighborIndex.build(index)
+    row = neighbors.row_of(card)
+    if row is None:
+        return None
+    return rank_cards(index, neighbor_ranker(index, row, neighbors), top_k, filters, facets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find cards similar to a given card (no API calls)")
+    parser.add_argument('command', choices=['build', 'similar'])
+    parser.add_argument('card', nargs='?', help='"folder/filename" or template slug')
+    parser.add_argument('--index-dir', default=INDEX_DIRECTORY, help='Search index folder (see card_index.py)')
+    parser.add_argument('--top-k', type=int, default=5, help='Number of results')
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    if not CardIndex.exists(args.index_dir):
+        print(f"❌ No search index in {args.index_dir}. Run 'python scripts/card_index.py build' first.")
+        return
+    index = CardIndex.load(args.index_dir)
+
+    if args.command == 'build':
+        neighbors = NeighborIndex.build(index)
+        neighbors.save(args.index_dir)
+        print(f"✅ Cached {neighbors.depth} similar cards for each of {len(index)} cards")
+        return
+
+    if not args.card:
+        print("❌ Please give a card as folder/filename or template slug.")
+        return
+    filters = filters_from_args(args)
+    facets = FacetIndex.open(index, args.index_dir) if filters else None
+    results = similar_cards(index, args.card, args.top_k, NeighborIndex.open(index, args.index_dir), filters, facets)
+    if results is None:
+        print(f"❌ Card not found: {args.card}")
+        return
+    for rank, (card, score) in enumerate(results, 1):
+        print(f"#{rank} - Similarity: {score:.4f}  {card['folder']}/{card['filename']}  {card['title']}")
+    if not results:
+        print("No results found.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Tests for query_cache.py: the search server shares one QueryEmbeddingCache
+between its request threads, so a query cached on one thread must be a hit
+on another.
+
+Usage:
+    python scripts/test_query_cache.py
+"""
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from query_cache import QueryEmbeddingCache
+
+MODEL = "models/embedding-001"
+
+
+class QueryCacheThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = QueryEmbeddingCache(str(Path(self.directory.name) / "query_cache.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def run_in_thread(self, target):
+        errors = []
+
+        def run():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(errors, [])
+
+    def test_hit_from_another_thread(self):
+        self.cache.put("Funny Birthday", MODEL, [0.5, 0.25])
+        found = []
+        self.run_in_thread(lambda: found.append(self.cache.get("funny  birthday", MODEL)))
+        self.assertEqual(found, [[0.5, 0.25]])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_concurrent_get_and_put(self):
+        wrong = []
+
+        def worker(n: int):
+            for i in range(50):
+                self.cache.put(f"query {n} {i}", MODEL, [float(n), float(i)])
+                if self.cache.get(f"query {n} {i}", MODEL) != [float(n), float(i)]:
+                    wrong.append((n, i))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(wrong, [])
+        self.assertEqual(self.cache.hits, 200)
+        self.assertEqual(self.cache.stats()['entries'], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,6 +16,8 @@ from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from embedding_sidecar import EmbeddingSidecar, card_embedding
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -162,6 +164,10 @@ def process_category(folder_name: str, dry_run: bool = False):
     metadata_map = {item['filename']: item for item in metadata_list}
     insidenote_map = {item['filename']: item for item in insidenote_list}
     
+    # Embeddings from the folder's binary sidecar when it has one (see embedding_sidecar.py)
+    sidecar = EmbeddingSidecar.load(folder_path)
+    sidecar_vectors = sidecar.as_dict() if sidecar else {}
+    
     logger.info(f"\n{'='*80}")
     logger.info("Card Details:")
     logger.info(f"{'='*80}")
@@ -260,7 +266,7 @@ def process_category(folder_name: str, dry_run: bool = False):
                 'image_4': BLANK_LOGO_IMAGE,
                 'message': insidenote.get('inside_note', ''),
                 'search_keywords': metadata.get('keywords', []),
-                'embedding_vector': insidenote.get('embedding', []),  # Supabase will convert list to vector type
+                'embedding_vector': card_embedding(filename, insidenote, sidecar_vectors),  # Supabase will convert list to vector type
                 'embedding_updated_at': datetime.utcnow().isoformat(),
             }
             
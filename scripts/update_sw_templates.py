@@ -20,6 +20,8 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from supabase import create_client, Client
 
+from embedding_sidecar import EmbeddingSidecar, card_embedding
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -217,6 +219,10 @@ def process_card_folder(folder_path: Path, folder_name: str, supabase: Client,
         metadata_map = {item['filename']: item for item in metadata_list}
         insidenote_map = {item['filename']: item for item in insidenote_list}
         
+        # Embeddings from the folder's binary sidecar when it has one (see embedding_sidecar.py)
+        sidecar = EmbeddingSidecar.load(folder_path)
+        sidecar_vectors = sidecar.as_dict() if sidecar else {}
+        
         # Prepare records for upsert
         records = []
         successful = 0
@@ -258,7 +264,7 @@ def process_card_folder(folder_path: Path, folder_name: str, supabase: Client,
                     'image_4': BLANK_LOGO_IMAGE,
                     'message': insidenote.get('inside_note', ''),
                     'search_keywords': metadata.get('keywords', []),
-                    'embedding_vector': insidenote.get('embedding', []),
+                    'embedding_vector': card_embedding(filename, insidenote, sidecar_vectors),
                     'embedding_updated_at': datetime.utcnow().isoformat(),
                 }
                 
@@ -1,42 +1,72 @@
 """
 Quick script to verify embeddings were added successfully.
+The file is streamed (see insidenote_stream.py), so the embeddings are read
+as float32 arrays instead of millions of Python floats. When the folder has
+an embeddings.bin sidecar (see embedding_sidecar.py), embeddings are taken
+from it instead.
 """
-import json
+import sys
 from pathlib import Path
 
+from insidenote_stream import iter_cards
+from embedding_sidecar import SIDECAR_FILE, EmbeddingSidecar
+
 # Check a sample file
 sample_file = Path(r"C:\Users\makar\OneDrive\OLD\E-Learning\projects\SmartWish\Designs\Series1_original\Series\BirthdayFloral\insidenote.json")
 
-with open(sample_file, 'r', encoding='utf-8') as f:
-    data = json.load(f)
+if len(sys.argv) > 1:
+    sample_file = Path(sys.argv[1])
+
+sidecar = EmbeddingSidecar.load(sample_file.parent)
+sidecar_vectors = sidecar.as_dict() if sidecar else {}
+
+# Keep the first card; only count the rest
+first_card, first_embedding = None, None
+total_cards = 0
+cards_with_embeddings = 0
+for card, embedding in iter_cards(sample_file, embeddings=sidecar is None):
+    if sidecar is not None:
+        embedding = sidecar_vectors.get(card.get('filename'))
+    if first_card is None:
+        first_card, first_embedding = card, embedding
+    total_cards += 1
+    if embedding is not None and len(embedding) > 0:
+        cards_with_embeddings += 1
 
 print("=" * 70)
 print("EMBEDDING VERIFICATION")
 print("=" * 70)
 print(f"\nFile: {sample_file.name}")
-print(f"Total cards in file: {len(data)}")
+print(f"Total cards in file: {total_cards}")
+if sidecar is not None:
+    print(f"Embeddings from: {SIDECAR_FILE} ({len(sidecar)} x {sidecar.dimension} "
+          f"{sidecar.embeddings.dtype}, model {sidecar.model})")
+
+if total_cards == 0:
+    print("\n❌ No cards found in file")
+    sys.exit(1)
 
 # Check first card
-card = data[0]
+card = first_card
+has_embedding = first_embedding is not None
 print(f"\n--- Sample Card ---")
 print(f"Filename: {card['filename']}")
 print(f"Inside Note: {card['inside_note'][:80]}...")
 print(f"\nEmbedding Stats:")
-print(f"  - Has embedding: {'embedding' in card}")
-print(f"  - Embedding length: {len(card['embedding']) if 'embedding' in card else 0}")
-print(f"  - First 5 values: {card['embedding'][:5] if 'embedding' in card else 'N/A'}")
-print(f"  - Data type: {type(card['embedding'][0]) if 'embedding' in card else 'N/A'}")
+print(f"  - Has embedding: {has_embedding}")
+print(f"  - Embedding length: {len(first_embedding) if has_embedding else 0}")
+print(f"  - First 5 values: {first_embedding[:5].tolist() if has_embedding else 'N/A'}")
+print(f"  - Data type: {first_embedding.dtype if has_embedding else 'N/A'}")
 
 # Count cards with embeddings
-cards_with_embeddings = sum(1 for c in data if 'embedding' in c and len(c.get('embedding', [])) > 0)
 print(f"\n--- Summary ---")
-print(f"Cards with embeddings: {cards_with_embeddings}/{len(data)}")
-print(f"Success rate: {cards_with_embeddings/len(data)*100:.1f}%")
+print(f"Cards with embeddings: {cards_with_embeddings}/{total_cards}")
+print(f"Success rate: {cards_with_embeddings/total_cards*100:.1f}%")
 
-if cards_with_embeddings == len(data):
+if cards_with_embeddings == total_cards:
     print("\n✅ ALL EMBEDDINGS PRESENT!")
 else:
-    print(f"\n⚠️  Missing embeddings: {len(data) - cards_with_embeddings}")
+    print(f"\n⚠️  Missing embeddings: {total_cards - cards_with_embeddings}")
 
 print("=" * 70)
 
@@ -18,6 +18,8 @@ import logging
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+from embedding_sidecar import EmbeddingSidecar, card_embedding
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -217,7 +219,8 @@ def check_database_tables() -> Tuple[bool, Dict]:
 
 def check_embeddings(folders: List[str]) -> Tuple[int, int]:
     """
-    Check if embeddings exist in insidenote.json files.
+    Check that every card has an embedding, in its folder's embeddings.bin
+    sidecar or in insidenote.json.
     
     Args:
         folders: List of folder names to check
@@ -238,6 +241,8 @@ def check_embeddings(folders: List[str]) -> Tuple[int, int]:
             continue
         
         try:
+            sidecar = EmbeddingSidecar.load(folder_path)
+            sidecar_vectors = sidecar.as_dict() if sidecar else {}
             with open(insidenote_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if isinstance(data, dict) and 'cards' in data:
@@ -248,7 +253,7 @@ def check_embeddings(folders: List[str]) -> Tuple[int, int]:
                     cards = [data]
                 
                 for card in cards:
-                    if 'embedding' in card and card['embedding']:
+                    if card_embedding(card.get('filename'), card, sidecar_vectors):
                         with_embeddings += 1
                     else:
                         without_embeddings += 1